@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Script to prepare an existing database for background geocoding: adds the
+geocoding_status column to users and waste_listings and creates the
+geocoding_jobs table.
+
+create_all only creates missing tables, so run this once on databases
+created before background geocoding was added. Works on SQLite and MySQL;
+existing columns and tables are skipped.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from database import engine
+import models
+
+TABLES = ["users", "waste_listings"]
+
+def add_geocoding_columns():
+    """Add the geocoding_status columns and the geocoding_jobs table"""
+    inspector = inspect(engine)
+    with engine.connect() as connection:
+        for table in TABLES:
+            columns = {column["name"] for column in inspector.get_columns(table)}
+            if "geocoding_status" in columns:
+                print(f"{table}.geocoding_status already exists")
+                continue
+            try:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN geocoding_status VARCHAR(20)"))
+                connection.commit()
+                print(f"Added {table}.geocoding_status")
+            except Exception as e:
+                print(f"Error adding {table}.geocoding_status: {e}")
+                connection.rollback()
+    models.Base.metadata.create_all(bind=engine, tables=[models.GeocodingJob.__table__])
+    print("geocoding_jobs table is ready")
+
+if __name__ == "__main__":
+    print("Adding background geocoding columns...")
+    add_geocoding_columns()
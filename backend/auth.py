@@ -4,28 +4,61 @@ from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from crud import pwd_context
 # Import models and schemas first
 import schemas, models
 import crud
 from database import get_db
+from services import passwords, principals
+from services.revocation import revocation_index, user_key
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = crud.ACCESS_TOKEN_EXPIRE_MINUTES
+# Trust the id and role signed into access tokens instead of loading the
+# user on every request. Deactivated users are rejected through the
+# revocation index, in other worker processes after its next reload.
+AUTH_CLAIMS_PRINCIPAL = os.getenv("AUTH_CLAIMS_PRINCIPAL", "false").lower() in ("1", "true", "yes")
+
+# Comma-separated emails of operators, who can run bulk assignments
+OPERATOR_EMAILS = {email.strip().lower() for email in os.getenv("OPERATOR_EMAILS", "").split(",") if email.strip()}
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def authenticate_user(db: Session, email: str, password: str):
     user = crud.get_user_by_email(db, email=email)
-    if not user:
+    if not user or user.is_active is False:
         return False
-    if not pwd_context.verify(password, user.hashed_password):
+    verified, new_hash = passwords.verify_and_update_password(password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash:
+        # Hashed with an outdated scheme or cost; upgraded transparently
+        crud.update_password_hash(db, user.id, new_hash)
+    return user
+
+async def authenticate_user_async(db: Session, email: str, password: str):
+    """
+    Same as authenticate_user, for async endpoints: the password is checked
+    on the hashing threads while the event loop serves other requests.
+    """
+    user = crud.get_user_by_email(db, email=email)
+    if not user or user.is_active is False:
+        return False
+    # Give the connection back to the pool while the hash is checked, so a
+    # burst of logins cannot hold every connection. The user's loaded
+    # columns stay readable after the session is closed.
+    db.close()
+    verified, new_hash = await passwords.verify_and_update_password_async(password, user.hashed_password)
+    if not verified:
+        return False
+    if new_hash:
+        crud.update_password_hash(db, user.id, new_hash)
+        user.hashed_password = new_hash
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -34,7 +67,8 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # The jti claim identifies the token when it is revoked at logout
+    to_encode.update({"exp": expire, "jti": to_encode.get("jti") or uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -53,9 +87,38 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
         token_data = schemas.TokenData(email=email, role=role)
     except JWTError:
         raise credentials_exception
-    user = crud.get_user_by_email(db, email=token_data.email)
-    if user is None:
+    # In-memory check; revocations are loaded in the background
+    if revocation_index.is_revoked(payload.get("jti")):
+        raise credentials_exception
+    if AUTH_CLAIMS_PRINCIPAL and payload.get("uid") is not None:
+        # The claims can't say whether the user was deactivated since
+        if revocation_index.is_revoked(user_key(payload["uid"])):
+            raise credentials_exception
+        return principals.ClaimsPrincipal(payload, db)
+    # Served from the principal cache; invalidated when the user changes
+    user = principals.get_principal(db, token_data.email)
+    if user is None or user.is_active is False:
         raise credentials_exception
     # Add the role to the user object
-    user.role = token_data.role
-    return user
+    return user.model_copy(update={"role": token_data.role})
+
+def get_current_operator(current_user: schemas.User = Depends(get_current_user)):
+    if (current_user.email or "").lower() not in OPERATOR_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only operators can access this")
+    return current_user
+
+def revoke_access_token(db: Session, token: str) -> bool:
+    """
+    Revoke an access token until it expires, e.g. at logout.
+
+    Returns:
+        False if the token is invalid or has no jti claim
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    if not payload.get("jti") or payload.get("exp") is None:
+        return False
+    crud.revoke_access_token(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+    return True
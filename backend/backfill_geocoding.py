@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Script to geocode users and waste listings that have an address but no
+coordinates.
+
+Such rows are left behind when geocoding failed or OPENCAGE_API_KEY was
+missing, and matching then falls back to comparing city names. Rows are
+read in id order in chunks; the distinct addresses of a chunk are geocoded
+concurrently and the chunk is written back in one bulk update. Progress is
+saved to a checkpoint file after every chunk, so an interrupted run
+continues where it stopped when started again. While the geocoding
+circuit breaker is open the run pauses, and the rows it refused are
+retried instead of being marked failed.
+
+With --components, rows that have coordinates but no city are reverse
+geocoded instead; points in the same ~100 m grid cell share one lookup.
+
+Usage:
+    python backfill_geocoding.py [--entity users|waste_listings|all]
+        [--chunk-size 200] [--workers 4] [--checkpoint FILE] [--restart] [--components]
+"""
+
+import argparse
+import json
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import sessionmaker
+import models
+from services import geocode_cache, geocoding, location, recommendations
+
+ENTITIES = {
+    "users": (models.User, "location"),
+    "waste_listings": (models.WasteListing, "pickup_location"),
+}
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backfill_geocoding.checkpoint.json")
+# Shortest pause while the geocoding circuit breaker is open
+CIRCUIT_PAUSE_SECONDS = 1.0
+
+def _missing_coordinates(model, include_pending: bool):
+    conditions = [
+        model.address != None,
+        model.address != "",
+        or_(model.latitude == None, model.longitude == None),
+    ]
+    if not include_pending:
+        # The geocoding queue already has a job for these
+        conditions.append(or_(model.geocoding_status == None, model.geocoding_status != "pending"))
+    return conditions
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """Write the checkpoint atomically so a crash never leaves half a file"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temporary, path)
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def _missing_components(model):
+    return [
+        model.latitude != None,
+        model.longitude != None,
+        or_(model.city == None, model.city == ""),
+    ]
+
+def _lookup(session_factory, lookup, *args):
+    db = session_factory()
+    try:
+        return lookup(db, *args)
+    except Exception as e:
+        print(f"Error geocoding {args!r}: {e}")
+        return None
+    finally:
+        db.close()
+
+def _coordinate_updates(rows, results, location_column):
+    mappings = []
+    located = []
+    for row_id, address, current_location in rows:
+        entry = results[geocode_cache.address_key(address)]
+        if entry is None:
+            mappings.append({"id": row_id, "geocoding_status": "failed"})
+            continue
+        mapping = {"id": row_id, "latitude": entry["latitude"], "longitude": entry["longitude"],
+                   "city": entry.get("city"), "state": entry.get("state"),
+                   "country": entry.get("country"), "geocoding_status": "done"}
+        if not current_location:
+            mapping[location_column] = entry.get("formatted") or address
+        mappings.append(mapping)
+        located.append((row_id, entry["latitude"], entry["longitude"]))
+    return mappings, located
+
+def _component_updates(rows, results):
+    mappings = []
+    for row_id, latitude, longitude, state, country in rows:
+        entry = results[geocode_cache.grid_key(latitude, longitude)]
+        if entry and entry.get("city"):
+            mappings.append({"id": row_id, "city": entry["city"], "state": state or entry.get("state"),
+                             "country": country or entry.get("country")})
+    return mappings
+
+def _mark_stale(db, model, located):
+    if model is models.WasteListing:
+        recommendations.mark_candidates_stale(db, waste_listing_ids=[row[0] for row in located])
+        return
+    # Listings near newly located composters get rescored; the server's
+    # composter index picks them up on its next refresh
+    composters = {user_id for user_id, in db.query(models.User.id).filter(
+        models.User.id.in_([row[0] for row in located]),
+        models.User.role == models.Role.composter
+    ).all()}
+    positions = [(lat, lng) for row_id, lat, lng in located if row_id in composters]
+    if positions:
+        recommendations.mark_candidates_stale(db, positions=positions)
+
+def _pause(name: str, progress: dict):
+    # Wait for the circuit breaker to let a probe through
+    wait = max(geocoding.circuit_retry_after(), CIRCUIT_PAUSE_SECONDS)
+    print(f"{name}: geocoding provider unavailable, pausing {wait:.0f}s after id {progress['last_id']}")
+    time.sleep(wait)
+
+def backfill_entity(session_factory, entity: str, checkpoint: dict, checkpoint_path: str = None,
+                    chunk_size: int = 200, workers: int = 4, include_pending: bool = False,
+                    executor: ThreadPoolExecutor = None, components: bool = False) -> dict:
+    """
+    Geocode every row of one table that has an address but no coordinates,
+    or with components=True, reverse geocode every row that has
+    coordinates but no city.
+
+    Args:
+        session_factory: Callable returning a new database session
+        entity: "users" or "waste_listings"
+        checkpoint: Progress of earlier runs, updated in place
+        checkpoint_path: File the checkpoint is saved to after each chunk
+        chunk_size: Rows read and updated per chunk
+        workers: Addresses geocoded at the same time
+        include_pending: Also geocode rows the geocoding queue has a job for
+        components: Fill in city, state and country instead of coordinates
+
+    Returns:
+        The entity's checkpoint entry
+    """
+    model, location_column = ENTITIES[entity]
+    name = f"{entity}:components" if components else entity
+    progress = checkpoint.setdefault(name, {"last_id": 0, "processed": 0, "geocoded": 0, "failed": 0})
+    if components:
+        conditions = _missing_components(model)
+        columns = (model.id, model.latitude, model.longitude, model.state, model.country)
+    else:
+        conditions = _missing_coordinates(model, include_pending)
+        columns = (model.id, model.address, getattr(model, location_column))
+    db = session_factory()
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill")
+    try:
+        remaining = db.query(func.count(model.id)).filter(model.id > progress["last_id"], *conditions).scalar()
+        print(f"{name}: {remaining} rows to geocode (after id {progress['last_id']})")
+        started = time.perf_counter()
+        done = 0
+        while True:
+            # Keyset pagination: each chunk starts after the last id written
+            rows = db.query(*columns).filter(
+                model.id > progress["last_id"], *conditions
+            ).order_by(model.id).limit(chunk_size).all()
+            if not rows:
+                break
+
+            # Rows at the same address, or in the same reverse geocoding
+            # grid cell, share one lookup
+            lookups = {}
+            row_keys = []
+            for row in rows:
+                if components:
+                    key = geocode_cache.grid_key(row[1], row[2])
+                    lookups.setdefault(key, (location.reverse_geocode_location, row[1], row[2]))
+                else:
+                    key = geocode_cache.address_key(row[1])
+                    lookups.setdefault(key, (location.geocode_address, row[1]))
+                row_keys.append(key)
+            keys = list(lookups)
+            results = dict(zip(keys, executor.map(lambda key: _lookup(session_factory, *lookups[key]), keys)))
+
+            paused = False
+            if geocoding.circuit_open():
+                # Lookups refused by the open circuit are not failures: keep
+                # the rows before the first of them and retry the rest
+                refused = next((i for i, key in enumerate(row_keys) if results[key] is None), None)
+                if refused is not None:
+                    rows = rows[:refused]
+                    paused = True
+            if not rows:
+                _pause(name, progress)
+                continue
+
+            if components:
+                mappings = _component_updates(rows, results)
+                updated = len(mappings)
+            else:
+                mappings, located = _coordinate_updates(rows, results, location_column)
+                updated = len(located)
+            db.bulk_update_mappings(model, mappings)
+            db.commit()
+            if not components and located:
+                _mark_stale(db, model, located)
+
+            progress["last_id"] = rows[-1][0]
+            progress["processed"] += len(rows)
+            progress["geocoded"] += updated
+            progress["failed"] += len(rows) - updated
+            progress["updated_at"] = datetime.utcnow().isoformat()
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, checkpoint)
+
+            done += len(rows)
+            elapsed = time.perf_counter() - started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            left = max(remaining - done, 0)
+            eta = _format_seconds(left / rate) if rate else "?"
+            print(f"{name}: {done}/{remaining} rows, {len(keys)} lookups in this chunk, "
+                  f"{rate:.1f} rows/s, ETA {eta} (up to id {progress['last_id']})")
+            if paused:
+                _pause(name, progress)
+        progress["completed"] = True
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, checkpoint)
+        return progress
+    finally:
+        if own_executor:
+            executor.shutdown()
+        db.close()
+
+def backfill_geocoding(entities, chunk_size: int = 200, workers: int = 4,
+                       checkpoint_path: str = DEFAULT_CHECKPOINT, restart: bool = False,
+                       include_pending: bool = False, bind=None, components: bool = False) -> dict:
+    """Backfill coordinates (or city/state/country) for the given tables, resuming from the checkpoint"""
+    if bind is None:
+        from database import engine as bind
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+    checkpoint = {} if restart else load_checkpoint(checkpoint_path)
+    names = [f"{entity}:components" if components else entity for entity in entities]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as executor:
+        for entity, name in zip(entities, names):
+            if checkpoint.get(name, {}).get("completed") and not restart:
+                # A finished pass is rerun from the start: rows may have lost
+                # their coordinates since
+                checkpoint[name] = {"last_id": 0, "processed": 0, "geocoded": 0, "failed": 0}
+            backfill_entity(session_factory, entity, checkpoint, checkpoint_path, chunk_size, workers,
+                            include_pending, executor, components)
+    for name in names:
+        progress = checkpoint[name]
+        print(f"{name}: geocoded {progress['geocoded']} of {progress['processed']} rows, "
+              f"{progress['failed']} failed")
+    if components:
+        print(f"Reverse geocode cache: {geocode_cache.stats()['reverse']['hit_rate']:.1%} hit rate")
+    return checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description="Geocode rows that have an address but no coordinates")
+    parser.add_argument("--entity", choices=["users", "waste_listings", "all"], default="all")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Rows read and updated per chunk")
+    parser.add_argument("--workers", type=int, default=4, help="Addresses geocoded at the same time")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Progress file")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    parser.add_argument("--include-pending", action="store_true",
+                        help="Also geocode rows waiting in the geocoding queue")
+    parser.add_argument("--components", action="store_true",
+                        help="Reverse geocode rows that have coordinates but no city")
+    args = parser.parse_args()
+    entities = list(ENTITIES) if args.entity == "all" else [args.entity]
+    print("Backfilling missing coordinates...")
+    backfill_geocoding(entities, args.chunk_size, args.workers, args.checkpoint, args.restart,
+                       args.include_pending, components=args.components)
+
+if __name__ == "__main__":
+    main()
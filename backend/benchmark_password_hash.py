@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Script to measure password hashing cost on this host.
+
+Times hashing and verifying a password for each scheme and cost factor,
+and suggests the highest cost whose verify time stays within the login
+budget. Every login pays one verify, so the verify time is the CPU cost
+per login and 1000 / verify_ms the logins per second one core sustains.
+Apply the result with PASSWORD_HASH_SCHEME and PASSWORD_HASH_ROUNDS;
+existing hashes are upgraded as users log in.
+
+Usage:
+    python benchmark_password_hash.py [--schemes bcrypt,pbkdf2_sha256,scrypt]
+        [--rounds bcrypt=10,11,12,13] [--samples 5] [--target-ms 250] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from passlib.exc import MissingBackendError
+from services.passwords import PASSWORD_HASH_ROUNDS, PASSWORD_HASH_SCHEME, build_context
+
+# Cost factors tried when --rounds does not name the scheme
+DEFAULT_ROUNDS = {
+    "bcrypt": [10, 11, 12, 13],
+    "bcrypt_sha256": [10, 11, 12, 13],
+    "pbkdf2_sha256": [29000, 100000, 300000, 600000],
+    "scrypt": [14, 15, 16, 17],
+    "argon2": [2, 3, 4],
+}
+PASSWORD = "correct horse battery staple"
+
+def measure(scheme: str, rounds: int, samples: int) -> dict:
+    """
+    Median and worst hash and verify times in milliseconds.
+    """
+    context = build_context(scheme, rounds)
+    hash_times, verify_times = [], []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hashed = context.hash(PASSWORD)
+        hash_times.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        assert context.verify(PASSWORD, hashed)
+        verify_times.append((time.perf_counter() - start) * 1000)
+    verify_ms = statistics.median(verify_times)
+    return {
+        "scheme": scheme,
+        "rounds": rounds,
+        "hash_ms": round(statistics.median(hash_times), 2),
+        "verify_ms": round(verify_ms, 2),
+        "verify_max_ms": round(max(verify_times), 2),
+        "logins_per_core_second": round(1000 / verify_ms, 1) if verify_ms else None,
+    }
+
+def run_benchmark(schemes, rounds_by_scheme, samples):
+    results = []
+    for scheme in schemes:
+        for rounds in rounds_by_scheme.get(scheme, DEFAULT_ROUNDS.get(scheme, [])):
+            try:
+                results.append(measure(scheme, rounds, samples))
+            except MissingBackendError as e:
+                results.append({"scheme": scheme, "rounds": rounds, "error": str(e)})
+                break
+            except (ValueError, KeyError) as e:
+                results.append({"scheme": scheme, "rounds": rounds, "error": str(e)})
+    return results
+
+def recommend(results, target_ms: float) -> dict:
+    """
+    Highest cost per scheme whose median verify time is within target_ms.
+    """
+    best = {}
+    for result in results:
+        if "error" in result or result["verify_ms"] > target_ms:
+            continue
+        current = best.get(result["scheme"])
+        if current is None or result["rounds"] > current["rounds"]:
+            best[result["scheme"]] = result
+    return best
+
+def parse_rounds(values):
+    rounds_by_scheme = {}
+    for value in values or []:
+        scheme, _, costs = value.partition("=")
+        rounds_by_scheme[scheme.strip()] = [int(cost) for cost in costs.split(",") if cost.strip()]
+    return rounds_by_scheme
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure password hash and verify time per scheme and cost")
+    parser.add_argument("--schemes", default="bcrypt,pbkdf2_sha256,scrypt",
+                        help="Comma-separated passlib schemes")
+    parser.add_argument("--rounds", action="append", metavar="SCHEME=R1,R2",
+                        help="Cost factors to try for a scheme (repeatable)")
+    parser.add_argument("--samples", type=int, default=5, help="Hashes timed per cost factor")
+    parser.add_argument("--target-ms", type=float, default=250, help="Login budget for one verify")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    schemes = [scheme.strip() for scheme in args.schemes.split(",") if scheme.strip()]
+    results = run_benchmark(schemes, parse_rounds(args.rounds), args.samples)
+    best = recommend(results, args.target_ms)
+    if args.json:
+        print(json.dumps({"results": results, "recommended": best}, indent=2))
+        return
+
+    print(f"Current setting: PASSWORD_HASH_SCHEME={PASSWORD_HASH_SCHEME} "
+          f"PASSWORD_HASH_ROUNDS={PASSWORD_HASH_ROUNDS or 'default'}")
+    print(f"{'scheme':<16}{'rounds':>10}{'hash ms':>10}{'verify ms':>11}{'max ms':>9}{'logins/s/core':>15}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['scheme']:<16}{result['rounds']:>10}  unavailable: {result['error']}")
+            continue
+        print(f"{result['scheme']:<16}{result['rounds']:>10}{result['hash_ms']:>10}{result['verify_ms']:>11}"
+              f"{result['verify_max_ms']:>9}{result['logins_per_core_second']:>15}")
+    print(f"\nHighest cost within {args.target_ms:g} ms per login:")
+    for scheme, result in best.items():
+        print(f"  PASSWORD_HASH_SCHEME={scheme} PASSWORD_HASH_ROUNDS={result['rounds']}"
+              f"  ({result['verify_ms']} ms, {result['logins_per_core_second']} logins/s per core)")
+    if not best:
+        print("  none; raise --target-ms or try lower --rounds")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Script to add the (role, latitude, longitude) and (status, latitude,
+longitude) indexes to existing users and waste_listings tables.
+
+create_all only creates indexes together with new tables, so run this once
+on databases created before the indexes were added. Works on SQLite and
+MySQL; existing indexes are skipped.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect
+from database import engine
+import models
+
+GEO_INDEXES = [
+    (models.User.__table__, "ix_users_role_lat_lng"),
+    (models.WasteListing.__table__, "ix_waste_listings_status_lat_lng"),
+]
+
+def create_geo_indexes():
+    """Create the bounding box indexes that don't exist yet"""
+    inspector = inspect(engine)
+    for table, index_name in GEO_INDEXES:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        if index_name in existing:
+            print(f"Index {index_name} already exists")
+            continue
+        index = next(index for index in table.indexes if index.name == index_name)
+        try:
+            index.create(bind=engine)
+            print(f"Created index {index_name} on {table.name}")
+        except Exception as e:
+            print(f"Error creating index {index_name}: {e}")
+
+if __name__ == "__main__":
+    print("Creating bounding box indexes...")
+    create_geo_indexes()
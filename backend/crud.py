@@ -1,21 +1,49 @@
+import os
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
-from passlib.context import CryptContext
 # Import models and schemas first
 import models, schemas
 # Import the matching service
-from services.matching import get_recommended_composters as service_get_recommended_composters
+from services.matching import get_current_loads, count_active_loads
+# Import the bulk assignment service
+from services.assignment import plan_bulk_assignment
+# Import the background geocoding queue
+from services.geocoding_queue import geocoding_queue
+# Import the bounding box filter for radius searches
+from services.geofilter import approximate_distance, bbox_filter, within_radius
+# Import the spatial index of composters
+from services.spatial_index import composter_index
+# Import the recommendation cache
+from services import recommendations
+# Import the pickup route planner
+from services import routing
+# Import the authenticated user cache
+from services import principals
 # Import the location service
-from services.location import populate_location_data
+from services import location
+# Import the password hashing pool
+from services import passwords
+from services.passwords import pwd_context
+# Import the in-memory index of revoked access tokens
+from services.revocation import revocation_index, user_key
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Days a refresh token can be exchanged for new access tokens
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Lifetime of access tokens; a deactivated user's tokens are rejected for this long
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = passwords.hash_password(user.password)
     db_user = models.User(
         email=user.email,
         hashed_password=hashed_password,
@@ -32,12 +60,173 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.commit()
     db.refresh(db_user)
     
-    # If user provided an address, populate location data automatically
+    # If user provided an address, geocode it in the background
     if user.address:
-        populate_location_data(db, db_user)
+        geocoding_queue.enqueue(db, db_user, user.address)
     
+    # Keep the composter spatial index current
+    composter_index.upsert(db_user)
+    if db_user.role == models.Role.composter:
+        position = (db_user.latitude, db_user.longitude)
+        recommendations.invalidate_composter(db_user.id, [position])
+        recommendations.mark_candidates_stale(db, positions=[position])
+    
+    return db_user
+
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    """
+    Store a password hash upgraded to the current scheme or cost at login.
+    """
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {"hashed_password": hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user is None:
+        return None
+    changes = user_update.dict(exclude_unset=True)
+    previous_position = (db_user.latitude, db_user.longitude)
+    for field, value in changes.items():
+        setattr(db_user, field, value)
+    db.commit()
+    db.refresh(db_user)
+    # Requests authenticated as this user must see the change
+    principals.invalidate(db_user.email)
+    
+    if changes.get("address"):
+        geocoding_queue.enqueue(db, db_user, changes["address"])
+    elif (db_user.latitude, db_user.longitude) != previous_position:
+        location.location_changed(db, db_user, previous_position)
     return db_user
 
+def deactivate_user(db: Session, user_id: int):
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user is None:
+        return None
+    db_user.is_active = False
+    db.commit()
+    db.refresh(db_user)
+    # Their tokens stop working right away instead of after the cache TTL,
+    # including claims-backed ones, which are never checked against the user
+    principals.invalidate(db_user.email)
+    revoke_refresh_tokens(db, user_id=db_user.id)
+    revoke_access_token(db, user_key(db_user.id),
+                        datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    
+    # Inactive composters are no longer recommended
+    composter_index.upsert(db_user)
+    if db_user.role == models.Role.composter:
+        position = (db_user.latitude, db_user.longitude)
+        recommendations.invalidate_composter(db_user.id, [position])
+        recommendations.mark_candidates_stale(db, composter_ids=[db_user.id], positions=[position])
+    return db_user
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough; bcrypt
+    # is only needed for guessable secrets such as passwords
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _new_refresh_token(user_id: int, family_id: str, now: datetime) -> Tuple[str, models.RefreshToken]:
+    token = secrets.token_urlsafe(32)
+    db_token = models.RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id,
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return token, db_token
+
+def create_refresh_token(db: Session, user_id: int) -> str:
+    """
+    Start a new refresh token family for a login.
+
+    Returns:
+        The token to give to the client; only its hash is stored
+    """
+    token, db_token = _new_refresh_token(user_id, uuid.uuid4().hex, datetime.utcnow())
+    db.add(db_token)
+    db.commit()
+    return token
+
+def rotate_refresh_token(db: Session, token: str) -> Optional[Tuple[models.User, str]]:
+    """
+    Exchange a refresh token for a new one in the same family.
+
+    A token can be used once. Presenting it again means it was copied, so
+    the whole family is revoked and the client has to log in again.
+
+    Returns:
+        (user, new refresh token), or None if the token is not valid
+    """
+    now = datetime.utcnow()
+    db_token = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+    if db_token is None or db_token.expires_at <= now:
+        return None
+    if db_token.revoked_at is not None:
+        revoke_refresh_tokens(db, family_id=db_token.family_id)
+        return None
+    user = db.query(models.User).filter(models.User.id == db_token.user_id).first()
+    if user is None or user.is_active is False:
+        return None
+    # Conditional update, so two concurrent refreshes with the same token
+    # cannot both succeed
+    claimed = db.query(models.RefreshToken).filter(
+        models.RefreshToken.id == db_token.id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": now}, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        revoke_refresh_tokens(db, family_id=db_token.family_id)
+        return None
+    new_token, db_new_token = _new_refresh_token(user.id, db_token.family_id, now)
+    db.add(db_new_token)
+    db.flush()
+    db.query(models.RefreshToken).filter(models.RefreshToken.id == db_token.id).update(
+        {"replaced_by_id": db_new_token.id}, synchronize_session=False
+    )
+    db.commit()
+    return user, new_token
+
+def revoke_refresh_tokens(db: Session, family_id: Optional[str] = None, user_id: Optional[int] = None) -> int:
+    """
+    Revoke the unused refresh tokens of a family (one login) or of a user.
+
+    Returns:
+        Number of tokens revoked
+    """
+    query = db.query(models.RefreshToken).filter(models.RefreshToken.revoked_at.is_(None))
+    if family_id is not None:
+        query = query.filter(models.RefreshToken.family_id == family_id)
+    if user_id is not None:
+        query = query.filter(models.RefreshToken.user_id == user_id)
+    revoked = query.update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return revoked
+
+def family_of_refresh_token(db: Session, token: str) -> Optional[str]:
+    db_token = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+    return db_token.family_id if db_token else None
+
+def revoke_access_token(db: Session, jti: str, expires_at: datetime):
+    """
+    Reject an access token before it expires. This process stops accepting
+    it immediately; other worker processes within REVOCATION_RELOAD_SECONDS.
+    """
+    db.add(models.RevokedToken(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Already revoked
+        db.rollback()
+    revocation_index.add(jti, expires_at)
+
 def create_waste_listing(db: Session, waste_listing: schemas.WasteListingCreate, owner_id: int):
     db_waste_listing = models.WasteListing(
         **waste_listing.dict(), 
@@ -47,30 +236,183 @@ def create_waste_listing(db: Session, waste_listing: schemas.WasteListingCreate,
     db.commit()
     db.refresh(db_waste_listing)
     
-    # If waste listing has an address, populate location data automatically
+    # If waste listing has an address, geocode it in the background
     if waste_listing.address:
-        populate_location_data(db, db_waste_listing)
+        geocoding_queue.enqueue(db, db_waste_listing, waste_listing.address)
     
     return db_waste_listing
 
-def get_waste_listings(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.WasteListing).offset(skip).limit(limit).all()
+# Listings read per page of a radius search, as a multiple of skip + limit;
+# the margin covers bounding box corners outside the radius
+RADIUS_OVERFETCH = int(os.getenv("RADIUS_OVERFETCH", "2"))
+
+def get_waste_listings(db: Session, skip: int = 0, limit: int = 100,
+                       latitude: float = None, longitude: float = None, radius_km: float = None,
+                       status: models.WasteListingStatus = None):
+    query = db.query(models.WasteListing)
+    if status is not None:
+        query = query.filter(models.WasteListing.status == status)
+    if latitude is None or longitude is None or radius_km is None:
+        return query.offset(skip).limit(limit).all()
+
+    # Let the database discard far-away listings with a bounding box and
+    # return the rest roughly closest first, a page at a time; keep the ones
+    # within the exact radius until there are enough
+    wanted = skip + limit
+    if wanted <= 0:
+        return []
+    query = query.filter(bbox_filter(models.WasteListing.latitude, models.WasteListing.longitude,
+                                     latitude, longitude, radius_km))
+    distance = approximate_distance(models.WasteListing.latitude, models.WasteListing.longitude,
+                                    latitude, longitude)
+    page_size = wanted * RADIUS_OVERFETCH
+    nearby = []
+    after = None
+    while len(nearby) < wanted:
+        page = query.add_columns(distance)
+        if after is not None:
+            # Keyset pagination on (distance, id)
+            page = page.filter(or_(distance > after[0],
+                                   and_(distance == after[0], models.WasteListing.id > after[1])))
+        rows = page.order_by(distance, models.WasteListing.id).limit(page_size).all()
+        nearby.extend(within_radius([listing for listing, _ in rows], latitude, longitude, radius_km))
+        if len(rows) < page_size:
+            break
+        after = (rows[-1][1], rows[-1][0].id)
+    nearby.sort(key=lambda pair: pair[1])
+    return [listing for listing, _ in nearby[skip:wanted]]
 
 def assign_composter_to_waste_listing(db: Session, waste_listing_id: int, composter_id: int):
     db_waste_listing = db.query(models.WasteListing).filter(models.WasteListing.id == waste_listing_id).first()
     if db_waste_listing:
+        previous_composter_id = _active_composter(db_waste_listing)
         db_waste_listing.composter_id = composter_id
         db_waste_listing.status = models.WasteListingStatus.PENDING_PICKUP
+        if previous_composter_id != composter_id:
+            _adjust_composter_load(db, previous_composter_id, -1)
+            _adjust_composter_load(db, composter_id, 1)
         db.commit()
+        recommendations.invalidate([waste_listing_id], [previous_composter_id, composter_id], db=db)
         db.refresh(db_waste_listing)
         return db_waste_listing
     return None
 
+# Listing statuses that count towards a composter's load
+ACTIVE_LISTING_STATUSES = (models.WasteListingStatus.AVAILABLE, models.WasteListingStatus.PENDING_PICKUP)
+
+def _adjust_composter_load(db: Session, composter_id: int, delta: int):
+    """
+    Add delta to a composter's active load counter. Must be called in the
+    same transaction as the listing change it accounts for.
+    """
+    if not composter_id or not delta:
+        return
+    if _increment_composter_load(db, composter_id, delta):
+        return
+    # No counter yet: count the composter's listings, which include this
+    # change once it is flushed
+    db.flush()
+    load = count_active_loads(db, [composter_id]).get(composter_id, 0)
+    if delta < 0:
+        print(f"Composter {composter_id} had no load counter to decrement; rebuilt it as {load}")
+    try:
+        # A savepoint, so a conflict doesn't roll back the listing change
+        with db.begin_nested():
+            db.add(models.ComposterLoad(composter_id=composter_id, active_load=load))
+    except IntegrityError:
+        # Another transaction created the counter first; add to it instead
+        _increment_composter_load(db, composter_id, delta)
+
+def _increment_composter_load(db: Session, composter_id: int, delta: int) -> bool:
+    # False when the composter has no counter row
+    return db.query(models.ComposterLoad).filter(
+        models.ComposterLoad.composter_id == composter_id
+    ).update({
+        models.ComposterLoad.active_load: models.ComposterLoad.active_load + delta
+    }, synchronize_session=False) > 0
+
+def _active_composter(db_waste_listing):
+    # Composter whose load includes this listing, if any
+    if db_waste_listing.status in ACTIVE_LISTING_STATUSES:
+        return db_waste_listing.composter_id
+    return None
+
+def rebuild_composter_loads(db: Session):
+    """
+    Rebuild every composter's active load counter from waste_listings.
+    
+    Returns:
+        Number of composters with a non-zero load
+    """
+    loads = count_active_loads(db)
+    db.query(models.ComposterLoad).delete(synchronize_session=False)
+    db.add_all([
+        models.ComposterLoad(composter_id=composter_id, active_load=load)
+        for composter_id, load in loads.items()
+    ])
+    db.commit()
+    return len(loads)
+
+def assign_composters_to_waste_listings(db: Session, assignments: list) -> int:
+    """
+    Bulk version of assign_composter_to_waste_listing that applies many
+    assignments in one transaction. Listings that are no longer available
+    and unassigned are left untouched.
+    
+    Returns:
+        Number of listings that were assigned
+    """
+    listings_by_composter = {}
+    for assignment in assignments:
+        listings_by_composter.setdefault(assignment["composter_id"], []).append(assignment["waste_listing_id"])
+    
+    assigned = 0
+    for composter_id, listing_ids in listings_by_composter.items():
+        composter_assigned = 0
+        for start in range(0, len(listing_ids), 500):
+            composter_assigned += db.query(models.WasteListing).filter(
+                models.WasteListing.id.in_(listing_ids[start:start + 500]),
+                models.WasteListing.status == models.WasteListingStatus.AVAILABLE,
+                models.WasteListing.composter_id == None
+            ).update({
+                models.WasteListing.composter_id: composter_id,
+                models.WasteListing.status: models.WasteListingStatus.PENDING_PICKUP
+            }, synchronize_session=False)
+        _adjust_composter_load(db, composter_id, composter_assigned)
+        assigned += composter_assigned
+    db.commit()
+    recommendations.invalidate(
+        [assignment["waste_listing_id"] for assignment in assignments],
+        listings_by_composter.keys(),
+        db=db
+    )
+    return assigned
+
+def bulk_assign_composters(db: Session, request: schemas.BulkAssignmentRequest):
+    plan = plan_bulk_assignment(
+        db,
+        city=request.city,
+        state=request.state,
+        max_load=request.max_load,
+        max_distance_km=request.max_distance_km
+    )
+    plan["dry_run"] = request.dry_run
+    plan["applied"] = 0
+    if not request.dry_run:
+        plan["applied"] = assign_composters_to_waste_listings(db, plan["assignments"])
+    return plan
+
 def update_waste_listing_status(db: Session, waste_listing_id: int, status: models.WasteListingStatus):
     db_waste_listing = db.query(models.WasteListing).filter(models.WasteListing.id == waste_listing_id).first()
     if db_waste_listing:
+        previous_composter_id = _active_composter(db_waste_listing)
         db_waste_listing.status = status
+        current_composter_id = _active_composter(db_waste_listing)
+        if previous_composter_id != current_composter_id:
+            _adjust_composter_load(db, previous_composter_id, -1)
+            _adjust_composter_load(db, current_composter_id, 1)
         db.commit()
+        recommendations.invalidate([waste_listing_id], [previous_composter_id, current_composter_id], db=db)
         db.refresh(db_waste_listing)
         return db_waste_listing
     return None
@@ -88,7 +430,8 @@ def get_business_stats(db: Session, user_id: int):
 def get_composter_stats(db: Session, user_id: int):
     total_listings = db.query(models.WasteListing).filter(models.WasteListing.composter_id == user_id).count()
     total_quantity = db.query(func.sum(models.WasteListing.quantity)).filter(models.WasteListing.composter_id == user_id).scalar() or 0
-    return {"total_listings": total_listings, "total_quantity": total_quantity}
+    active_load = get_current_loads(db, [user_id]).get(user_id, 0)
+    return {"total_listings": total_listings, "total_quantity": total_quantity, "active_load": active_load}
 
 def get_buyer_stats(db: Session, user_id: int):
     total_orders = db.query(models.Order).filter(models.Order.buyer_id == user_id).count()
@@ -128,13 +471,37 @@ def create_order(db: Session, order: schemas.OrderCreate, buyer_id: int):
 def get_user_orders(db: Session, user_id: int):
     return db.query(models.Order).filter(models.Order.buyer_id == user_id).all()
 
-def get_recommended_composters(db: Session, waste_listing_id: int):
+def get_recommended_composters(db: Session, waste_listing_id: int, limit: int = 10):
     waste_listing = db.query(models.WasteListing).filter(models.WasteListing.id == waste_listing_id).first()
     if not waste_listing:
         raise HTTPException(status_code=404, detail="Waste listing not found")
 
-    # Use the smart matching service
-    return service_get_recommended_composters(db, waste_listing_id)
+    # Reuse cached recommendations when nothing relevant has changed
+    composter_ids = recommendations.get_cached_recommendations(waste_listing_id, limit)
+    if composter_ids is None:
+        # Then the candidates precomputed when the listing was created
+        composter_ids = recommendations.get_stored_candidates(db, waste_listing_id, limit)
+        if composter_ids is None:
+            # Score with the smart matching service; storing the candidates is
+            # left to the precompute and refresh jobs so that reads never write
+            scored = recommendations.score_listing_candidates(db, waste_listing_id, limit)
+            composters = [composter for composter, score in scored][:limit]
+            recommendations.store_recommendations(waste_listing, limit, [composter.id for composter in composters])
+            return composters
+        recommendations.store_recommendations(waste_listing, limit, composter_ids)
+    return get_users_by_ids(db, composter_ids)
+
+def get_users_by_ids(db: Session, user_ids: list):
+    """
+    Get users by ID in one query, in the order of user_ids.
+    """
+    if not user_ids:
+        return []
+    users = {user.id: user for user in db.query(models.User).filter(models.User.id.in_(user_ids)).all()}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+def get_pickup_route(db: Session, composter: models.User, capacity_kg: float = None):
+    return routing.plan_pickup_route(db, composter, capacity_kg=capacity_kg)
 
 def get_next_order_id(db: Session) -> int:
     """
@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Reads the DB_POOL_* settings on import, so after .env is loaded
+from services import db_pool
+
 # Use Railway's provided DATABASE_URL or fallback to local
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./swacchsetu.db")
 
@@ -13,7 +16,9 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./swacchsetu.db")
 if DATABASE_URL.startswith("mysql://") and "pymysql" not in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.replace("mysql://", "mysql+pymysql://")
 
-engine = create_engine(DATABASE_URL)
+# Pool size, overflow, timeout, recycle and pre-ping come from DB_POOL_*
+# environment variables (services/db_pool.py)
+engine = db_pool.instrument(create_engine(DATABASE_URL, **db_pool.engine_options(DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -1,5 +1,6 @@
 import sys
 import os
+import math
 try:
     import razorpay
     RAZORPAY_AVAILABLE = True
@@ -11,13 +12,20 @@ from pydantic import BaseModel
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 
 import auth, crud, models, schemas
+from services import db_pool, gazetteer, geocode_cache, geocoding, passwords, principals, recommendations
+from services.geocoding_queue import geocoding_queue
+from services.revocation import revocation_index
+from services.spatial_index import composter_index
+from services.throttle import LoginThrottled, client_ip, login_throttle
 from database import SessionLocal, engine, get_db
 
 # Load environment variables from .env file
@@ -47,6 +55,44 @@ app.add_middleware(
     allow_origin_regex="https://.*\\.netlify\\.app",
 )
 
+@app.on_event("startup")
+def resume_geocoding_jobs():
+    # Geocoding jobs left pending by the previous process
+    try:
+        resumed = geocoding_queue.resume_pending(engine)
+        if resumed:
+            print(f"Resumed {resumed} pending geocoding jobs")
+    except Exception as e:
+        print(f"Error resuming geocoding jobs: {e}")
+
+@app.on_event("startup")
+def load_revoked_tokens():
+    # Loads revoked access tokens, then picks up new ones in the background
+    revocation_index.start(engine)
+
+@app.on_event("startup")
+def load_composter_index():
+    # Builds the composter spatial index, then rebuilds it in the background
+    # so requests never wait for a rebuild
+    composter_index.start(engine)
+
+@app.on_event("shutdown")
+def stop_geocoding_workers():
+    geocoding_queue.shutdown(wait=False)
+    passwords.password_hasher.shutdown(wait=False)
+    revocation_index.stop()
+    composter_index.stop()
+
+@app.exception_handler(LoginThrottled)
+def login_throttled(request: Request, exc: LoginThrottled):
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+
+@app.exception_handler(passwords.PasswordHasherBusy)
+def password_hasher_busy(request: Request, exc: passwords.PasswordHasherBusy):
+    # Too many logins and sign-ups are already waiting for a hashing thread
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 # Initialize Razorpay client only if available
 razorpay_client = None
 if RAZORPAY_AVAILABLE:
@@ -117,19 +163,58 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(),
+                                 db: Session = Depends(get_db)):
+    # Refused before the user is loaded or the password is hashed
+    await login_throttle.check_async(client_ip(request), form_data.username)
+    user = await auth.authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    await login_throttle.succeeded_async(form_data.username)
+    return issue_tokens(user, crud.create_refresh_token(db, user.id))
+
+
+def issue_tokens(user: models.User, refresh_token: str):
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.email, "role": user.role}, expires_delta=access_token_expires
+        data={"sub": user.email, "role": user.role, "uid": user.id}, expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@app.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(request: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    # New access token without a password check; the refresh token is
+    # rotated on every use
+    rotated = crud.rotate_refresh_token(db, request.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = rotated
+    return issue_tokens(user, refresh_token)
+
+
+@app.post("/logout")
+def logout(request: Optional[schemas.LogoutRequest] = None, token: str = Depends(auth.oauth2_scheme),
+           db: Session = Depends(get_db)):
+    if not auth.revoke_access_token(db, token):
+        raise HTTPException(
+            status_code=401,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if request is not None and request.refresh_token:
+        family_id = crud.family_of_refresh_token(db, request.refresh_token)
+        if family_id is not None:
+            crud.revoke_refresh_tokens(db, family_id=family_id)
+    return {"message": "Logged out"}
 
 
 @app.get("/users/me/", response_model=schemas.User)
@@ -146,19 +231,45 @@ async def read_users_me(current_user: schemas.User = Depends(auth.get_current_us
         "state": current_user.state,
         "country": current_user.country,
         "latitude": current_user.latitude,
-        "longitude": current_user.longitude
+        "longitude": current_user.longitude,
+        "geocoding_status": current_user.geocoding_status
     }
     return user_dict
 
+@app.put("/users/me/", response_model=schemas.User)
+def update_users_me(
+    user_update: schemas.UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    # A new address is geocoded in the background
+    return crud.update_user(db=db, user_id=current_user.id, user_update=user_update)
+
+@app.put("/users/{user_id}/deactivate", response_model=schemas.User)
+def deactivate_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_operator),
+):
+    db_user = crud.deactivate_user(db=db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
 @app.post("/waste-listings/", response_model=schemas.WasteListing)
 def create_waste_listing(
     waste_listing: schemas.WasteListingCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(auth.get_current_user),
 ):
     db_waste_listing = crud.create_waste_listing(
         db=db, waste_listing=waste_listing, owner_id=current_user.id
     )
+    # Score candidate composters once, after the response has been sent;
+    # listings with an address are scored by the geocoding queue instead
+    if db_waste_listing.geocoding_status is None:
+        background_tasks.add_task(recommendations.precompute_listing_candidates, db_waste_listing.id)
     # Convert to dict and back to ensure proper serialization
     return schemas.WasteListing(**db_waste_listing.__dict__)
 
@@ -166,9 +277,16 @@ def create_waste_listing(
 def read_waste_listings(
     skip: int = 0,
     limit: int = 100,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    status: Optional[models.WasteListingStatus] = None,
     db: Session = Depends(get_db),
 ):
-    waste_listings = crud.get_waste_listings(db, skip=skip, limit=limit)
+    waste_listings = crud.get_waste_listings(
+        db, skip=skip, limit=limit, latitude=latitude, longitude=longitude,
+        radius_km=radius_km, status=status
+    )
     # Convert to dict and back to ensure proper serialization
     return [schemas.WasteListing(**wl.__dict__) for wl in waste_listings]
 
@@ -186,6 +304,14 @@ def assign_composter(
     # Convert to dict and back to ensure proper serialization
     return schemas.WasteListing(**db_waste_listing.__dict__) if db_waste_listing else None
 
+@app.post("/waste-listings/bulk-assign", response_model=schemas.BulkAssignmentResult)
+def bulk_assign_composters(
+    request: schemas.BulkAssignmentRequest,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_operator),
+):
+    return crud.bulk_assign_composters(db=db, request=request)
+
 @app.put("/waste-listings/{waste_listing_id}/update-status", response_model=schemas.WasteListing)
 def update_status(
     waste_listing_id: int,
@@ -227,6 +353,16 @@ def get_composter_stats(
         raise HTTPException(status_code=403, detail="Only composter users can access these stats")
     return crud.get_composter_stats(db=db, user_id=current_user.id)
 
+@app.get("/users/me/pickup-route", response_model=schemas.PickupRoute)
+def get_pickup_route(
+    capacity_kg: float = None,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user),
+):
+    if current_user.role != "composter":
+        raise HTTPException(status_code=403, detail="Only composter users can plan pickup routes")
+    return crud.get_pickup_route(db=db, composter=current_user, capacity_kg=capacity_kg)
+
 @app.get("/users/me/buyer-stats")
 def get_buyer_stats(
     db: Session = Depends(get_db),
@@ -284,6 +420,49 @@ def get_recommended_composters(
     # Convert to dict and back to ensure proper serialization
     return [schemas.User(**composter.__dict__) for composter in composters]
 
+# Operational stats; they reveal cache contents, pool sizing and
+# throttling, so only operators can read them
+internal = APIRouter(prefix="/internal", dependencies=[Depends(auth.get_current_operator)])
+
+@internal.get("/recommendation-cache")
+def get_recommendation_cache_stats():
+    return recommendations.recommendation_cache.stats()
+
+@internal.get("/principal-cache")
+def get_principal_cache_stats():
+    return principals.principal_cache.stats()
+
+@internal.get("/password-hasher")
+def get_password_hasher_stats():
+    return passwords.password_hasher.stats()
+
+@internal.get("/db-pool")
+def get_db_pool_stats():
+    return db_pool.pool_stats(engine)
+
+@internal.get("/login-throttle")
+def get_login_throttle_stats():
+    return login_throttle.stats()
+
+@internal.get("/token-revocation")
+def get_token_revocation_stats():
+    return revocation_index.stats()
+
+@internal.get("/geocode-cache")
+def get_geocode_cache_stats():
+    return {**geocode_cache.stats(), "gazetteer": gazetteer.gazetteer.stats(),
+            "single_flight": geocoding.single_flight.stats()}
+
+@internal.get("/geocoding-provider")
+def get_geocoding_provider_stats():
+    return geocoding.get_client().stats()
+
+@internal.get("/geocoding-queue")
+def get_geocoding_queue_stats(db: Session = Depends(get_db)):
+    return geocoding_queue.stats(db)
+
+app.include_router(internal)
+
 @app.get("/global-stats")
 def get_global_stats(db: Session = Depends(get_db)):
     return crud.get_global_stats(db=db)
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Boolean, Column, Integer, String, Enum, ForeignKey, DateTime, Float
+from sqlalchemy import Boolean, Column, Integer, String, Enum, ForeignKey, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -26,7 +26,11 @@ class WasteType(str, enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Bounding box searches for composters (services/geofilter.py)
+        Index("ix_users_role_lat_lng", "role", "latitude", "longitude"),
+        {'extend_existing': True}
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String(255), unique=True, index=True)
@@ -41,6 +45,8 @@ class User(Base):
     country = Column(String(100), nullable=True)
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
+    # pending, done or failed while/after the address is geocoded in the background
+    geocoding_status = Column(String(20), nullable=True)
 
     # Removing relationships that are causing issues
     # waste_listings = relationship("WasteListing", back_populates="owner")
@@ -50,7 +56,11 @@ class User(Base):
 
 class WasteListing(Base):
     __tablename__ = "waste_listings"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Bounding box searches for listings (services/geofilter.py)
+        Index("ix_waste_listings_status_lat_lng", "status", "latitude", "longitude"),
+        {'extend_existing': True}
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), index=True)
@@ -65,6 +75,8 @@ class WasteListing(Base):
     country = Column(String(100), nullable=True)
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
+    # pending, done or failed while/after the address is geocoded in the background
+    geocoding_status = Column(String(20), nullable=True)
     
     status = Column(Enum(WasteListingStatus), default=WasteListingStatus.AVAILABLE)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -75,6 +87,130 @@ class WasteListing(Base):
     # owner = relationship("User", back_populates="waste_listings")
     # composter = relationship("User", back_populates="composted_listings")
 
+class ComposterLoad(Base):
+    __tablename__ = "composter_loads"
+    __table_args__ = {'extend_existing': True}
+
+    # Denormalized count of a composter's available/pending pickup listings,
+    # kept in step with waste_listings by crud and rebuilt by rebuild_composter_loads.py
+    composter_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    active_load = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ListingCandidate(Base):
+    __tablename__ = "listing_candidates"
+    __table_args__ = (
+        Index("ix_listing_candidates_listing_rank", "waste_listing_id", "rank"),
+        {'extend_existing': True}
+    )
+
+    # Top scored composters for a waste listing, precomputed after creation
+    id = Column(Integer, primary_key=True, index=True)
+    waste_listing_id = Column(Integer, ForeignKey("waste_listings.id"), nullable=False)
+    composter_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    # Set when a composter move or load change may have changed the ranking
+    stale = Column(Boolean, nullable=False, default=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+    __table_args__ = {'extend_existing': True}
+
+    # Geocoding results reused across users and listings with the same address
+    id = Column(Integer, primary_key=True, index=True)
+    # SHA-256 of the normalized address (services/geocode_cache.py)
+    address_key = Column(String(64), unique=True, index=True, nullable=False)
+    normalized_address = Column(String(512))
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    city = Column(String(100), nullable=True)
+    state = Column(String(100), nullable=True)
+    country = Column(String(100), nullable=True)
+    formatted = Column(String(512), nullable=True)
+    # Naive UTC timestamps
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
+class ReverseGeocodeCache(Base):
+    __tablename__ = "reverse_geocode_cache"
+    __table_args__ = {'extend_existing': True}
+
+    # Reverse geocoding results shared by coordinates in the same grid cell
+    id = Column(Integer, primary_key=True, index=True)
+    # Quantized coordinates of the cell (services/geocode_cache.py)
+    grid_key = Column(String(64), unique=True, index=True, nullable=False)
+    city = Column(String(100), nullable=True)
+    state = Column(String(100), nullable=True)
+    country = Column(String(100), nullable=True)
+    formatted = Column(String(512), nullable=True)
+    # Naive UTC timestamps
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
+class GeocodingJob(Base):
+    __tablename__ = "geocoding_jobs"
+    __table_args__ = (
+        Index("ix_geocoding_jobs_status_next_attempt", "status", "next_attempt_at"),
+        {'extend_existing': True}
+    )
+
+    # Address waiting to be geocoded for a user or waste listing
+    # (services/geocoding_queue.py); kept so pending work survives restarts
+    id = Column(Integer, primary_key=True, index=True)
+    entity_type = Column(String(20), nullable=False)  # user or waste_listing
+    entity_id = Column(Integer, nullable=False)
+    address = Column(String(512), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(512), nullable=True)
+    # Naive UTC timestamps
+    next_attempt_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    __table_args__ = {'extend_existing': True}
+
+    # Long-lived token exchanged for new access tokens at /token/refresh.
+    # Each use replaces it with a new token in the same family; presenting
+    # a replaced token again revokes the whole family.
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # SHA-256 of the token; the token itself is only known to the client
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(String(32), nullable=False, index=True)
+    replaced_by_id = Column(Integer, nullable=True)
+    # Naive UTC timestamps
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    __table_args__ = {'extend_existing': True}
+
+    # Access tokens revoked before they expire, by their jti claim; loaded
+    # into memory by services/revocation.py
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(32), unique=True, nullable=False)
+    # Naive UTC timestamps
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=False, index=True)
+
+class LoginThrottleBucket(Base):
+    __tablename__ = "login_throttle_buckets"
+    __table_args__ = {'extend_existing': True}
+
+    # Login attempt token bucket shared by worker processes when
+    # LOGIN_THROTTLE_BACKEND=database (services/throttle.py)
+    key = Column(String(320), primary_key=True)  # ip:<address> or email:<address>
+    tokens = Column(Float, nullable=False)
+    # Unix time of the last attempt
+    updated_at = Column(Float, nullable=False, index=True)
+
 class CompostMarketplace(Base):
     __tablename__ = "compost_marketplace"
     __table_args__ = {'extend_existing': True}
@@ -105,4 +241,4 @@ class Order(Base):
 
     # Removing relationships that are causing issues
     # compost_listing = relationship("CompostMarketplace", back_populates="orders")
-    # buyer = relationship("User", back_populates="orders")
\ No newline at end of file
+    # buyer = relationship("User", back_populates="orders")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the composter_loads counters from waste_listings.
+
+Run it once after deploying the counter table, and whenever the counters
+are suspected to have drifted from the listings.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, engine
+import models
+import crud
+
+def rebuild_composter_loads():
+    """Recount every composter's active listings and store the counters"""
+    models.Base.metadata.create_all(bind=engine, tables=[models.ComposterLoad.__table__])
+    db = SessionLocal()
+    try:
+        before = dict(db.query(models.ComposterLoad.composter_id, models.ComposterLoad.active_load).all())
+        composters = crud.rebuild_composter_loads(db)
+        after = dict(db.query(models.ComposterLoad.composter_id, models.ComposterLoad.active_load).all())
+
+        drifted = [
+            composter_id for composter_id in set(before) | set(after)
+            if before.get(composter_id, 0) != after.get(composter_id, 0)
+        ]
+        print(f"Rebuilt load counters for {composters} composters")
+        print(f"Corrected {len(drifted)} drifted counters")
+        for composter_id in sorted(drifted):
+            print(f"  Composter {composter_id}: {before.get(composter_id, 0)} -> {after.get(composter_id, 0)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("Rebuilding composter load counters...")
+    rebuild_composter_loads()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Script to rescore stored listing candidates that are stale, too old or missing.
+
+Candidates are marked stale when composters move or their load changes.
+Run this periodically (for example from cron) to keep
+/waste-listings/{id}/recommended-composters a single indexed read.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, engine
+import models
+from services.recommendations import refresh_stale_candidates
+
+def refresh_listing_candidates(batch_size: int = 500):
+    """Rescore candidates in batches until none need refreshing"""
+    models.Base.metadata.create_all(bind=engine, tables=[models.ListingCandidate.__table__])
+    db = SessionLocal()
+    try:
+        total = 0
+        last_id = 0
+        start = time.perf_counter()
+        while True:
+            refreshed = refresh_stale_candidates(db, batch_size=batch_size, after_id=last_id)
+            if not refreshed:
+                break
+            total += len(refreshed)
+            last_id = refreshed[-1]
+            print(f"Rescored {total} listings so far (up to listing {last_id})...")
+        print(f"Rescored {total} listings in {time.perf_counter() - start:.1f}s")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print("Refreshing stale listing candidates...")
+    refresh_listing_candidates(batch_size)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import List, Optional
 from models import Role, WasteType, WasteListingStatus
 from datetime import datetime
 
@@ -17,15 +17,32 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class UserUpdate(BaseModel):
+    location: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    country: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
 class User(UserBase):
     id: int
     is_active: bool
+    geocoding_status: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -52,10 +69,45 @@ class WasteListing(WasteListingBase):
     owner_id: int
     status: WasteListingStatus
     created_at: datetime
+    geocoding_status: Optional[str] = None
 
     class Config:
         from_attributes = True
 
+class BulkAssignmentRequest(BaseModel):
+    city: Optional[str] = None
+    state: Optional[str] = None
+    max_load: Optional[int] = None
+    max_distance_km: Optional[float] = None
+    dry_run: bool = True
+
+class ListingAssignment(BaseModel):
+    waste_listing_id: int
+    composter_id: int
+    distance_km: float
+
+class BulkAssignmentResult(BaseModel):
+    assignments: List[ListingAssignment]
+    unassigned: List[int]
+    total_distance_km: float
+    dry_run: bool
+    applied: int
+
+class PickupStop(BaseModel):
+    waste_listing_id: int
+    title: Optional[str] = None
+    latitude: float
+    longitude: float
+    quantity: Optional[float] = None
+    trip: int
+    leg_distance_km: float
+
+class PickupRoute(BaseModel):
+    stops: List[PickupStop]
+    trips: int
+    total_distance_km: float
+    unrouted: List[int]
+
 class CompostMarketplaceBase(BaseModel):
     title: str
     description: Optional[str] = None
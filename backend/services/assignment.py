@@ -0,0 +1,220 @@
+import heapq
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+import numpy as np
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+from models import User, WasteListing
+from services.geofilter import bbox_filter
+from services.matching import haversine_km, get_current_loads
+from services.spatial_index import ComposterGridIndex
+
+# A composter is considered full at this many active listings (the last load band)
+DEFAULT_MAX_LOAD = int(os.getenv("ASSIGNMENT_MAX_LOAD", "20"))
+# Listings are never assigned further away than the last distance band
+DEFAULT_MAX_DISTANCE_KM = float(os.getenv("ASSIGNMENT_MAX_DISTANCE_KM", "50"))
+# Number of nearest composters considered for each listing
+CANDIDATES_PER_LISTING = 8
+# Grid cell size used to find nearest composters (about 5.5 km)
+CANDIDATE_CELL_DEG = 0.05
+# Bid increment in km; the plan is within len(listings) * AUCTION_EPSILON_KM of optimal
+AUCTION_EPSILON_KM = 0.05
+
+def build_candidate_edges(listing_lats: np.ndarray, listing_lngs: np.ndarray,
+                          composter_lats: np.ndarray, composter_lngs: np.ndarray,
+                          k: int = CANDIDATES_PER_LISTING,
+                          max_distance_km: float = DEFAULT_MAX_DISTANCE_KM) -> List[List[tuple]]:
+    """
+    Find the k nearest composters within max_distance_km of every listing.
+
+    Listings are grouped by grid cell so that distances are computed as one
+    matrix per cell against the composters in the surrounding rings.
+
+    Returns:
+        For each listing, a list of (composter index, distance in km) tuples
+    """
+    edges: List[List[tuple]] = [[] for _ in range(len(listing_lats))]
+    if len(listing_lats) == 0 or len(composter_lats) == 0:
+        return edges
+
+    index = ComposterGridIndex(cell_size_deg=CANDIDATE_CELL_DEG)
+    for j, (lat, lng) in enumerate(zip(composter_lats, composter_lngs)):
+        index.add(j, float(lat), float(lng))
+
+    # Group listings by the grid cell they fall in
+    cells = defaultdict(list)
+    rows = np.floor(listing_lats / CANDIDATE_CELL_DEG).astype(int)
+    cols = np.floor(listing_lngs / CANDIDATE_CELL_DEG).astype(int)
+    for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+        cells[cell].append(i)
+
+    for (row, col), members in cells.items():
+        center_lat = (row + 0.5) * CANDIDATE_CELL_DEG
+        center_lng = (col + 0.5) * CANDIDATE_CELL_DEG
+        candidates = np.array(index.nearby(center_lat, center_lng, min_results=k))
+        members = np.array(members)
+
+        # One distance matrix for the whole cell: rows are listings
+        distances = haversine_km(listing_lats[members][:, None], listing_lngs[members][:, None],
+                                 composter_lats[candidates][None, :], composter_lngs[candidates][None, :])
+
+        if len(candidates) > k:
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.tile(np.arange(len(candidates)), (len(members), 1))
+        for row_index, i in enumerate(members):
+            for column in nearest[row_index]:
+                distance = float(distances[row_index, column])
+                if distance <= max_distance_km:
+                    edges[i].append((int(candidates[column]), distance))
+    return edges
+
+def solve_assignment(edges: List[List[tuple]], capacities: List[int],
+                     epsilon: float = AUCTION_EPSILON_KM,
+                     unassigned_cost: Optional[float] = None) -> List[int]:
+    """
+    Assign listings to composters minimizing total distance while respecting
+    composter capacities, using the auction algorithm for assignment with
+    similar objects.
+
+    Each listing bids for the composter with the best distance-minus-price
+    value. A full composter's price is its lowest accepted bid, so a new bid
+    evicts the lowest bidder, which then bids again. Leaving a listing
+    unassigned costs unassigned_cost, which guarantees termination.
+
+    Args:
+        edges: For each listing, a list of (composter index, distance) tuples
+        capacities: Number of listings each composter can still take
+        epsilon: Minimum bid increment
+        unassigned_cost: Cost of leaving a listing unassigned, defaults to
+            just above the largest edge distance
+
+    Returns:
+        For each listing, the index of its composter or -1 if unassigned
+    """
+    if unassigned_cost is None:
+        longest = max((d for listing_edges in edges for _, d in listing_edges), default=0.0)
+        unassigned_cost = longest + 1.0
+
+    prices = [0.0] * len(capacities)
+    # Min-heap of (bid, listing) for every composter
+    accepted: List[list] = [[] for _ in capacities]
+    owner = [-1] * len(edges)
+
+    queue = deque(i for i, listing_edges in enumerate(edges) if listing_edges)
+    while queue:
+        i = queue.popleft()
+        best_j = -1
+        best_value = second_value = -unassigned_cost
+        for j, distance in edges[i]:
+            if capacities[j] <= 0:
+                continue
+            value = -distance - prices[j]
+            if value > best_value:
+                second_value = best_value
+                best_value = value
+                best_j = j
+            elif value > second_value:
+                second_value = value
+        if best_j < 0:
+            # Staying unassigned is the best option from now on
+            continue
+
+        bid = prices[best_j] + (best_value - second_value) + epsilon
+        heap = accepted[best_j]
+        if len(heap) >= capacities[best_j]:
+            _, evicted = heapq.heapreplace(heap, (bid, i))
+            owner[evicted] = -1
+            queue.append(evicted)
+        else:
+            heapq.heappush(heap, (bid, i))
+        owner[i] = best_j
+        if len(heap) >= capacities[best_j]:
+            prices[best_j] = heap[0][0]
+    return owner
+
+def plan_bulk_assignment(db: Session, city: Optional[str] = None, state: Optional[str] = None,
+                         max_load: Optional[int] = None,
+                         max_distance_km: Optional[float] = None) -> Dict:
+    """
+    Compute a global assignment of available, unassigned waste listings in a
+    region to active composters.
+
+    Args:
+        db: Database session
+        city: Only consider listings in this city
+        state: Only consider listings in this state
+        max_load: Maximum number of active listings per composter,
+            defaults to DEFAULT_MAX_LOAD
+        max_distance_km: Maximum distance between a listing and its
+            composter, defaults to DEFAULT_MAX_DISTANCE_KM
+
+    Returns:
+        Dictionary with the assignments, the unassigned listing IDs and the
+        total distance in km
+    """
+    if max_load is None:
+        max_load = DEFAULT_MAX_LOAD
+    if max_distance_km is None:
+        max_distance_km = DEFAULT_MAX_DISTANCE_KM
+    
+    query = db.query(WasteListing.id, WasteListing.latitude, WasteListing.longitude).filter(
+        WasteListing.status == models.WasteListingStatus.AVAILABLE,
+        WasteListing.composter_id == None
+    )
+    if city:
+        query = query.filter(func.lower(WasteListing.city) == city.lower())
+    if state:
+        query = query.filter(func.lower(WasteListing.state) == state.lower())
+    rows = query.order_by(WasteListing.id).all()
+
+    located = [row for row in rows if row.latitude and row.longitude]
+    unassigned = [row.id for row in rows if not (row.latitude and row.longitude)]
+    plan = {"assignments": [], "unassigned": unassigned, "total_distance_km": 0.0}
+    if not located:
+        return plan
+
+    listing_lats = np.array([row.latitude for row in located], dtype=float)
+    listing_lngs = np.array([row.longitude for row in located], dtype=float)
+
+    # Composters within max_distance_km of the region's bounding box
+    composters = db.query(User.id, User.latitude, User.longitude).filter(
+        User.role == "composter",
+        bbox_filter(User.latitude, User.longitude, listing_lats, listing_lngs, max_distance_km),
+        User.is_active == True
+    ).order_by(User.id).all()
+    composters = [row for row in composters if row.latitude and row.longitude]
+    if not composters:
+        plan["unassigned"].extend(row.id for row in located)
+        return plan
+
+    loads = get_current_loads(db)
+    capacities = [max(0, max_load - loads.get(row.id, 0)) for row in composters]
+
+    edges = build_candidate_edges(
+        listing_lats, listing_lngs,
+        np.array([row.latitude for row in composters], dtype=float),
+        np.array([row.longitude for row in composters], dtype=float),
+        max_distance_km=max_distance_km
+    )
+    owner = solve_assignment(edges, capacities)
+
+    total_distance = 0.0
+    for i, j in enumerate(owner):
+        if j < 0:
+            plan["unassigned"].append(located[i].id)
+            continue
+        distance = next(d for c, d in edges[i] if c == j)
+        total_distance += distance
+        plan["assignments"].append({
+            "waste_listing_id": located[i].id,
+            "composter_id": composters[j].id,
+            "distance_km": round(distance, 3)
+        })
+    plan["total_distance_km"] = round(total_distance, 3)
+    return plan
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded cache with a per-entry time to live.
+
+    Least recently used entries are evicted once the cache is full, and
+    expired entries are dropped when they are read. Hit and miss counters
+    are kept so the cache can be sized from its stats.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return the cached value for key, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value, evicting the least recently used entry when full.
+        """
+        with self._lock:
+            self._entries[key] = (value, self._clock() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+                return True
+            return False
+
+    def delete_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """
+        Drop every entry for which predicate(key, value) is true.
+
+        Returns:
+            Number of entries dropped
+        """
+        with self._lock:
+            keys = [key for key, (value, _) in self._entries.items() if predicate(key, value)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and share its result (or exception) instead of
+    making the call again. Threads and asyncio tasks share the same flights:
+    each flight is a concurrent.futures.Future, which tasks await through
+    asyncio.wrap_future. Nothing is kept once a call finishes, so results
+    still have to be cached separately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            self.calls += 1
+            return future, True
+
+    def _land(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None):
+        with self._lock:
+            del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Call fn(*args, **kwargs), or wait for the call already in flight for key.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._land(key, future, error=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """
+        asyncio version of do; fn is a coroutine function.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self._land(key, future, error=e)
+            raise
+        self._land(key, future, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "calls": self.calls,
+                "coalesced": self.coalesced
+            }
@@ -0,0 +1,155 @@
+import bisect
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+# Use absolute imports instead of relative imports
+import sys
+import os
+from dotenv import load_dotenv
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load environment variables
+load_dotenv()
+
+# Connections each worker process keeps open
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Extra connections opened under load and closed when returned
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which a connection is replaced; keep it below the server's
+# idle timeout (MySQL wait_timeout) so dropped connections are never used
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection with a lightweight query when it is checked out
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# uvicorn/gunicorn worker processes, each with its own pool; only used to
+# report the total number of connections the database has to accept
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Upper bounds of the checkout wait histogram buckets, in milliseconds
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class PoolMetrics:
+    """
+    Counters and a wait-time histogram for connection checkouts.
+    """
+
+    def __init__(self, buckets_ms=WAIT_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets_ms) + 1)
+            self._wait_ms_total = 0.0
+            self._wait_ms_max = 0.0
+            self._counters = {"checkouts": 0, "timeouts": 0, "connects": 0, "invalidations": 0}
+
+    def count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def record_wait(self, wait_ms: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets_ms, wait_ms)] += 1
+            self._wait_ms_total += wait_ms
+            self._wait_ms_max = max(self._wait_ms_max, wait_ms)
+            self._counters["checkouts"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            checkouts = self._counters["checkouts"]
+            histogram = {f"le_{bound:g}ms": count for bound, count in zip(self.buckets_ms, self._counts)}
+            histogram["over"] = self._counts[-1]
+            return {
+                **self._counters,
+                "wait_ms_mean": round(self._wait_ms_total / checkouts, 3) if checkouts else 0.0,
+                "wait_ms_max": round(self._wait_ms_max, 3),
+                "wait_ms_histogram": histogram
+            }
+
+class MeasuredQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection,
+    including opening a new one and the pre-ping.
+    """
+
+    def __init__(self, *args, metrics: PoolMetrics = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.metrics.count("timeouts")
+            raise
+        self.metrics.record_wait((time.perf_counter() - started) * 1000)
+        return connection
+
+    def recreate(self):
+        # Called by engine.dispose(); keep the counters across the new pool
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+def engine_options(url: str) -> dict:
+    """
+    create_engine keyword arguments for the configured pool.
+
+    In-memory SQLite keeps SQLAlchemy's default single-connection pool;
+    file SQLite and server databases get a MeasuredQueuePool.
+    """
+    if url.startswith("sqlite") and (url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url):
+        return {}
+    options = {
+        "poolclass": MeasuredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.startswith("sqlite"):
+        # Connections move between the threads serving requests
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+def instrument(engine):
+    """
+    Count new and invalidated connections (e.g. dropped by the server and
+    caught by the pre-ping) in the pool's metrics.
+    """
+    metrics = getattr(engine.pool, "metrics", None)
+    if metrics is None:
+        return engine
+    event.listen(engine, "connect", lambda *args: metrics.count("connects"))
+    event.listen(engine, "invalidate", lambda *args: metrics.count("invalidations"))
+    return engine
+
+def pool_stats(engine) -> dict:
+    """
+    Current pool usage, settings and checkout metrics of an engine.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__, "status": pool.status()}
+    size, max_overflow = pool.size(), pool._max_overflow
+    return {
+        "pool": type(pool).__name__,
+        "size": size,
+        "max_overflow": max_overflow,
+        "timeout_seconds": pool.timeout(),
+        "recycle_seconds": pool._recycle,
+        "pre_ping": pool._pre_ping,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "workers": WEB_CONCURRENCY,
+        "max_connections_all_workers": (size + max(0, max_overflow)) * WEB_CONCURRENCY,
+        **(pool.metrics.stats() if isinstance(pool, MeasuredQueuePool) else {})
+    }
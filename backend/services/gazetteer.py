@@ -0,0 +1,342 @@
+import csv
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.matching import haversine_km
+
+# Answer city and PIN code addresses locally before calling OpenCage
+GAZETTEER_ENABLED = os.getenv("GAZETTEER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Extra gazetteer CSV loaded on top of the bundled one, e.g. the India Post
+# PIN code directory (pincode, districtname, statename, latitude, longitude)
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+# Also answer street-level addresses that contain a PIN code with the PIN
+# centroid (a few km off) instead of calling OpenCage
+GAZETTEER_PIN_CENTROIDS = os.getenv("GAZETTEER_PIN_CENTROIDS", "false").lower() in ("1", "true", "yes")
+# Reverse lookups further than this from any known place return None
+GAZETTEER_REVERSE_MAX_KM = float(os.getenv("GAZETTEER_REVERSE_MAX_KM", "25"))
+
+BUNDLED_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "data", "gazetteer_in.csv")
+# Size of the reverse lookup grid cells, in degrees
+GRID_CELL_DEGREES = 0.5
+
+PIN_PATTERN = re.compile(r"\b([1-9]\d{2})\s?(\d{3})\b")
+COUNTRY_NAMES = {"india", "bharat", "in"}
+# Former and alternative names of cities in the bundled gazetteer
+CITY_ALIASES = {
+    "bangalore": "bengaluru", "bombay": "mumbai", "calcutta": "kolkata", "madras": "chennai",
+    "poona": "pune", "mysore": "mysuru", "gurgaon": "gurugram", "trivandrum": "thiruvananthapuram",
+    "cochin": "kochi", "ernakulam": "kochi", "vizag": "visakhapatnam", "baroda": "vadodara",
+    "allahabad": "prayagraj", "benares": "varanasi", "banaras": "varanasi", "mangalore": "mangaluru",
+    "hubli": "hubballi", "belgaum": "belagavi", "trichy": "tiruchirappalli", "pondicherry": "puducherry",
+    "calicut": "kozhikode", "delhi ncr": "delhi",
+}
+STATE_ABBREVIATIONS = {
+    "ap", "as", "br", "cg", "ch", "dl", "ga", "gj", "hp", "hr", "jh", "jk", "ka", "kl", "mh", "ml",
+    "mn", "mp", "od", "or", "pb", "py", "rj", "sk", "tn", "tr", "ts", "tg", "uk", "up", "wb",
+}
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def _column(row: dict, *names) -> Optional[str]:
+    for name in names:
+        value = row.get(name)
+        if value is not None and value.strip() and value.strip().upper() != "NA":
+            return value.strip()
+    return None
+
+class Gazetteer:
+    """
+    Offline geocoder for Indian cities and PIN codes.
+
+    Places are kept in numpy arrays, with dictionaries from PIN code and
+    normalized city name to array positions, so a lookup is a regex and a
+    couple of dictionary hits. Reverse lookups search a grid of
+    GRID_CELL_DEGREES cells around the point. Addresses with anything more
+    specific than a city, state and PIN code are left to OpenCage.
+    """
+
+    def __init__(self, paths: Optional[List[str]] = None, pin_centroids: bool = GAZETTEER_PIN_CENTROIDS):
+        if paths is None:
+            paths = [BUNDLED_PATH] + ([GAZETTEER_PATH] if GAZETTEER_PATH else [])
+        self.paths = paths
+        self.pin_centroids = pin_centroids
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counters = {"pin_hits": 0, "city_hits": 0, "misses": 0, "approximate_hits": 0,
+                          "reverse_hits": 0, "reverse_misses": 0}
+        self.load_seconds = 0.0
+
+    def _read(self, path: str, cities: dict, pins: dict):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for raw in csv.DictReader(f):
+                row = {(key or "").strip().lower(): value for key, value in raw.items()}
+                city = _column(row, "city", "districtname", "district")
+                state = _column(row, "state", "statename")
+                pincode = _column(row, "pincode", "pin")
+                try:
+                    latitude = float(_column(row, "latitude", "lat"))
+                    longitude = float(_column(row, "longitude", "lng", "lon"))
+                except (TypeError, ValueError):
+                    continue
+                if not city or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+                    continue
+                city, state = city.title(), (state or "").title() or None
+                if pincode:
+                    # Post offices sharing a PIN code are averaged into one centroid
+                    pins[int(pincode)].append((latitude, longitude, city, state))
+                    # Cities without a row of their own get the mean of their PIN codes
+                    cities.setdefault(_normalize(city), {"explicit": False, "points": [], "city": city,
+                                                         "state": state})
+                    if not cities[_normalize(city)]["explicit"]:
+                        cities[_normalize(city)]["points"].append((latitude, longitude))
+                else:
+                    cities[_normalize(city)] = {"explicit": True, "points": [(latitude, longitude)],
+                                                "city": city, "state": state}
+
+    def load(self):
+        """
+        Read the gazetteer files and build the indexes. Called on first use.
+        """
+        with self._load_lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            cities = {}
+            pins = defaultdict(list)
+            for path in self.paths:
+                try:
+                    self._read(path, cities, pins)
+                except OSError as e:
+                    print(f"Error loading gazetteer {path}: {e}")
+
+            names, states, latitudes, longitudes = [], [], [], []
+            def add(latitude, longitude, city, state) -> int:
+                names.append(city)
+                states.append(state)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+                return len(names) - 1
+
+            self.cities: Dict[str, int] = {}
+            for key, place in cities.items():
+                points = np.array(place["points"])
+                self.cities[key] = add(*points.mean(axis=0), place["city"], place["state"])
+            for alias, key in CITY_ALIASES.items():
+                if key in self.cities and alias not in self.cities:
+                    self.cities[alias] = self.cities[key]
+            self.pins: Dict[int, int] = {}
+            for pincode, offices in pins.items():
+                points = np.array([office[:2] for office in offices])
+                self.pins[pincode] = add(*points.mean(axis=0), *offices[0][2:])
+
+            self.names = names
+            self.states = states
+            self.latitudes = np.array(latitudes, dtype=np.float64)
+            self.longitudes = np.array(longitudes, dtype=np.float64)
+            self.state_names = {_normalize(state) for state in states if state} | STATE_ABBREVIATIONS
+            grid = defaultdict(list)
+            for index in range(len(names)):
+                grid[self._cell(latitudes[index], longitudes[index])].append(index)
+            self.grid = {cell: np.array(indexes) for cell, indexes in grid.items()}
+            self.load_seconds = time.perf_counter() - started
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    @staticmethod
+    def _cell(latitude: float, longitude: float) -> Tuple[int, int]:
+        return (int(np.floor(latitude / GRID_CELL_DEGREES)), int(np.floor(longitude / GRID_CELL_DEGREES)))
+
+    def _result(self, index: int, pincode: Optional[int] = None) -> dict:
+        city, state = self.names[index], self.states[index]
+        place = f"{city} {pincode}" if pincode else city
+        return {
+            "latitude": round(float(self.latitudes[index]), 6),
+            "longitude": round(float(self.longitudes[index]), 6),
+            "city": city,
+            "state": state,
+            "country": "India",
+            "formatted": ", ".join(part for part in (place, state, "India") if part)
+        }
+
+    def lookup(self, address: str) -> Optional[dict]:
+        """
+        Geocode an address made of a city, state and/or PIN code.
+
+        Args:
+            address: The address to geocode
+
+        Returns:
+            A dictionary with latitude, longitude, city, state, country and
+            formatted, or None if the address is not in the gazetteer or is
+            more specific than a city or PIN code
+        """
+        pincode, city_index, street_level = self._parse(address)
+        if pincode in self.pins and (not street_level or self.pin_centroids):
+            self._count("pin_hits")
+            return self._result(self.pins[pincode], pincode)
+        if city_index is not None and not street_level and pincode is None:
+            self._count("city_hits")
+            return self._result(city_index)
+        self._count("misses")
+        return None
+
+    def _parse(self, address: str) -> Tuple[Optional[int], Optional[int], bool]:
+        self._ensure_loaded()
+        pincode = None
+        match = PIN_PATTERN.search(address)
+        if match:
+            pincode = int(match.group(1) + match.group(2))
+            address = address[:match.start()] + address[match.end():]
+
+        city_index = None
+        street_level = False
+        for part in re.split(r"[,;\n]", address):
+            part = _normalize(part)
+            if part in self.cities:
+                # Checked before states: Delhi and Chandigarh are both
+                city_index = self.cities[part]
+            elif part and part not in COUNTRY_NAMES and part not in self.state_names:
+                street_level = True
+        return pincode, city_index, street_level
+
+    def approximate(self, address: str) -> Optional[dict]:
+        """
+        Locate any address to its PIN code or city, for use while the
+        geocoding provider is unavailable. City names are also found inside
+        street-level parts ("12 MG Road Bengaluru").
+
+        Returns:
+            The PIN code or city centroid, or None if neither is known
+        """
+        pincode, city_index, _ = self._parse(address)
+        if pincode in self.pins:
+            self._count("approximate_hits")
+            return self._result(self.pins[pincode], pincode)
+        if city_index is None:
+            words = _normalize(PIN_PATTERN.sub(" ", address)).split()
+            # Longest names first, so "navi mumbai" wins over "mumbai"
+            for size in (3, 2, 1):
+                for start in range(len(words) - size, -1, -1):
+                    name = " ".join(words[start:start + size])
+                    if name in self.cities:
+                        city_index = self.cities[name]
+                        break
+                if city_index is not None:
+                    break
+        if city_index is None:
+            return None
+        self._count("approximate_hits")
+        return self._result(city_index)
+
+    def reverse(self, latitude: float, longitude: float,
+                max_distance_km: float = GAZETTEER_REVERSE_MAX_KM) -> Optional[dict]:
+        """
+        Get the city, state and country of the nearest known place.
+
+        Args:
+            latitude: Latitude coordinate
+            longitude: Longitude coordinate
+            max_distance_km: Places further away than this are ignored
+
+        Returns:
+            A dictionary with city, state, country and formatted, or None
+        """
+        self._ensure_loaded()
+        # Cells within max_distance_km; longitude cells shrink with latitude
+        lat_cells = int(np.ceil(max_distance_km / 111.0 / GRID_CELL_DEGREES))
+        cos_lat = max(np.cos(np.radians(min(abs(latitude) + lat_cells * GRID_CELL_DEGREES, 89.0))), 0.01)
+        lng_cells = int(np.ceil(max_distance_km / (111.0 * cos_lat) / GRID_CELL_DEGREES))
+        row, column = self._cell(latitude, longitude)
+        candidates = [self.grid[cell] for cell in (
+            (row + i, column + j) for i in range(-lat_cells, lat_cells + 1)
+            for j in range(-lng_cells, lng_cells + 1)
+        ) if cell in self.grid]
+        if candidates:
+            indexes = np.concatenate(candidates)
+            distances = haversine_km(latitude, longitude, self.latitudes[indexes], self.longitudes[indexes])
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= max_distance_km:
+                self._count("reverse_hits")
+                result = self._result(int(indexes[nearest]))
+                del result["latitude"], result["longitude"]
+                return result
+        self._count("reverse_misses")
+        return None
+
+    def reset_stats(self):
+        with self._lock:
+            for counter in self._counters:
+                self._counters[counter] = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters["pin_hits"] + counters["city_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "enabled": GAZETTEER_ENABLED,
+            "places": len(self.names) if self._loaded else 0,
+            "pin_codes": len(self.pins) if self._loaded else 0,
+            "load_seconds": round(self.load_seconds, 4)
+        }
+
+gazetteer = Gazetteer()
+
+def geocode(address: str) -> Optional[dict]:
+    """
+    Geocode a city or PIN code address without calling OpenCage. Same
+    result shape as services.geocoding.geocode.
+    """
+    return gazetteer.lookup(address)
+
+def get_coordinates_from_address(address: str) -> Optional[Tuple[float, float]]:
+    """
+    Get latitude and longitude coordinates of a city or PIN code address
+    from the gazetteer.
+
+    Args:
+        address: The address to geocode
+
+    Returns:
+        A tuple of (latitude, longitude) or None if the gazetteer can't answer
+    """
+    result = gazetteer.lookup(address)
+    if result is None:
+        return None
+    return (result["latitude"], result["longitude"])
+
+def reverse_geocode(latitude: float, longitude: float) -> Optional[dict]:
+    """
+    Get address details of the nearest known place from the gazetteer.
+
+    Args:
+        latitude: Latitude coordinate
+        longitude: Longitude coordinate
+
+    Returns:
+        A dictionary with address details or None if no place is close enough
+    """
+    return gazetteer.reverse(latitude, longitude)
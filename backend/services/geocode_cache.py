@@ -0,0 +1,216 @@
+import hashlib
+import math
+import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import GeocodeCache, ReverseGeocodeCache
+from services.cache import TTLCache
+
+# How long a geocoded address is reused before it is looked up again
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+# Maximum number of addresses kept in the in-process LRU
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+# Reverse lookups are shared by all coordinates in a grid cell this many
+# degrees wide (0.001 degrees is about 110 m of latitude)
+REVERSE_GEOCODE_GRID_DEGREES = float(os.getenv("REVERSE_GEOCODE_GRID_DEGREES", "0.001"))
+# HTTP calls needed to geocode an address that isn't cached
+API_CALLS_PER_ADDRESS = 1
+
+# Fields stored for a geocoded address
+FIELDS = ("latitude", "longitude", "city", "state", "country", "formatted")
+# Fields stored for reverse geocoded coordinates
+REVERSE_FIELDS = ("city", "state", "country", "formatted")
+
+# Keyed by address key; in front of the geocode_cache table
+memory_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL)
+# Keyed by grid key; in front of the reverse_geocode_cache table
+reverse_memory_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL)
+
+_lock = threading.Lock()
+_counters = {"memory_hits": 0, "database_hits": 0, "misses": 0, "stored": 0}
+_reverse_counters = {"memory_hits": 0, "database_hits": 0, "misses": 0, "stored": 0}
+
+def normalize_address(address: str) -> str:
+    """
+    Normalize an address so that spelling variants share a cache entry:
+    Unicode compatibility forms, case, punctuation and whitespace are
+    ignored.
+    """
+    text = unicodedata.normalize("NFKC", address).casefold()
+    text = re.sub(r"[^\w\s/#-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def address_key(address: str) -> str:
+    """
+    Fixed-length cache key of an address (SHA-256 of its normalized form).
+    """
+    return hashlib.sha256(normalize_address(address).encode("utf-8")).hexdigest()
+
+def grid_key(latitude: float, longitude: float) -> str:
+    """
+    Cache key of the grid cell containing a point: the coordinates rounded
+    to REVERSE_GEOCODE_GRID_DEGREES, prefixed with the cell size so that
+    changing it doesn't reuse entries of another grid.
+    """
+    step = REVERSE_GEOCODE_GRID_DEGREES
+    return f"{step:g}:{round(latitude / step)}:{round(longitude / step)}"
+
+def _count(counter: str, counters: dict = _counters):
+    with _lock:
+        counters[counter] += 1
+
+def _lookup(db: Session, model, key_column, key: str, fields, cache: TTLCache, counters: dict) -> Optional[dict]:
+    entry = cache.get(key)
+    if entry is not None:
+        _count("memory_hits", counters)
+        return entry
+
+    try:
+        row = db.query(model).filter(key_column == key).first()
+    except Exception as e:
+        print(f"Error reading {model.__tablename__}: {e}")
+        row = None
+    now = datetime.utcnow()
+    if row is None or row.expires_at is None or row.expires_at <= now:
+        _count("misses", counters)
+        return None
+
+    _count("database_hits", counters)
+    entry = {field: getattr(row, field) for field in fields}
+    cache.set(key, entry, ttl=(row.expires_at - now).total_seconds())
+    return entry
+
+def _store(db: Session, model, key_column, key: str, fields, entry: dict, cache: TTLCache,
+           counters: dict, **columns):
+    now = datetime.utcnow()
+    values = {field: entry.get(field) for field in fields}
+    # A savepoint, so a failed write doesn't roll back the caller's changes;
+    # the row is committed with them
+    savepoint = db.begin_nested()
+    try:
+        row = db.query(model).filter(key_column == key).first()
+        if row is None:
+            row = model(**{key_column.key: key}, **columns)
+            db.add(row)
+        for field, value in values.items():
+            setattr(row, field, value)
+        row.created_at = now
+        row.expires_at = now + timedelta(seconds=GEOCODE_CACHE_TTL)
+        savepoint.commit()
+    except IntegrityError:
+        # Another request cached the same key first
+        savepoint.rollback()
+    except Exception as e:
+        print(f"Error writing {model.__tablename__}: {e}")
+        savepoint.rollback()
+    cache.set(key, values)
+    _count("stored", counters)
+
+def lookup(db: Session, address: str) -> Optional[dict]:
+    """
+    Get the cached geocoding result of an address.
+
+    The in-process LRU is checked first, then the geocode_cache table.
+    Expired rows count as misses.
+
+    Args:
+        db: Database session
+        address: Address as entered by the user
+
+    Returns:
+        Dictionary with latitude, longitude, city, state, country and
+        formatted, or None when the address has to be geocoded
+    """
+    return _lookup(db, GeocodeCache, GeocodeCache.address_key, address_key(address), FIELDS,
+                   memory_cache, _counters)
+
+def store(db: Session, address: str, entry: dict):
+    """
+    Cache the geocoding result of an address in the table and the LRU.
+
+    The row is written in a savepoint and committed with the caller's
+    transaction; a concurrent insert of the same address only rolls back
+    the savepoint.
+    """
+    _store(db, GeocodeCache, GeocodeCache.address_key, address_key(address), FIELDS, entry,
+           memory_cache, _counters, normalized_address=normalize_address(address)[:512])
+
+def lookup_reverse(db: Session, latitude: float, longitude: float) -> Optional[dict]:
+    """
+    Get the cached reverse geocoding result of the grid cell containing a
+    point, from the LRU or the reverse_geocode_cache table.
+
+    Args:
+        db: Database session
+        latitude: Latitude coordinate
+        longitude: Longitude coordinate
+
+    Returns:
+        Dictionary with city, state, country and formatted, or None when
+        the point has to be reverse geocoded
+    """
+    return _lookup(db, ReverseGeocodeCache, ReverseGeocodeCache.grid_key, grid_key(latitude, longitude),
+                   REVERSE_FIELDS, reverse_memory_cache, _reverse_counters)
+
+def store_reverse(db: Session, latitude: float, longitude: float, entry: dict):
+    """
+    Cache a reverse geocoding result for the grid cell containing a point.
+    Written like store, in the caller's transaction.
+    """
+    _store(db, ReverseGeocodeCache, ReverseGeocodeCache.grid_key, grid_key(latitude, longitude),
+           REVERSE_FIELDS, entry, reverse_memory_cache, _reverse_counters)
+
+def purge_expired(db: Session) -> int:
+    """
+    Delete expired rows from the geocode_cache and reverse_geocode_cache
+    tables.
+
+    Returns:
+        Number of rows deleted
+    """
+    deleted = 0
+    for model in (GeocodeCache, ReverseGeocodeCache):
+        deleted += db.query(model).filter(
+            model.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def reset_stats():
+    with _lock:
+        for counters in (_counters, _reverse_counters):
+            for counter in counters:
+                counters[counter] = 0
+
+def _hit_stats(counters: dict, cache: TTLCache) -> dict:
+    hits = counters["memory_hits"] + counters["database_hits"]
+    lookups = hits + counters["misses"]
+    return {
+        **counters,
+        "lookups": lookups,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "api_calls_saved": hits * API_CALLS_PER_ADDRESS,
+        "memory": cache.stats()
+    }
+
+def stats() -> dict:
+    """
+    Cache hit rates and the geocoding API calls they saved, for addresses
+    and for reverse lookups.
+    """
+    with _lock:
+        counters = dict(_counters)
+        reverse_counters = dict(_reverse_counters)
+    return {
+        **_hit_stats(counters, memory_cache),
+        "reverse": {**_hit_stats(reverse_counters, reverse_memory_cache),
+                    "grid_degrees": REVERSE_GEOCODE_GRID_DEGREES}
+    }
@@ -1,110 +1,586 @@
+import asyncio
+import random
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Tuple, Optional
 import os
 from dotenv import load_dotenv
+from services.cache import SingleFlight
+from services.geocode_cache import normalize_address
 
 # Load environment variables
 load_dotenv()
 
 # Get API key from environment variables
 OPENCAGE_API_KEY = os.getenv("OPENCAGE_API_KEY")
+# Geocoding endpoint; point it at a local stand-in server for tests and benchmarks
+OPENCAGE_BASE_URL = os.getenv("OPENCAGE_BASE_URL", "https://api.opencagedata.com/geocode/v1/json")
+# Seconds to wait for the geocoding service before giving up
+GEOCODING_TIMEOUT = float(os.getenv("GEOCODING_TIMEOUT", "5"))
+# Requests per second and burst allowed by the OpenCage plan (the free
+# plan allows one request per second)
+OPENCAGE_RATE_PER_SECOND = float(os.getenv("OPENCAGE_RATE_PER_SECOND", "1"))
+OPENCAGE_BURST = int(os.getenv("OPENCAGE_BURST", "1"))
+# Retries after a 429, a 5xx or a connection error
+GEOCODING_MAX_RETRIES = int(os.getenv("GEOCODING_MAX_RETRIES", "3"))
+# Base of the exponential backoff between retries, in seconds
+GEOCODING_BACKOFF_SECONDS = float(os.getenv("GEOCODING_BACKOFF_SECONDS", "0.5"))
+# Keep-alive connections kept open to the geocoding service
+GEOCODING_POOL_SIZE = int(os.getenv("GEOCODING_POOL_SIZE", "10"))
+# Consecutive failed requests that open the circuit breaker
+GEOCODING_BREAKER_FAILURES = int(os.getenv("GEOCODING_BREAKER_FAILURES", "5"))
+# Seconds the circuit stays open before a probe request is let through
+GEOCODING_BREAKER_RESET_SECONDS = float(os.getenv("GEOCODING_BREAKER_RESET_SECONDS", "30"))
 
-def get_coordinates_from_address(address: str) -> Optional[Tuple[float, float]]:
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean the provider is unavailable to us: server errors,
+# rate limiting, and OpenCage's quota exceeded (402) and key disabled (403)
+UNAVAILABLE_STATUSES = RETRY_STATUSES | {402, 403}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling the provider while the circuit is open"""
+
+# Concurrent lookups of the same normalized address share one request
+single_flight = SingleFlight()
+
+class TokenBucket:
     """
-    Get latitude and longitude coordinates from an address using OpenCage Geocoding API.
-    
+    Token bucket rate limiter shared by threads and asyncio tasks.
+
+    Callers reserve a token and then wait until it becomes available, so
+    concurrent callers are spaced out instead of all retrying at once.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._clock = clock
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def reserve(self) -> float:
+        """
+        Take a token, possibly one that only becomes available later.
+
+        Returns:
+            Seconds to wait before using the token
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            wait = -self._tokens / self.rate
+            self.waits += 1
+            self.waited_seconds += wait
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Stops calling the geocoding provider after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and
+    calls are rejected without waiting on the provider. Once reset_seconds
+    have passed it is half-open: a single probe call is let through, which
+    closes the circuit if it succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = GEOCODING_BREAKER_FAILURES,
+                 reset_seconds: float = GEOCODING_BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected, without taking the probe"""
+        with self._lock:
+            state = self._current_state()
+            return state == OPEN or (state == HALF_OPEN and self._probing)
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe can be made"""
+        with self._lock:
+            if self._state == CLOSED:
+                return 0.0
+            return max(self.reset_seconds - (self._clock() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may be made; in the half-open state only the
+        first caller gets through, as the probe.
+        """
+        return self.acquire() is not None
+
+    def acquire(self) -> Optional[str]:
+        """
+        Like allow, but tells the probe apart from ordinary calls.
+
+        Returns:
+            CLOSED for an ordinary call, HALF_OPEN for the probe, or None
+            when the call is rejected
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return CLOSED
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return HALF_OPEN
+            self.rejected += 1
+            return None
+
+    def release_probe(self):
+        """
+        Count a probe that ended without a response (cancelled, or failed
+        with an unexpected error) as failed, so that another one is let
+        through after reset_seconds instead of the circuit staying open.
+        """
+        with self._lock:
+            if self._probing:
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                if self._state == CLOSED:
+                    self.trips += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+            self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_after_seconds": round(max(self.reset_seconds - (self._clock() - self._opened_at), 0.0), 3)
+                if state != CLOSED else 0.0
+            }
+
+class GeocodingClient:
+    """
+    Shared HTTP client for the geocoding service.
+
+    Connections are pooled and kept alive across calls. Every request is
+    rate limited, has a timeout, and is retried with jittered exponential
+    backoff on 429, 5xx and connection errors (honouring Retry-After up to
+    max_retry_delay, beyond which the call fails at once). Calls that still
+    fail count towards a circuit breaker; while it is open, calls raise
+    CircuitOpenError at once. The asyncio interface runs the blocking
+    request in a worker thread, so both interfaces share the pool, the
+    limiter and the breaker.
+    """
+
+    def __init__(self, base_url: str = OPENCAGE_BASE_URL, timeout: float = GEOCODING_TIMEOUT,
+                 max_retries: int = GEOCODING_MAX_RETRIES, backoff: float = GEOCODING_BACKOFF_SECONDS,
+                 rate: float = OPENCAGE_RATE_PER_SECOND, burst: int = OPENCAGE_BURST,
+                 pool_size: int = GEOCODING_POOL_SIZE, breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Longest Retry-After waited for; a longer one fails the call at once
+        # and the retry is left to the circuit breaker and the geocoding queue
+        self.max_retry_delay = max(backoff * 2 ** max_retries, timeout)
+        self.limiter = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "errors": 0, "rejected": 0}
+        # Remaining requests reported by OpenCage for the current period
+        self.rate_limit_remaining = None
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _send(self, params: dict, timeout: float) -> requests.Response:
+        self._count("requests")
+        response = self.session.get(self.base_url, params=params, timeout=timeout)
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.isdigit():
+            self.rate_limit_remaining = int(remaining)
+        return response
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> Optional[float]:
+        """
+        Seconds to wait before the next attempt, or None when Retry-After
+        asks for more than max_retry_delay.
+        """
+        if response is not None:
+            try:
+                retry_after = max(float(response.headers["Retry-After"]), 0.0)
+            except (KeyError, ValueError):
+                retry_after = None
+            if retry_after is not None:
+                return retry_after if retry_after <= self.max_retry_delay else None
+        # Full jitter: a random delay up to the exponential backoff
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _should_retry(self, attempt: int, response: Optional[requests.Response]) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUSES
+
+    def _check_breaker(self, attempt: int) -> bool:
+        # Retries stop as soon as another call has opened the circuit.
+        # Returns True when the call is the half-open probe.
+        admitted = self.breaker.state != OPEN if attempt else self.breaker.acquire()
+        if not admitted:
+            self._count("rejected")
+            raise CircuitOpenError("Geocoding circuit is open")
+        return admitted == HALF_OPEN
+
+    def _result(self, response: requests.Response) -> dict:
+        if response.status_code in UNAVAILABLE_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if not response.ok:
+            self._count("errors")
+        response.raise_for_status()
+        return response.json()
+
+    def _failed(self):
+        self._count("errors")
+        self.breaker.record_failure()
+
+    def get(self, params: dict, timeout: Optional[float] = None) -> dict:
+        """
+        Make a rate-limited GET request to the geocoding endpoint.
+
+        Args:
+            params: Query parameters
+            timeout: Seconds to wait for each attempt, defaults to the
+                client's timeout
+
+        Returns:
+            Decoded JSON response
+
+        Raises:
+            CircuitOpenError: Without making a request, while the circuit is open
+            requests.RequestException: After the last failed attempt
+        """
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        probe = False
+        try:
+            while True:
+                probe = self._check_breaker(attempt) or probe
+                self.limiter.acquire()
+                response = None
+                try:
+                    response = self._send(params, timeout)
+                except (requests.ConnectionError, requests.Timeout):
+                    if not self._should_retry(attempt, None):
+                        self._failed()
+                        raise
+                except requests.RequestException:
+                    self._failed()
+                    raise
+                if response is not None and not self._should_retry(attempt, response):
+                    return self._result(response)
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return self._result(response)
+                self._count("retries")
+                time.sleep(delay)
+                attempt += 1
+        except requests.RequestException:
+            # Already counted by the breaker
+            raise
+        except BaseException:
+            # Cancelled, or failed with an unexpected error: release the probe
+            if probe:
+                self.breaker.release_probe()
+            raise
+
+    async def get_async(self, params: dict, timeout: Optional[float] = None) -> dict:
+        """
+        asyncio version of get; waits for the limiter and between retries
+        without blocking the event loop.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        probe = False
+        try:
+            while True:
+                probe = self._check_breaker(attempt) or probe
+                await self.limiter.acquire_async()
+                response = None
+                try:
+                    response = await asyncio.to_thread(self._send, params, timeout)
+                except (requests.ConnectionError, requests.Timeout):
+                    if not self._should_retry(attempt, None):
+                        self._failed()
+                        raise
+                except requests.RequestException:
+                    self._failed()
+                    raise
+                if response is not None and not self._should_retry(attempt, response):
+                    return self._result(response)
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return self._result(response)
+                self._count("retries")
+                await asyncio.sleep(delay)
+                attempt += 1
+        except requests.RequestException:
+            # Already counted by the breaker
+            raise
+        except BaseException:
+            # Cancelled, or failed with an unexpected error: release the probe
+            if probe:
+                self.breaker.release_probe()
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "rate_limit_waits": self.limiter.waits,
+            "rate_limit_waited_seconds": round(self.limiter.waited_seconds, 3),
+            "rate_limit_remaining": self.rate_limit_remaining,
+            "breaker": self.breaker.stats()
+        }
+
+    def close(self):
+        self.session.close()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> GeocodingClient:
+    """
+    Get the shared geocoding client, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeocodingClient()
+        return _client
+
+def set_client(client: Optional[GeocodingClient]):
+    """
+    Replace the shared geocoding client, e.g. with one pointed at a local
+    stand-in server. Pass None to create a new one from the environment.
+    """
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None and previous is not client:
+        previous.close()
+
+def circuit_open() -> bool:
+    """
+    True while the geocoding provider is considered down and calls return
+    None without a request.
+    """
+    return get_client().breaker.is_open()
+
+def circuit_retry_after() -> float:
+    """
+    Seconds until the circuit breaker lets a probe request through.
+    """
+    return get_client().breaker.retry_after()
+
+def _address_details(result: dict) -> dict:
+    """
+    Extract the address components of an OpenCage result.
+    """
+    components = result["components"]
+    return {
+        "city": components.get("city") or components.get("town") or components.get("village"),
+        "state": components.get("state"),
+        "country": components.get("country"),
+        "formatted": result.get("formatted")
+    }
+
+def _geocode_result(address: str, data: dict) -> Optional[dict]:
+    if data["results"]:
+        # Get the first result
+        result = data["results"][0]
+        return {
+            "latitude": result["geometry"]["lat"],
+            "longitude": result["geometry"]["lng"],
+            **_address_details(result)
+        }
+    print(f"No results found for address: {address}")
+    return None
+
+def _geocode_params(address: str) -> dict:
+    return {
+        "q": address,
+        "key": OPENCAGE_API_KEY,
+        "limit": 1
+    }
+
+def _geocode(address: str, timeout: Optional[float]) -> Optional[dict]:
+    try:
+        data = get_client().get(_geocode_params(address), timeout=timeout)
+        return _geocode_result(address, data)
+    except CircuitOpenError:
+        return None
+    except requests.RequestException as e:
+        print(f"Error making request to geocoding service: {e}")
+        return None
+    except (KeyError, ValueError) as e:
+        print(f"Unexpected response format from geocoding service: {e}")
+        return None
+
+async def _geocode_async(address: str, timeout: Optional[float]) -> Optional[dict]:
+    try:
+        data = await get_client().get_async(_geocode_params(address), timeout=timeout)
+        return _geocode_result(address, data)
+    except CircuitOpenError:
+        return None
+    except requests.RequestException as e:
+        print(f"Error making request to geocoding service: {e}")
+        return None
+    except (KeyError, ValueError) as e:
+        print(f"Unexpected response format from geocoding service: {e}")
+        return None
+
+def geocode(address: str, timeout: Optional[float] = None) -> Optional[dict]:
+    """
+    Geocode an address with a single OpenCage request. The forward result
+    already contains the address components, so no reverse lookup is needed.
+    Callers asking for the same normalized address while a request is in
+    flight (from threads or asyncio tasks) wait for it and share its result.
+
     Args:
         address: The address to geocode
-        
+        timeout: Seconds to wait for each attempt, defaults to GEOCODING_TIMEOUT
+
     Returns:
-        A tuple of (latitude, longitude) or None if geocoding failed
+        A dictionary with latitude, longitude, city, state, country and
+        formatted, or None if geocoding failed or the circuit is open
     """
     if not OPENCAGE_API_KEY:
         print("Warning: OPENCAGE_API_KEY not found in environment variables")
         return None
-        
-    try:
-        # Make request to OpenCage Geocoding API
-        url = f"https://api.opencagedata.com/geocode/v1/json"
-        params = {
-            "q": address,
-            "key": OPENCAGE_API_KEY,
-            "limit": 1
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data["results"]:
-            # Get the first result
-            result = data["results"][0]
-            lat = result["geometry"]["lat"]
-            lng = result["geometry"]["lng"]
-            return (lat, lng)
-        else:
-            print(f"No results found for address: {address}")
-            return None
-            
-    except requests.RequestException as e:
-        print(f"Error making request to geocoding service: {e}")
+
+    return single_flight.do(normalize_address(address), _geocode, address, timeout)
+
+async def geocode_async(address: str, timeout: Optional[float] = None) -> Optional[dict]:
+    """
+    asyncio version of geocode.
+    """
+    if not OPENCAGE_API_KEY:
+        print("Warning: OPENCAGE_API_KEY not found in environment variables")
         return None
-    except KeyError as e:
-        print(f"Unexpected response format from geocoding service: {e}")
+
+    return await single_flight.do_async(normalize_address(address), _geocode_async, address, timeout)
+
+def get_coordinates_from_address(address: str) -> Optional[Tuple[float, float]]:
+    """
+    Get latitude and longitude coordinates from an address using OpenCage Geocoding API.
+
+    Args:
+        address: The address to geocode
+
+    Returns:
+        A tuple of (latitude, longitude) or None if geocoding failed
+    """
+    result = geocode(address)
+    if result is None:
         return None
+    return (result["latitude"], result["longitude"])
 
 def reverse_geocode(latitude: float, longitude: float) -> Optional[dict]:
     """
     Get address details from latitude and longitude coordinates using OpenCage Geocoding API.
-    
+
     Args:
         latitude: Latitude coordinate
         longitude: Longitude coordinate
-        
+
     Returns:
         A dictionary with address details or None if reverse geocoding failed
     """
     if not OPENCAGE_API_KEY:
         print("Warning: OPENCAGE_API_KEY not found in environment variables")
         return None
-        
+
     try:
-        # Make request to OpenCage Geocoding API
-        url = f"https://api.opencagedata.com/geocode/v1/json"
-        params = {
+        data = get_client().get({
             "q": f"{latitude},{longitude}",
             "key": OPENCAGE_API_KEY,
             "limit": 1
-        }
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        
+        })
+
         if data["results"]:
             # Get the first result
             result = data["results"][0]
-            components = result["components"]
-            
+
             # Extract relevant address components
-            address_details = {
-                "city": components.get("city") or components.get("town") or components.get("village"),
-                "state": components.get("state"),
-                "country": components.get("country"),
-                "formatted": result.get("formatted")
-            }
-            
-            return address_details
+            return _address_details(result)
         else:
             print(f"No results found for coordinates: {latitude}, {longitude}")
             return None
-            
+
+    except CircuitOpenError:
+        return None
     except requests.RequestException as e:
         print(f"Error making request to geocoding service: {e}")
         return None
-    except KeyError as e:
+    except (KeyError, ValueError) as e:
         print(f"Unexpected response format from geocoding service: {e}")
         return None
 
@@ -112,8 +588,8 @@ def reverse_geocode(latitude: float, longitude: float) -> Optional[dict]:
 # coordinates = get_coordinates_from_address("New Delhi, India")
 # if coordinates:
 #     print(f"Coordinates: {coordinates}")
-#     
+#
 #     # Reverse geocode to get address details
 #     address_details = reverse_geocode(coordinates[0], coordinates[1])
 #     if address_details:
-#         print(f"Address details: {address_details}")
\ No newline at end of file
+#         print(f"Address details: {address_details}")
@@ -0,0 +1,337 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+from models import GeocodingJob
+from services import gazetteer, geocoding, location, principals, recommendations
+
+# Geocode addresses in background threads; set to false to geocode inside
+# the request as before
+GEOCODING_ASYNC = os.getenv("GEOCODING_ASYNC", "true").lower() in ("1", "true", "yes")
+# Number of geocoding worker threads
+GEOCODING_WORKERS = int(os.getenv("GEOCODING_WORKERS", "4"))
+# Failed lookups are retried this many times in total
+GEOCODING_MAX_ATTEMPTS = int(os.getenv("GEOCODING_MAX_ATTEMPTS", "3"))
+# Delay before the first retry, doubled for every further attempt
+GEOCODING_RETRY_SECONDS = float(os.getenv("GEOCODING_RETRY_SECONDS", "30"))
+# Running jobs not updated for this long are assumed to belong to a dead process
+GEOCODING_STALE_SECONDS = float(os.getenv("GEOCODING_STALE_SECONDS", "600"))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+ENTITY_MODELS = {
+    "user": models.User,
+    "waste_listing": models.WasteListing,
+}
+
+def _entity_type(db_obj) -> str:
+    return "user" if isinstance(db_obj, models.User) else "waste_listing"
+
+class GeocodingQueue:
+    """
+    Geocodes user and waste listing addresses off the request path.
+
+    Every address gets a row in geocoding_jobs before it is handed to a
+    thread pool, so jobs interrupted by a restart are picked up again by
+    resume_pending. Workers claim a job by moving it from pending to
+    running in a single UPDATE, so a job is never processed twice at once.
+    While the geocoding circuit breaker is open, jobs are deferred until
+    it lets a probe through, without using up an attempt.
+    """
+
+    def __init__(self, workers: int = GEOCODING_WORKERS, max_attempts: int = GEOCODING_MAX_ATTEMPTS,
+                 retry_seconds: float = GEOCODING_RETRY_SECONDS, asynchronous: bool = GEOCODING_ASYNC):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.asynchronous = asynchronous
+        self._executor = None
+        self._closed = False
+        self._timers = set()
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._idle = threading.Condition(self._lock)
+        self._counters = {"enqueued": 0, "done": 0, "failed": 0, "retried": 0, "deferred": 0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("geocoding queue is shut down")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="geocoding")
+            return self._executor
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def enqueue(self, db: Session, db_obj, address: str) -> GeocodingJob:
+        """
+        Record a geocoding job for a committed user or waste listing and start
+        it in the background (or run it now when not asynchronous).
+
+        The object's geocoding_status is set to pending and committed before
+        the job starts.
+
+        Args:
+            db: Database session
+            db_obj: User or WasteListing to geocode
+            address: Address to geocode
+
+        Returns:
+            The job
+        """
+        now = datetime.utcnow()
+        job = GeocodingJob(entity_type=_entity_type(db_obj), entity_id=db_obj.id, address=address,
+                           status=PENDING, attempts=0, created_at=now, updated_at=now)
+        db.add(job)
+        db_obj.geocoding_status = PENDING
+        db.commit()
+        self._count("enqueued")
+
+        if self.asynchronous:
+            self.submit(job.id, db.get_bind())
+        else:
+            self._process(db, job.id)
+            db.refresh(db_obj)
+        return job
+
+    def submit(self, job_id: int, bind, delay: float = 0.0):
+        """
+        Process a job on a worker thread, optionally after a delay.
+        """
+        with self._lock:
+            self._outstanding += 1
+        if delay > 0:
+            timer = threading.Timer(delay, self._start_delayed, args=(job_id, bind))
+            timer.args += (timer,)
+            timer.daemon = True
+            with self._lock:
+                self._timers.add(timer)
+            timer.start()
+        else:
+            self._start(job_id, bind)
+
+    def _start_delayed(self, job_id: int, bind, timer: threading.Timer):
+        with self._lock:
+            self._timers.discard(timer)
+        self._start(job_id, bind)
+
+    def _start(self, job_id: int, bind):
+        try:
+            self._get_executor().submit(self._run, job_id, bind)
+        except RuntimeError as e:
+            # The executor was shut down; resume_pending picks the job up later
+            print(f"Geocoding job {job_id} not started: {e}")
+            self._finished()
+
+    def _finished(self):
+        with self._lock:
+            self._outstanding -= 1
+            if self._outstanding <= 0:
+                self._idle.notify_all()
+
+    def _run(self, job_id: int, bind):
+        db = sessionmaker(autocommit=False, autoflush=False, bind=bind)()
+        try:
+            self._process(db, job_id, bind)
+        except Exception as e:
+            print(f"Error processing geocoding job {job_id}: {e}")
+            db.rollback()
+            self._release(db, job_id, bind, str(e))
+        finally:
+            db.close()
+            self._finished()
+
+    def _process(self, db: Session, job_id: int, bind=None):
+        # Claim the job; another worker or process may have taken it
+        now = datetime.utcnow()
+        claimed = db.query(GeocodingJob).filter(
+            GeocodingJob.id == job_id,
+            GeocodingJob.status == PENDING
+        ).update({
+            GeocodingJob.status: RUNNING,
+            GeocodingJob.attempts: GeocodingJob.attempts + 1,
+            GeocodingJob.updated_at: now
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return
+
+        job = db.query(GeocodingJob).filter(GeocodingJob.id == job_id).first()
+        model = ENTITY_MODELS[job.entity_type]
+        db_obj = db.query(model).filter(model.id == job.entity_id).first()
+        if db_obj is None:
+            job.status = FAILED
+            job.last_error = f"{job.entity_type} {job.entity_id} no longer exists"
+            job.updated_at = datetime.utcnow()
+            db.commit()
+            self._count("failed")
+            return
+
+        previous_position = (db_obj.latitude, db_obj.longitude)
+        entry = location.geocode_address(db, job.address)
+        job.updated_at = datetime.utcnow()
+        if entry:
+            location.apply_geocoding_result(db_obj, entry, job.address)
+            db_obj.geocoding_status = DONE
+            job.status = DONE
+            job.last_error = None
+            db.commit()
+            self._count("done")
+            location.location_changed(db, db_obj, previous_position)
+            if isinstance(db_obj, models.WasteListing):
+                # Candidates are scored once the listing has coordinates
+                recommendations.refresh_listing_candidates(db, db_obj.id)
+            return
+
+        if geocoding.circuit_open():
+            self._defer(db, job, db_obj, bind or db.get_bind())
+            return
+
+        job.last_error = "No geocoding result"
+        self._retry_or_fail(db, job, db_obj, bind)
+
+    def _retry_or_fail(self, db: Session, job: GeocodingJob, db_obj, bind):
+        # Retry with exponential backoff until max_attempts is used up
+        if job.attempts < self.max_attempts and bind is not None:
+            delay = self.retry_seconds * 2 ** (job.attempts - 1)
+            job.status = PENDING
+            job.next_attempt_at = job.updated_at + timedelta(seconds=delay)
+            db.commit()
+            self._count("retried")
+            self.submit(job.id, bind, delay=delay)
+        else:
+            job.status = FAILED
+            if db_obj is not None:
+                db_obj.geocoding_status = FAILED
+            db.commit()
+            self._count("failed")
+            if isinstance(db_obj, models.User):
+                principals.invalidate(db_obj.email)
+            if isinstance(db_obj, models.WasteListing):
+                # Still matched, by city or against every composter
+                recommendations.refresh_listing_candidates(db, db_obj.id)
+
+    def _release(self, db: Session, job_id: int, bind, error: str):
+        # A job that raised after it was claimed would otherwise stay running
+        # until it is considered stale; retry or fail it like a failed lookup
+        try:
+            job = db.query(GeocodingJob).filter(
+                GeocodingJob.id == job_id,
+                GeocodingJob.status == RUNNING
+            ).first()
+            if job is None:
+                return
+            model = ENTITY_MODELS[job.entity_type]
+            db_obj = db.query(model).filter(model.id == job.entity_id).first()
+            job.last_error = error[:512]
+            job.updated_at = datetime.utcnow()
+            self._retry_or_fail(db, job, db_obj, bind)
+        except Exception as e:
+            print(f"Error releasing geocoding job {job_id}: {e}")
+            db.rollback()
+
+    def _defer(self, db: Session, job: GeocodingJob, db_obj, bind):
+        # Spread the deferred jobs out after the breaker's probe, so they
+        # don't all hit the provider the moment it recovers
+        delay = geocoding.circuit_retry_after() + random.uniform(0, self.retry_seconds)
+        job.status = PENDING
+        job.attempts -= 1
+        job.last_error = "Geocoding provider unavailable"
+        job.next_attempt_at = job.updated_at + timedelta(seconds=delay)
+        # Until then, locate new entities to their PIN code or city
+        approximate = None
+        if db_obj.latitude is None or db_obj.longitude is None:
+            approximate = gazetteer.gazetteer.approximate(job.address)
+        if approximate:
+            db_obj.latitude = approximate["latitude"]
+            db_obj.longitude = approximate["longitude"]
+            for field in ("city", "state", "country"):
+                if not getattr(db_obj, field):
+                    setattr(db_obj, field, approximate[field])
+        db.commit()
+        self._count("deferred")
+        if approximate:
+            location.location_changed(db, db_obj, (None, None))
+            if isinstance(db_obj, models.WasteListing):
+                recommendations.refresh_listing_candidates(db, db_obj.id)
+        self.submit(job.id, bind, delay=delay)
+
+    def resume_pending(self, bind) -> int:
+        """
+        Start the jobs left pending by a previous process, including running
+        jobs that stopped being updated. Call once at startup.
+
+        Returns:
+            Number of jobs started
+        """
+        db = sessionmaker(autocommit=False, autoflush=False, bind=bind)()
+        try:
+            now = datetime.utcnow()
+            db.query(GeocodingJob).filter(
+                GeocodingJob.status == RUNNING,
+                GeocodingJob.updated_at < now - timedelta(seconds=GEOCODING_STALE_SECONDS)
+            ).update({GeocodingJob.status: PENDING}, synchronize_session=False)
+            db.commit()
+            jobs = db.query(GeocodingJob.id, GeocodingJob.next_attempt_at).filter(
+                GeocodingJob.status == PENDING
+            ).order_by(GeocodingJob.id).all()
+        finally:
+            db.close()
+        for job_id, next_attempt_at in jobs:
+            delay = (next_attempt_at - now).total_seconds() if next_attempt_at else 0.0
+            self.submit(job_id, bind, delay=max(delay, 0.0))
+        return len(jobs)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until no jobs are queued, running or waiting for a retry.
+
+        Returns:
+            False if the timeout expired first
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: self._outstanding <= 0, timeout=timeout)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers and cancel the pending retries, which stay pending
+        in geocoding_jobs for resume_pending. No jobs are started afterwards.
+        """
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            timer.cancel()
+            self._finished()
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self, db: Optional[Session] = None) -> dict:
+        """
+        In-process counters, and job counts by status when a session is given.
+        """
+        with self._lock:
+            result = {**self._counters, "outstanding": self._outstanding,
+                      "workers": self.workers, "asynchronous": self.asynchronous}
+        if db is not None:
+            result["jobs"] = dict(db.query(GeocodingJob.status, func.count(GeocodingJob.id)).group_by(
+                GeocodingJob.status
+            ).all())
+        return result
+
+geocoding_queue = GeocodingQueue()
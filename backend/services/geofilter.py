@@ -0,0 +1,126 @@
+from typing import Callable, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, case, func, or_
+import numpy as np
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.matching import haversine_km
+
+# Kilometres per degree of latitude (and of longitude at the equator)
+KM_PER_DEGREE = 111.0
+
+def bounding_box(latitudes, longitudes, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    Get a latitude/longitude box containing every point within radius_km of
+    the given point, or of any of the given points.
+
+    Args:
+        latitudes: Latitude of the centre, or an array of latitudes
+        longitudes: Longitude of the centre, or an array of longitudes
+        radius_km: Search radius in km
+
+    Returns:
+        (min_lat, max_lat, min_lng, max_lng). Longitudes can fall outside
+        -180..180 when the box crosses the antimeridian.
+    """
+    latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))
+    longitudes = np.atleast_1d(np.asarray(longitudes, dtype=float))
+    lat_margin = radius_km / KM_PER_DEGREE
+    min_lat = max(float(latitudes.min()) - lat_margin, -90.0)
+    max_lat = min(float(latitudes.max()) + lat_margin, 90.0)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        # The circle reaches a pole, so it covers every longitude
+        return min_lat, max_lat, -180.0, 180.0
+    # Degrees of longitude shrink with the cosine of the latitude; use the
+    # latitude of the box furthest from the equator
+    cos_lat = np.cos(np.radians(max(abs(min_lat), abs(max_lat))))
+    lng_margin = radius_km / (KM_PER_DEGREE * max(cos_lat, 0.01))
+    min_lng = float(longitudes.min()) - lng_margin
+    max_lng = float(longitudes.max()) + lng_margin
+    if max_lng - min_lng >= 360.0:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lng, max_lng
+
+def bbox_filter(latitude_column, longitude_column, latitudes, longitudes, radius_km: float):
+    """
+    Build a SQL predicate keeping rows inside the bounding box of a radius
+    around one or more points.
+
+    Only BETWEEN comparisons are used, so the predicate works on SQLite and
+    MySQL and can use the (role/status, latitude, longitude) indexes when
+    combined with an equality filter on the leading column. Rows without
+    coordinates never match.
+
+    Args:
+        latitude_column: Latitude column, e.g. User.latitude
+        longitude_column: Longitude column, e.g. User.longitude
+        latitudes: Latitude of the centre, or an array of latitudes
+        longitudes: Longitude of the centre, or an array of longitudes
+        radius_km: Search radius in km
+
+    Returns:
+        SQLAlchemy boolean expression
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitudes, longitudes, radius_km)
+    latitude_range = latitude_column.between(min_lat, max_lat)
+    if min_lng < -180.0:
+        # Split the box at the antimeridian
+        return and_(latitude_range, or_(longitude_column.between(min_lng + 360.0, 180.0),
+                                        longitude_column.between(-180.0, max_lng)))
+    if max_lng > 180.0:
+        return and_(latitude_range, or_(longitude_column.between(min_lng, 180.0),
+                                        longitude_column.between(-180.0, max_lng - 360.0)))
+    return and_(latitude_range, longitude_column.between(min_lng, max_lng))
+
+def approximate_distance(latitude_column, longitude_column, latitude: float, longitude: float):
+    """
+    Build a SQL expression that orders rows by their distance to a point.
+
+    The value is the squared equirectangular distance in degrees, using
+    only arithmetic, ABS and CASE so it runs on SQLite and MySQL. Within a
+    search radius it ranks rows almost exactly like the great-circle
+    distance; use within_radius for the exact distances.
+
+    Args:
+        latitude_column: Latitude column, e.g. WasteListing.latitude
+        longitude_column: Longitude column, e.g. WasteListing.longitude
+        latitude: Latitude of the centre
+        longitude: Longitude of the centre
+
+    Returns:
+        SQLAlchemy numeric expression
+    """
+    cos_lat = float(np.cos(np.radians(latitude)))
+    delta_lat = latitude_column - latitude
+    delta_lng = func.abs(longitude_column - longitude)
+    # The short way round across the antimeridian
+    delta_lng = case((delta_lng > 180.0, 360.0 - delta_lng), else_=delta_lng) * cos_lat
+    return delta_lat * delta_lat + delta_lng * delta_lng
+
+def within_radius(rows: Iterable, latitude: float, longitude: float, radius_km: float,
+                  coordinates: Optional[Callable] = None) -> List[Tuple[object, float]]:
+    """
+    Compute exact distances for rows that survived a bounding box filter and
+    keep those within the radius.
+
+    Args:
+        rows: Rows or objects with latitude and longitude attributes
+        latitude: Latitude of the centre
+        longitude: Longitude of the centre
+        radius_km: Search radius in km
+        coordinates: Function returning (latitude, longitude) for a row,
+            defaults to its latitude and longitude attributes
+
+    Returns:
+        List of (row, distance_km) tuples, closest first
+    """
+    if coordinates is None:
+        coordinates = lambda row: (row.latitude, row.longitude)
+    located = [row for row in rows if all(coordinates(row))]
+    if not located:
+        return []
+    points = np.array([coordinates(row) for row in located], dtype=float)
+    distances = haversine_km(latitude, longitude, points[:, 0], points[:, 1])
+    order = np.argsort(distances, kind="stable")
+    return [(located[i], float(distances[i])) for i in order if distances[i] <= radius_km]
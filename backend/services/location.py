@@ -1,48 +1,164 @@
+from typing import Optional
 from sqlalchemy.orm import Session
 # Use absolute imports instead of relative imports
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
-from services.geocoding import get_coordinates_from_address, reverse_geocode
+from services.geocoding import geocode, reverse_geocode
+from services.spatial_index import composter_index
+from services import geocode_cache
+from services import gazetteer
+from services import recommendations
+from services import principals
+
+def geocode_address(db: Session, address: str) -> Optional[dict]:
+    """
+    Get coordinates and address components for an address. City and PIN
+    code addresses are answered by the offline gazetteer; other addresses
+    come from the geocode cache when possible and from the geocoding API
+    otherwise.
+    
+    Args:
+        db: Database session
+        address: Address to geocode
+        
+    Returns:
+        Dictionary with latitude, longitude, city, state, country and
+        formatted, or None if geocoding failed
+    """
+    if gazetteer.GAZETTEER_ENABLED:
+        entry = gazetteer.geocode(address)
+        if entry is not None:
+            return entry
+    
+    entry = geocode_cache.lookup(db, address)
+    if entry is not None:
+        return entry
+    
+    # One request returns the coordinates and the address components
+    entry = geocode(address)
+    if entry:
+        geocode_cache.store(db, address, entry)
+    return entry
+
+def reverse_geocode_location(db: Session, latitude: float, longitude: float) -> Optional[dict]:
+    """
+    Get the city, state and country of a point. Points within the same
+    ~100 m grid cell share a cached result; uncached points are looked up
+    with the geocoding API, and the gazetteer's nearest city is used when
+    the API has no answer.
+    
+    Args:
+        db: Database session
+        latitude: Latitude coordinate
+        longitude: Longitude coordinate
+        
+    Returns:
+        Dictionary with city, state, country and formatted, or None
+    """
+    entry = geocode_cache.lookup_reverse(db, latitude, longitude)
+    if entry is not None:
+        return entry
+    
+    entry = reverse_geocode(latitude, longitude)
+    if entry:
+        geocode_cache.store_reverse(db, latitude, longitude, entry)
+        return entry
+    if gazetteer.GAZETTEER_ENABLED:
+        return gazetteer.reverse_geocode(latitude, longitude)
+    return None
+
+def fill_address_components(db: Session, db_obj) -> bool:
+    """
+    Fill in the missing city, state and country of a User or WasteListing
+    that has coordinates, without committing.
+    
+    Returns:
+        True if address components were found
+    """
+    if not (db_obj.latitude and db_obj.longitude):
+        return False
+    entry = reverse_geocode_location(db, db_obj.latitude, db_obj.longitude)
+    if not entry:
+        return False
+    for field in ("city", "state", "country"):
+        if not getattr(db_obj, field) and entry.get(field):
+            setattr(db_obj, field, entry[field])
+    return True
+
+def apply_geocoding_result(db_obj, entry: dict, address: str):
+    """
+    Copy a geocoding result onto a User or WasteListing object, without
+    committing.
+    
+    Args:
+        db_obj: User or WasteListing object to update
+        entry: Result of geocode_address
+        address: Address that was geocoded
+    """
+    db_obj.latitude = entry["latitude"]
+    db_obj.longitude = entry["longitude"]
+    db_obj.city = entry.get('city')
+    db_obj.state = entry.get('state')
+    db_obj.country = entry.get('country')
+    if hasattr(db_obj, 'pickup_location'):
+        if not db_obj.pickup_location:
+            db_obj.pickup_location = entry.get('formatted') or address
+    elif hasattr(db_obj, 'location') and not db_obj.location:
+        db_obj.location = entry.get('formatted') or address
 
 def populate_location_data(db: Session, db_obj, address: str = None):
     """
     Automatically populate location data (coordinates, city, state, country) 
-    from an address using geocoding services.
+    from an address using the geocode cache or geocoding services.
     
     Args:
         db: Database session
         db_obj: User or WasteListing object to update
         address: Address string to geocode (if not provided, uses obj.address)
+        
+    Returns:
+        True if location data was found
     """
     # Use provided address or object's address field
     addr = address or getattr(db_obj, 'address', None)
     
     if not addr:
-        return  # Nothing to geocode
+        return False  # Nothing to geocode
     
-    # Get coordinates from address
-    coordinates = get_coordinates_from_address(addr)
-    if coordinates:
-        lat, lng = coordinates
-        db_obj.latitude = lat
-        db_obj.longitude = lng
-        
-        # Get address details from coordinates
-        address_details = reverse_geocode(lat, lng)
-        if address_details:
-            db_obj.city = address_details.get('city')
-            db_obj.state = address_details.get('state')
-            db_obj.country = address_details.get('country')
-            if not db_obj.pickup_location and hasattr(db_obj, 'pickup_location'):
-                db_obj.pickup_location = address_details.get('formatted') or addr
-            elif not db_obj.location and hasattr(db_obj, 'location'):
-                db_obj.location = address_details.get('formatted') or addr
-                
-        # Commit changes to database
-        db.commit()
-        db.refresh(db_obj)
+    entry = geocode_address(db, addr)
+    if not entry:
+        return False
+    apply_geocoding_result(db_obj, entry, addr)
+    
+    # Commit changes to database
+    db.commit()
+    db.refresh(db_obj)
+    return True
+
+def location_changed(db: Session, db_obj, previous_position: Optional[tuple] = None):
+    """
+    Update the spatial index and recommendations after the coordinates of a
+    user or waste listing changed. Call after the change is committed.
+    
+    Args:
+        db: Database session
+        db_obj: User or WasteListing whose location changed
+        previous_position: Its (latitude, longitude) before the change
+    """
+    if isinstance(db_obj, models.User):
+        # Cached principals carry the user's location
+        principals.invalidate(db_obj.email)
+        # Keep the composter spatial index current
+        composter_index.upsert(db_obj)
+        if db_obj.role == models.Role.composter:
+            positions = [previous_position, (db_obj.latitude, db_obj.longitude)]
+            recommendations.invalidate_composter(db_obj.id, positions)
+            recommendations.mark_candidates_stale(db, positions=positions)
+    else:
+        recommendations.invalidate_listing(db_obj.id)
+        recommendations.mark_candidates_stale(db, waste_listing_ids=[db_obj.id])
 
 def update_user_location(db: Session, user_id: int, address: str):
     """
@@ -55,8 +171,10 @@ def update_user_location(db: Session, user_id: int, address: str):
     """
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if user:
+        previous_position = (user.latitude, user.longitude)
         user.address = address
         populate_location_data(db, user, address)
+        location_changed(db, user, previous_position)
         return user
     return None
 
@@ -73,5 +191,6 @@ def update_waste_listing_location(db: Session, listing_id: int, address: str):
     if listing:
         listing.address = address
         populate_location_data(db, listing, address)
+        location_changed(db, listing)
         return listing
-    return None
\ No newline at end of file
+    return None
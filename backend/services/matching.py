@@ -1,20 +1,61 @@
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import or_, func
+from typing import Dict, List, Optional, Tuple
 from geopy.distance import geodesic
+import numpy as np
 # Use absolute imports instead of relative imports
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import models
 from models import User, WasteListing
+from services.spatial_index import composter_index
+
+# Number of nearby composters to score per requested recommendation
+CANDIDATE_FACTOR = 5
+# Never score fewer nearby composters than this
+MIN_CANDIDATES = 50
+# Use geodesic distances instead of the vectorized haversine approximation
+PRECISE_DISTANCE = os.getenv("MATCHING_PRECISE_DISTANCE", "false").lower() == "true"
+
+# Mean earth radius used by the haversine formula
+EARTH_RADIUS_KM = 6371.0088
+# Upper bounds (inclusive) of the distance bands and the points for each band;
+# the last entry in the points list is for anything beyond the last band
+DISTANCE_BANDS_KM = np.array([5.0, 15.0, 30.0, 50.0])
+DISTANCE_POINTS = np.array([50.0, 35.0, 20.0, 10.0, 5.0])
+# Upper bounds (exclusive) of the load bands and the points for each band
+LOAD_BANDS = np.array([5, 10, 20])
+LOAD_POINTS = np.array([20.0, 15.0, 10.0, 5.0])
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distance from one point to many points.
+    
+    Args:
+        latitude: Latitude of the origin
+        longitude: Longitude of the origin
+        latitudes: Array of destination latitudes
+        longitudes: Array of destination longitudes
+        
+    Returns:
+        Array of distances in kilometers
+    """
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlng = np.radians(longitudes) - np.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
 
 class ComposterMatcher:
     """
     Service for matching waste listings with appropriate composters based on multiple factors
     """
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, precise: bool = PRECISE_DISTANCE):
         self.db = db
+        self.precise = precise
     
     def get_recommended_composters(self, waste_listing_id: int, limit: int = 10) -> List[User]:
         """
@@ -31,6 +72,16 @@ class ComposterMatcher:
         Returns:
             List of recommended composters sorted by relevance
         """
+        return [composter for composter, score in self.get_scored_composters(waste_listing_id, limit)]
+    
+    def get_scored_composters(self, waste_listing_id: int, limit: int = 10) -> List[Tuple[User, float]]:
+        """
+        Same as get_recommended_composters, but also returns each
+        composter's match score.
+        
+        Returns:
+            List of (composter, score) tuples sorted by score
+        """
         # Get the waste listing
         waste_listing = self.db.query(WasteListing).filter(
             WasteListing.id == waste_listing_id
@@ -39,24 +90,118 @@ class ComposterMatcher:
         if not waste_listing:
             return []
         
-        # Get all active composters
-        composters = self.db.query(User).filter(
+        # Get candidate composters (nearby ones when the listing is located)
+        composters = self._get_candidate_composters(waste_listing, limit)
+        
+        # Get the current load of every candidate in one query
+        loads = self._get_current_loads([composter.id for composter in composters])
+        
+        # Score all candidates at once based on multiple factors
+        scores = self._score_composters(waste_listing, composters, loads)
+        
+        # Sort by score (descending, stable) and return top matches,
+        # only including composters with some relevance
+        order = np.argsort(-scores, kind="stable")
+        return [(composters[i], float(scores[i])) for i in order if scores[i] > 0][:limit]
+    
+    def _score_composters(self, waste_listing: WasteListing, composters: List[User],
+                          loads: Dict[int, int]) -> np.ndarray:
+        """
+        Vectorized version of _calculate_match_score for many composters.
+        
+        Distance, waste type and load points are computed on NumPy arrays.
+        Composters without coordinates fall back to the same city/location
+        matching used by _calculate_match_score.
+        
+        Args:
+            waste_listing: Waste listing to match
+            composters: Composters to score
+            loads: Mapping of composter ID to active listing count
+            
+        Returns:
+            Array of scores in the same order as composters
+        """
+        count = len(composters)
+        scores = np.zeros(count)
+        if count == 0:
+            return scores
+        
+        # 1. Location proximity (up to 50 points)
+        latitudes = np.array([c.latitude or 0.0 for c in composters], dtype=float)
+        longitudes = np.array([c.longitude or 0.0 for c in composters], dtype=float)
+        located = (latitudes != 0.0) & (longitudes != 0.0)
+        if not (waste_listing.latitude and waste_listing.longitude):
+            located[:] = False
+        
+        if located.any():
+            if self.precise:
+                waste_coords = (waste_listing.latitude, waste_listing.longitude)
+                distances = np.array([
+                    geodesic(waste_coords, (lat, lng)).kilometers
+                    for lat, lng in zip(latitudes[located], longitudes[located])
+                ])
+            else:
+                distances = haversine_km(waste_listing.latitude, waste_listing.longitude,
+                                         latitudes[located], longitudes[located])
+            scores[located] = DISTANCE_POINTS[np.searchsorted(DISTANCE_BANDS_KM, distances, side="left")]
+        for i in np.flatnonzero(~located):
+            scores[i] = self._fallback_location_points(waste_listing, composters[i])
+        
+        # 2. Waste type compatibility (up to 30 points)
+        scores += 30 if waste_listing.waste_type == models.WasteType.ORGANIC else 10
+        
+        # 3. Composter capacity/load (up to 20 points)
+        current_loads = np.array([loads.get(c.id, 0) for c in composters])
+        scores += LOAD_POINTS[np.searchsorted(LOAD_BANDS, current_loads, side="right")]
+        
+        return scores
+    
+    def _get_candidate_composters(self, waste_listing: WasteListing, limit: int) -> List[User]:
+        """
+        Get the active composters worth scoring for a waste listing.
+
+        For a listing with coordinates, only composters found in expanding
+        rings of the spatial index are loaded, together with composters that
+        have no coordinates (they are scored by city/location matching).
+        Listings without coordinates still consider every active composter.
+        """
+        # Ordered by ID so that ties in score don't depend on the query plan
+        query = self.db.query(User).filter(
             User.role == "composter",
             User.is_active == True
-        ).all()
-        
-        # Score each composter based on multiple factors
-        scored_composters = []
-        for composter in composters:
-            score = self._calculate_match_score(waste_listing, composter)
-            if score > 0:  # Only include composters with some relevance
-                scored_composters.append((composter, score))
-        
-        # Sort by score (descending) and return top matches
-        scored_composters.sort(key=lambda x: x[1], reverse=True)
-        return [composter for composter, score in scored_composters[:limit]]
+        ).order_by(User.id)
+        if not (waste_listing.latitude and waste_listing.longitude):
+            return query.all()
+
+        composter_index.ensure_loaded(self.db)
+        candidate_ids = composter_index.nearby(
+            waste_listing.latitude,
+            waste_listing.longitude,
+            min_results=max(limit * CANDIDATE_FACTOR, MIN_CANDIDATES)
+        )
+        unlocated = or_(User.latitude == None, User.longitude == None)
+        if candidate_ids:
+            return query.filter(or_(User.id.in_(candidate_ids), unlocated)).all()
+        return query.filter(unlocated).all()
+
+    def _get_current_loads(self, composter_ids: List[int]) -> Dict[int, int]:
+        """
+        Read the active (available or pending pickup) listing count of each
+        composter from the composter_loads counters in a single query.
+        
+        Args:
+            composter_ids: IDs of the composters to count listings for
+            
+        Returns:
+            Mapping of composter ID to active listing count. Composters
+            without active listings are left out.
+        """
+        if not composter_ids:
+            return {}
+        return get_current_loads(self.db, composter_ids)
     
-    def _calculate_match_score(self, waste_listing: WasteListing, composter: User) -> float:
+    def _calculate_match_score(self, waste_listing: WasteListing, composter: User,
+                               current_load: Optional[int] = None) -> float:
         """
         Calculate a match score between a waste listing and a composter.
         
@@ -65,6 +210,12 @@ class ComposterMatcher:
         2. Waste type compatibility (0-30 points)
         3. Composter capacity (0-20 points)
         
+        Args:
+            waste_listing: Waste listing to match
+            composter: Composter to score
+            current_load: Number of active listings the composter already
+                handles. Looked up from the database when not provided.
+        
         Returns:
             Score between 0 and 100
         """
@@ -90,32 +241,8 @@ class ComposterMatcher:
                 score += 10
             else:  # More than 50 km
                 score += 5
-        elif waste_listing.city and composter.city:
-            # Fallback to city matching if coordinates aren't available
-            if waste_listing.city.lower() == composter.city.lower():
-                score += 50
-            elif (waste_listing.city.lower() in composter.city.lower() or
-                  composter.city.lower() in waste_listing.city.lower()):
-                score += 30
-            else:
-                # Try state matching
-                if (waste_listing.state and composter.state and 
-                    waste_listing.state.lower() == composter.state.lower()):
-                    score += 20
-                else:
-                    score += 10  # Some points for being in the system
         else:
-            # Fallback to simple string matching
-            if waste_listing.pickup_location and composter.location:
-                if waste_listing.pickup_location.lower() == composter.location.lower():
-                    score += 50
-                else:
-                    # Try to find partial matches
-                    if (waste_listing.pickup_location.lower() in composter.location.lower() or
-                        composter.location.lower() in waste_listing.pickup_location.lower()):
-                        score += 30
-                    else:
-                        score += 10  # Some points for being in the system
+            score += self._fallback_location_points(waste_listing, composter)
         
         # 2. Waste type compatibility (up to 30 points)
         # Organic waste should go to composters
@@ -128,13 +255,14 @@ class ComposterMatcher:
         
         # 3. Composter capacity/load (up to 20 points)
         # Check how many listings this composter is already handling
-        current_load = self.db.query(WasteListing).filter(
-            WasteListing.composter_id == composter.id,
-            WasteListing.status.in_([
-                models.WasteListingStatus.PENDING_PICKUP,
-                models.WasteListingStatus.AVAILABLE
-            ])
-        ).count()
+        if current_load is None:
+            current_load = self.db.query(WasteListing).filter(
+                WasteListing.composter_id == composter.id,
+                WasteListing.status.in_([
+                    models.WasteListingStatus.PENDING_PICKUP,
+                    models.WasteListingStatus.AVAILABLE
+                ])
+            ).count()
         
         # Composter with fewer listings gets higher score
         if current_load < 5:
@@ -147,8 +275,90 @@ class ComposterMatcher:
             score += 5  # Still some capacity, but limited
             
         return score
+    
+    def _fallback_location_points(self, waste_listing: WasteListing, composter: User) -> float:
+        """
+        Location points (0-50) when coordinates aren't available for both the
+        waste listing and the composter.
+        """
+        if waste_listing.city and composter.city:
+            # Fallback to city matching if coordinates aren't available
+            if waste_listing.city.lower() == composter.city.lower():
+                return 50
+            elif (waste_listing.city.lower() in composter.city.lower() or
+                  composter.city.lower() in waste_listing.city.lower()):
+                return 30
+            else:
+                # Try state matching
+                if (waste_listing.state and composter.state and 
+                    waste_listing.state.lower() == composter.state.lower()):
+                    return 20
+                else:
+                    return 10  # Some points for being in the system
+        else:
+            # Fallback to simple string matching
+            if waste_listing.pickup_location and composter.location:
+                if waste_listing.pickup_location.lower() == composter.location.lower():
+                    return 50
+                else:
+                    # Try to find partial matches
+                    if (waste_listing.pickup_location.lower() in composter.location.lower() or
+                        composter.location.lower() in waste_listing.pickup_location.lower()):
+                        return 30
+                    else:
+                        return 10  # Some points for being in the system
+        return 0
+
+def get_current_loads(db: Session, composter_ids: Optional[List[int]] = None) -> Dict[int, int]:
+    """
+    Read the active (available or pending pickup) listing counts of
+    composters from the composter_loads counter table.
+    
+    Args:
+        db: Database session
+        composter_ids: IDs of the composters to read, or None for every
+            composter
+        
+    Returns:
+        Mapping of composter ID to active listing count. Composters without
+        active listings may be left out.
+    """
+    query = db.query(models.ComposterLoad.composter_id, models.ComposterLoad.active_load)
+    if composter_ids is not None:
+        query = query.filter(models.ComposterLoad.composter_id.in_(composter_ids))
+    return {composter_id: load for composter_id, load in query.all()}
+
+def count_active_loads(db: Session, composter_ids: Optional[List[int]] = None) -> Dict[int, int]:
+    """
+    Count the active (available or pending pickup) listings of every
+    composter from waste_listings with a single grouped query. Used to
+    rebuild the composter_loads counters.
+    
+    Args:
+        db: Database session
+        composter_ids: IDs of the composters to count, or None for every
+            composter
+        
+    Returns:
+        Mapping of composter ID to active listing count. Composters without
+        active listings are left out.
+    """
+    query = db.query(
+        WasteListing.composter_id, func.count(WasteListing.id)
+    ).filter(
+        WasteListing.composter_id != None,
+        WasteListing.status.in_([
+            models.WasteListingStatus.PENDING_PICKUP,
+            models.WasteListingStatus.AVAILABLE
+        ])
+    )
+    if composter_ids is not None:
+        query = query.filter(WasteListing.composter_id.in_(composter_ids))
+    rows = query.group_by(WasteListing.composter_id).all()
+    return {composter_id: count for composter_id, count in rows}
 
-def get_recommended_composters(db: Session, waste_listing_id: int, limit: int = 10) -> List[User]:
+def get_recommended_composters(db: Session, waste_listing_id: int, limit: int = 10,
+                               precise: bool = PRECISE_DISTANCE) -> List[User]:
     """
     Convenience function to get recommended composters using the ComposterMatcher service.
     
@@ -156,9 +366,10 @@ def get_recommended_composters(db: Session, waste_listing_id: int, limit: int =
         db: Database session
         waste_listing_id: ID of the waste listing
         limit: Maximum number of recommendations to return
+        precise: Use geodesic distances instead of the haversine approximation
         
     Returns:
         List of recommended composters
     """
-    matcher = ComposterMatcher(db)
+    matcher = ComposterMatcher(db, precise=precise)
     return matcher.get_recommended_composters(waste_listing_id, limit)
\ No newline at end of file
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Optional, Tuple
+from passlib.context import CryptContext
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Threads that hash and verify passwords; bcrypt releases the GIL, so they
+# run in parallel with request handling. 0 hashes on the calling thread.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes waiting for a worker before new ones are refused with PasswordHasherBusy
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# passlib scheme for new passwords, e.g. bcrypt, pbkdf2_sha256, scrypt or
+# argon2 (needs argon2-cffi); benchmark_password_hash.py compares them
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+# Cost factor of the scheme (bcrypt log2 rounds, pbkdf2 iterations, ...);
+# empty keeps passlib's default. Stored hashes with another cost are
+# rehashed at the user's next login.
+PASSWORD_HASH_ROUNDS = os.getenv("PASSWORD_HASH_ROUNDS", "")
+# Schemes still accepted at login; their hashes are upgraded on success
+PASSWORD_HASH_LEGACY_SCHEMES = os.getenv("PASSWORD_HASH_LEGACY_SCHEMES", "bcrypt")
+
+def build_context(scheme: str = PASSWORD_HASH_SCHEME, rounds: Optional[int] = None,
+                  legacy_schemes: Iterable[str] = ()) -> CryptContext:
+    """
+    CryptContext that hashes with scheme at the given cost and still
+    verifies legacy_schemes. needs_update() is true for hashes of another
+    scheme or cost, in either direction, so lowering the cost also works.
+    """
+    schemes = [scheme] + [legacy for legacy in legacy_schemes if legacy and legacy != scheme]
+    options = {}
+    if rounds:
+        for option in ("default_rounds", "min_rounds", "max_rounds"):
+            options[f"{scheme}__{option}"] = rounds
+    return CryptContext(schemes=schemes, default=scheme, deprecated="auto", **options)
+
+pwd_context = build_context(
+    PASSWORD_HASH_SCHEME,
+    int(PASSWORD_HASH_ROUNDS) if PASSWORD_HASH_ROUNDS else None,
+    PASSWORD_HASH_LEGACY_SCHEMES.split(",")
+)
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when too many password hashes are already queued"""
+
+class PasswordHasher:
+    """
+    Bounded thread pool for bcrypt hashing and verification.
+
+    Keeps the CPU-heavy work off the event loop and caps how many hashes
+    run at once, so a burst of logins queues here instead of starving
+    other requests. Callers beyond max_pending are refused instead of
+    queueing without limit.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING,
+                 context: CryptContext = pwd_context):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.context = context
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._counters = {"completed": 0, "rejected": 0, "upgraded": 0}
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="password-hash")
+            return self._executor
+
+    def _run(self, queued_at: float, fn: Callable, *args):
+        waited = time.perf_counter() - queued_at
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._counters["completed"] += 1
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        Queue a call on the hashing threads.
+
+        Raises:
+            PasswordHasherBusy: If max_pending calls are already waiting
+        """
+        self._reserve()
+        if self.workers <= 0:
+            future = Future()
+            try:
+                future.set_result(self._run(time.perf_counter(), fn, *args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        try:
+            return self._get_executor().submit(self._run, time.perf_counter(), fn, *args)
+        except RuntimeError:
+            # The pool was shut down while the server is stopping
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters["rejected"] += 1
+                raise PasswordHasherBusy("Too many password checks in progress")
+            self._pending += 1
+
+    def hash(self, password: str) -> str:
+        return self.submit(self.context.hash, password).result()
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self.submit(self.context.verify, password, hashed_password).result()
+
+    def _verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        verified, new_hash = self.context.verify_and_update(password, hashed_password)
+        if new_hash is not None:
+            with self._lock:
+                self._counters["upgraded"] += 1
+        return verified, new_hash
+
+    def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return self.submit(self._verify_and_update, password, hashed_password).result()
+
+    async def verify_and_update_async(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await asyncio.wrap_future(self.submit(self._verify_and_update, password, hashed_password))
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit(self.context.hash, password))
+
+    async def verify_async(self, password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self.submit(self.context.verify, password, hashed_password))
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self._counters["completed"]
+            return {
+                "scheme": self.context.default_scheme(),
+                "workers": self.workers,
+                "queue_depth": self._pending,
+                "running": self._running,
+                "max_pending": self.max_pending,
+                **self._counters,
+                "mean_wait_ms": round(self._wait_seconds / completed * 1000, 3) if completed else 0.0,
+                "max_wait_ms": round(self._max_wait_seconds * 1000, 3)
+            }
+
+password_hasher = PasswordHasher()
+
+def hash_password(password: str) -> str:
+    """
+    Hash a password on the hashing threads, blocking the caller until done.
+    """
+    return password_hasher.hash(password)
+
+def verify_password(password: str, hashed_password: Optional[str]) -> bool:
+    """
+    Check a password against its hash on the hashing threads.
+    """
+    if not hashed_password:
+        return False
+    return password_hasher.verify(password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    """
+    asyncio version of hash_password.
+    """
+    return await password_hasher.hash_async(password)
+
+async def verify_password_async(password: str, hashed_password: Optional[str]) -> bool:
+    """
+    asyncio version of verify_password; the event loop keeps serving other
+    requests while the hash is checked.
+    """
+    if not hashed_password:
+        return False
+    return await password_hasher.verify_async(password, hashed_password)
+
+def verify_and_update_password(password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Check a password and, when its hash uses an outdated scheme or cost,
+    hash it again with the current settings.
+
+    Returns:
+        (verified, new hash to store or None)
+    """
+    if not hashed_password:
+        return False, None
+    return password_hasher.verify_and_update(password, hashed_password)
+
+async def verify_and_update_password_async(password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    asyncio version of verify_and_update_password.
+    """
+    if not hashed_password:
+        return False, None
+    return await password_hasher.verify_and_update_async(password, hashed_password)
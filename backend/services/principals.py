@@ -0,0 +1,82 @@
+from typing import Optional
+from sqlalchemy.orm import Session
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+import schemas
+from services.cache import TTLCache
+
+# Seconds an authenticated user is served from memory before it is read
+# from the database again
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+# Maximum number of users kept in the cache
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+# Keyed by token subject (the user's email)
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+def snapshot(user: models.User) -> schemas.User:
+    """
+    Detached copy of a user's columns. Unlike the ORM object it can be
+    shared between requests and sessions; it is not validated, so rows
+    with legacy role values still load.
+    """
+    return schemas.User.model_construct(**{field: getattr(user, field) for field in schemas.User.model_fields})
+
+def get_principal(db: Session, email: str) -> Optional[schemas.User]:
+    """
+    Get the user a token was issued to, from the cache when possible.
+
+    Args:
+        db: Database session
+        email: Token subject
+
+    Returns:
+        Snapshot of the user, or None if no user has this email
+    """
+    principal = principal_cache.get(email)
+    if principal is not None:
+        return principal
+    user = db.query(models.User).filter(models.User.email == email).first()
+    if user is None:
+        return None
+    principal = snapshot(user)
+    principal_cache.set(email, principal)
+    return principal
+
+def invalidate(email: Optional[str]) -> bool:
+    """
+    Drop a user from the cache after it was updated or deactivated. Other
+    worker processes pick up the change within PRINCIPAL_CACHE_TTL.
+    """
+    if not email:
+        return False
+    return principal_cache.delete(email)
+
+class ClaimsPrincipal:
+    """
+    Principal built from the signed token claims (sub, uid and role), so
+    endpoints that only need the user's id and role never touch the
+    database or the cache. Any other user field is loaded through
+    get_principal on first access.
+    """
+
+    def __init__(self, claims: dict, db: Session):
+        self.id = claims["uid"]
+        self.email = claims["sub"]
+        self.role = claims.get("role")
+        self.is_active = True
+        self._db = db
+        self._user = None
+
+    def __getattr__(self, name):
+        # Only called for attributes not set in __init__
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._user is None:
+            self._user = get_principal(self._db, self.email)
+            if self._user is None:
+                raise AttributeError(name)
+        return getattr(self._user, name)
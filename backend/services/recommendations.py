@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+import numpy as np
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+from models import ListingCandidate, WasteListing
+from services.cache import TTLCache
+from services.geofilter import bbox_filter
+from services.matching import ComposterMatcher, haversine_km, DISTANCE_BANDS_KM
+from services.spatial_index import composter_index
+
+# How long recommendations for a listing are reused
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))
+# Maximum number of cached recommendation lists
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "2048"))
+# A composter change can only affect distance points of listings within the
+# last distance band, so only cached listings this close are invalidated
+INVALIDATION_RADIUS_KM = float(DISTANCE_BANDS_KM[-1])
+
+# Number of top composters stored per listing in listing_candidates
+STORED_CANDIDATES = int(os.getenv("LISTING_CANDIDATES", "10"))
+# Stored candidates older than this are rescored even if not marked stale
+CANDIDATES_MAX_AGE = timedelta(seconds=float(os.getenv("LISTING_CANDIDATES_MAX_AGE", "3600")))
+
+# Listings that can still be matched with a composter
+OPEN_LISTING_STATUSES = [models.WasteListingStatus.AVAILABLE, models.WasteListingStatus.PENDING_PICKUP]
+
+# Keyed by (waste listing ID, limit); values hold the recommended composter
+# IDs and the listing's coordinates, used for targeted invalidation
+recommendation_cache = TTLCache(maxsize=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+
+def get_cached_recommendations(waste_listing_id: int, limit: int) -> Optional[List[int]]:
+    """
+    Get the cached recommended composter IDs for a listing, if any.
+    """
+    entry = recommendation_cache.get((waste_listing_id, limit))
+    return entry["composter_ids"] if entry is not None else None
+
+def store_recommendations(waste_listing, limit: int, composter_ids: List[int]):
+    """
+    Cache the recommended composter IDs for a listing.
+    """
+    recommendation_cache.set((waste_listing.id, limit), {
+        "composter_ids": composter_ids,
+        "latitude": waste_listing.latitude,
+        "longitude": waste_listing.longitude
+    })
+
+def _is_affected(entry: dict, composter_id: int, positions: List[Tuple[float, float]]) -> bool:
+    if composter_id in entry["composter_ids"]:
+        return True
+    if not (entry["latitude"] and entry["longitude"]):
+        # Listings without coordinates are matched against every composter
+        return True
+    for latitude, longitude in positions:
+        distance = haversine_km(entry["latitude"], entry["longitude"],
+                                np.array([latitude]), np.array([longitude]))[0]
+        if distance <= INVALIDATION_RADIUS_KM:
+            return True
+    return False
+
+def invalidate_listing(waste_listing_id: int) -> int:
+    """
+    Drop cached recommendations for a listing whose location or status changed.
+    """
+    return recommendation_cache.delete_where(lambda key, entry: key[0] == waste_listing_id)
+
+def invalidate_composter(composter_id: int, positions: Iterable[Optional[Tuple[float, float]]] = ()) -> int:
+    """
+    Drop cached recommendations that a composter change may affect: lists
+    that include the composter, and listings near any of the given
+    positions (for example its old and new location).
+    """
+    located = [p for p in positions if p and p[0] and p[1]]
+    if not located:
+        # Without a known position only lists including the composter are
+        # known to be affected, along with listings matched without coordinates
+        known = composter_index.position(composter_id)
+        if known:
+            located = [known]
+    return recommendation_cache.delete_where(
+        lambda key, entry: _is_affected(entry, composter_id, located)
+    )
+
+def invalidate(waste_listing_ids: Iterable[int] = (), composter_ids: Iterable[Optional[int]] = (),
+               db: Optional[Session] = None):
+    """
+    Invalidate recommendations after listing and composter load changes.
+    Call after the change is committed. When a session is given, the
+    stored candidates are marked stale as well.
+    """
+    waste_listing_ids = list(waste_listing_ids)
+    composter_ids = [composter_id for composter_id in set(composter_ids) if composter_id]
+    for waste_listing_id in waste_listing_ids:
+        invalidate_listing(waste_listing_id)
+    for composter_id in composter_ids:
+        invalidate_composter(composter_id)
+    if db is not None:
+        mark_candidates_stale(db, waste_listing_ids=waste_listing_ids, composter_ids=composter_ids)
+
+def mark_candidates_stale(db: Session, waste_listing_ids: Iterable[int] = (),
+                          composter_ids: Iterable[int] = (),
+                          positions: Iterable[Optional[Tuple[float, float]]] = ()):
+    """
+    Mark stored candidates stale so the refresh job rescores them.
+    
+    Args:
+        db: Database session
+        waste_listing_ids: Listings whose own location or status changed
+        composter_ids: Composters whose load changed; rows that include
+            them are marked. A load decrease can also lift a composter into
+            other listings' top candidates, which CANDIDATES_MAX_AGE catches.
+        positions: Positions a composter was created at, moved from or
+            moved to; rows of listings near them are marked
+    """
+    waste_listing_ids = list(waste_listing_ids)
+    composter_ids = list(composter_ids)
+    located = [p for p in positions if p and p[0] and p[1]]
+
+    conditions = []
+    if waste_listing_ids:
+        conditions.append(ListingCandidate.waste_listing_id.in_(waste_listing_ids))
+    if composter_ids:
+        conditions.append(ListingCandidate.composter_id.in_(composter_ids))
+    for latitude, longitude in located:
+        # Listings within the last distance band around the composter;
+        # only open listings are recommended composters
+        nearby = select(WasteListing.id).where(
+            WasteListing.status.in_(OPEN_LISTING_STATUSES),
+            bbox_filter(WasteListing.latitude, WasteListing.longitude,
+                        latitude, longitude, INVALIDATION_RADIUS_KM)
+        )
+        conditions.append(ListingCandidate.waste_listing_id.in_(nearby))
+    if not conditions:
+        return 0
+
+    marked = db.query(ListingCandidate).filter(
+        ListingCandidate.stale == False, or_(*conditions)
+    ).update({ListingCandidate.stale: True}, synchronize_session=False)
+    db.commit()
+    return marked
+
+def score_listing_candidates(db: Session, waste_listing_id: int, limit: int = STORED_CANDIDATES):
+    """
+    Score a listing's composters without storing anything, for reads that
+    find no usable stored candidates.
+    
+    Returns:
+        List of (composter, score) tuples, best first
+    """
+    return ComposterMatcher(db).get_scored_composters(waste_listing_id, limit)
+
+def refresh_listing_candidates(db: Session, waste_listing_id: int, limit: int = STORED_CANDIDATES):
+    """
+    Score a listing's composters and store the top ones in listing_candidates.
+    
+    Returns:
+        List of (composter, score) tuples that were stored
+    """
+    scored = score_listing_candidates(db, waste_listing_id, max(limit, STORED_CANDIDATES))
+    # Synchronize the session so that replaced rows loaded in it are
+    # removed before their primary keys are reused by the new ones
+    db.query(ListingCandidate).filter(
+        ListingCandidate.waste_listing_id == waste_listing_id
+    ).delete(synchronize_session="fetch")
+    now = datetime.utcnow()
+    db.add_all([
+        ListingCandidate(waste_listing_id=waste_listing_id, composter_id=composter.id,
+                         rank=rank, score=score, stale=False, computed_at=now)
+        for rank, (composter, score) in enumerate(scored)
+    ])
+    db.commit()
+    return scored
+
+def get_stored_candidates(db: Session, waste_listing_id: int, limit: int) -> Optional[List[int]]:
+    """
+    Read a listing's precomputed composter IDs, best first.
+    
+    Returns:
+        The composter IDs, or None when there are no usable stored
+        candidates (missing, stale, too old or fewer than requested)
+    """
+    rows = db.query(
+        ListingCandidate.composter_id, ListingCandidate.stale, ListingCandidate.computed_at
+    ).filter(
+        ListingCandidate.waste_listing_id == waste_listing_id
+    ).order_by(ListingCandidate.rank).all()
+    if not rows or limit > STORED_CANDIDATES:
+        return None
+    cutoff = datetime.utcnow() - CANDIDATES_MAX_AGE
+    if any(stale or (computed_at is not None and computed_at < cutoff) for _, stale, computed_at in rows):
+        return None
+    return [composter_id for composter_id, _, _ in rows[:limit]]
+
+def precompute_listing_candidates(waste_listing_id: int, session_factory: Optional[Callable[[], Session]] = None):
+    """
+    Background stage run after a listing is created and geocoded: score its
+    composters once so that reads only need the stored candidates.
+    """
+    if session_factory is None:
+        from database import SessionLocal as session_factory
+    db = session_factory()
+    try:
+        refresh_listing_candidates(db, waste_listing_id)
+    except Exception as e:
+        print(f"Error precomputing candidates for waste listing {waste_listing_id}: {e}")
+    finally:
+        db.close()
+
+def refresh_stale_candidates(db: Session, batch_size: int = 500, after_id: int = 0) -> List[int]:
+    """
+    Rescore open (available or pending pickup) listings whose stored
+    candidates are stale, too old or missing, in ID order.
+    
+    Args:
+        db: Database session
+        batch_size: Maximum number of listings to rescore
+        after_id: Only consider listings with a greater ID
+        
+    Returns:
+        IDs of the listings rescored
+    """
+    cutoff = datetime.utcnow() - CANDIDATES_MAX_AGE
+    needs_refresh = select(ListingCandidate.waste_listing_id).where(
+        or_(ListingCandidate.stale == True, ListingCandidate.computed_at < cutoff)
+    )
+    has_candidates = select(ListingCandidate.waste_listing_id)
+    listing_ids = [row.id for row in db.query(WasteListing.id).filter(
+        WasteListing.id > after_id,
+        WasteListing.status.in_(OPEN_LISTING_STATUSES),
+        or_(WasteListing.id.in_(needs_refresh), ~WasteListing.id.in_(has_candidates))
+    ).order_by(WasteListing.id).limit(batch_size).all()]
+    for waste_listing_id in listing_ids:
+        refresh_listing_candidates(db, waste_listing_id)
+        invalidate_listing(waste_listing_id)
+    return listing_ids
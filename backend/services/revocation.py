@@ -0,0 +1,218 @@
+import hashlib
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from sqlalchemy.orm import Session, sessionmaker
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import RevokedToken
+
+# Seconds between reloads of tokens revoked by other worker processes
+REVOCATION_RELOAD_SECONDS = float(os.getenv("REVOCATION_RELOAD_SECONDS", "5"))
+# Rows revoked this long before the last reload are read again, so rows
+# committed late by another process are not missed
+REVOCATION_RELOAD_OVERLAP_SECONDS = float(os.getenv("REVOCATION_RELOAD_OVERLAP_SECONDS", "60"))
+# Revoked tokens the Bloom filter is sized for; it is rebuilt larger when exceeded
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+# False positive rate of the Bloom filter; positives are confirmed in the exact set
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+
+def user_key(user_id: int) -> str:
+    """
+    Index entry that revokes every access token of a user, e.g. after the
+    user is deactivated. Stored like a jti; token ids never contain ":".
+    """
+    return f"user:{user_id}"
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    Answers "definitely not added" or "maybe added" with a constant number
+    of bit lookups; the bit positions come from one BLAKE2b digest split
+    into two 64-bit hashes (double hashing).
+    """
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def fill_ratio(self) -> float:
+        return sum(bin(byte).count("1") for byte in self._bits) / self.size
+
+class RevocationIndex:
+    """
+    In-memory set of revoked access token ids (jti claims).
+
+    Checks never touch the database: a Bloom filter rejects almost every
+    token that was not revoked, and its positives are confirmed in an exact
+    dict of jti to expiry. Revocations made in this process are added
+    straight away; those made by other worker processes are picked up by
+    reload(), which only reads rows revoked since the previous reload.
+    Expired entries are dropped by prune(), which rebuilds the filter.
+    """
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = REVOCATION_BLOOM_ERROR_RATE,
+                 overlap_seconds: float = REVOCATION_RELOAD_OVERLAP_SECONDS):
+        self.error_rate = error_rate
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._revoked: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._loaded_until: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._counters = {"checks": 0, "bloom_negatives": 0, "false_positives": 0, "revoked_hits": 0,
+                          "reloads": 0, "reload_errors": 0, "pruned": 0}
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        """
+        Check an access token id. O(1) and never blocks on the database.
+        """
+        self._counters["checks"] += 1
+        if not jti:
+            return False
+        if jti not in self._bloom:
+            self._counters["bloom_negatives"] += 1
+            return False
+        if jti in self._revoked:
+            self._counters["revoked_hits"] += 1
+            return True
+        self._counters["false_positives"] += 1
+        return False
+
+    def add(self, jti: str, expires_at: datetime):
+        with self._lock:
+            self._add(jti, expires_at)
+
+    def _add(self, jti: str, expires_at: datetime):
+        if jti in self._revoked:
+            return
+        if self._bloom.count >= self._bloom.capacity:
+            self._rebuild(capacity=self._bloom.capacity * 2)
+        self._revoked[jti] = expires_at
+        self._bloom.add(jti)
+
+    def _rebuild(self, capacity: Optional[int] = None):
+        bloom = BloomFilter(max(capacity or self._bloom.capacity, len(self._revoked)), self.error_rate)
+        for jti in self._revoked:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def load(self, rows: Iterable):
+        """
+        Add (jti, expires_at) pairs, skipping those that already expired.
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            for jti, expires_at in rows:
+                if expires_at > now:
+                    self._add(jti, expires_at)
+
+    def reload(self, db: Session) -> int:
+        """
+        Read tokens revoked since the previous reload (all unexpired ones on
+        the first call) and prune expired entries.
+
+        Returns:
+            Number of rows read
+        """
+        now = datetime.utcnow()
+        query = db.query(RevokedToken.jti, RevokedToken.expires_at).filter(RevokedToken.expires_at > now)
+        if self._loaded_until is not None:
+            query = query.filter(RevokedToken.revoked_at >= self._loaded_until - self.overlap)
+        rows = query.all()
+        self.load(rows)
+        self._loaded_until = now
+        self._counters["reloads"] += 1
+        self.prune(now)
+        return len(rows)
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """
+        Drop expired tokens; they are rejected by their exp claim anyway.
+        The filter is rebuilt once at least half of its entries are gone.
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            expired = [jti for jti, expires_at in self._revoked.items() if expires_at <= now]
+            for jti in expired:
+                del self._revoked[jti]
+            if expired and len(self._revoked) <= self._bloom.count // 2:
+                self._rebuild()
+            self._counters["pruned"] += len(expired)
+            return len(expired)
+
+    def start(self, bind, interval: float = REVOCATION_RELOAD_SECONDS):
+        """
+        Load the revoked tokens, then reload every interval seconds on a
+        background thread. Call once at startup.
+        """
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+
+        def reload_once():
+            db = Session()
+            try:
+                self.reload(db)
+            except Exception as e:
+                self._counters["reload_errors"] += 1
+                print(f"Error reloading revoked tokens: {e}")
+            finally:
+                db.close()
+
+        reload_once()
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                reload_once()
+
+        self._thread = threading.Thread(target=run, name="revocation-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def clear(self):
+        with self._lock:
+            self._revoked.clear()
+            self._bloom = BloomFilter(self._bloom.capacity, self.error_rate)
+            self._loaded_until = None
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self._revoked),
+            "bloom_bits": self._bloom.size,
+            "bloom_hashes": self._bloom.hashes,
+            "bloom_fill_ratio": round(self._bloom.fill_ratio(), 4),
+            "loaded_until": self._loaded_until.isoformat() if self._loaded_until else None,
+            **self._counters
+        }
+
+revocation_index = RevocationIndex()
@@ -0,0 +1,154 @@
+import time
+from typing import List, Optional
+from sqlalchemy.orm import Session
+import numpy as np
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+from models import User, WasteListing
+from services.matching import haversine_km
+
+# Time allowed for 2-opt improvement of a route
+TWO_OPT_TIME_BUDGET_SECONDS = float(os.getenv("ROUTE_TWO_OPT_BUDGET_SECONDS", "0.15"))
+
+def distance_matrix(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Pairwise great-circle distances in km between points.
+    """
+    return haversine_km(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :])
+
+def nearest_neighbour_tour(matrix: np.ndarray, start: int = 0) -> List[int]:
+    """
+    Build a tour starting at start by always visiting the closest unvisited point.
+    """
+    count = len(matrix)
+    visited = np.zeros(count, dtype=bool)
+    tour = [start]
+    visited[start] = True
+    current = start
+    for _ in range(count - 1):
+        distances = np.where(visited, np.inf, matrix[current])
+        current = int(np.argmin(distances))
+        visited[current] = True
+        tour.append(current)
+    return tour
+
+def two_opt(matrix: np.ndarray, tour: List[int], time_budget: float = TWO_OPT_TIME_BUDGET_SECONDS) -> List[int]:
+    """
+    Improve a closed tour by reversing segments while that shortens it.
+
+    The first point of the tour stays in place. For each edge, the gains of
+    all possible exchanges with later edges are computed at once.
+
+    Args:
+        matrix: Distance matrix
+        tour: Closed tour as a list of point indexes
+        time_budget: Stop improving after this many seconds
+
+    Returns:
+        The improved tour
+    """
+    tour = np.array(tour)
+    count = len(tour)
+    if count < 4:
+        return tour.tolist()
+
+    deadline = time.perf_counter() + time_budget
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(count - 2):
+            a, b = tour[i], tour[i + 1]
+            # Candidate second edges (c, d) for j in i+2 .. count-1
+            c = tour[i + 2:]
+            d = np.roll(tour, -1)[i + 2:]
+            gains = matrix[a, b] + matrix[c, d] - matrix[a, c] - matrix[b, d]
+            if i == 0:
+                # The last edge returns to the first point, adjacent to edge 0
+                gains[-1] = 0.0
+            best = int(np.argmax(gains))
+            if gains[best] > 1e-9:
+                j = i + 2 + best
+                tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+                improved = True
+    return tour.tolist()
+
+def plan_pickup_route(db: Session, composter: User, capacity_kg: Optional[float] = None) -> dict:
+    """
+    Plan the order in which a composter picks up their pending listings.
+
+    The route starts and ends at the composter's location when it is known.
+    A nearest-neighbour tour is improved with 2-opt, then split into trips
+    that return to the composter whenever the vehicle capacity would be
+    exceeded.
+
+    Args:
+        db: Database session
+        composter: Composter whose pending pickups are routed
+        capacity_kg: Vehicle capacity in kg, or None for a single trip
+
+    Returns:
+        Dictionary with the ordered stops, the number of trips, the total
+        distance in km and the IDs of listings without coordinates
+    """
+    listings = db.query(WasteListing).filter(
+        WasteListing.composter_id == composter.id,
+        WasteListing.status == models.WasteListingStatus.PENDING_PICKUP
+    ).order_by(WasteListing.id).all()
+
+    stops = [listing for listing in listings if listing.latitude and listing.longitude]
+    route = {
+        "stops": [],
+        "trips": 0,
+        "total_distance_km": 0.0,
+        "unrouted": [listing.id for listing in listings if not (listing.latitude and listing.longitude)]
+    }
+    if not stops:
+        return route
+
+    # Point 0 is the depot: the composter, or a virtual point at zero
+    # distance from every stop when the composter has no coordinates
+    has_depot = bool(composter.latitude and composter.longitude)
+    latitudes = np.array([composter.latitude if has_depot else 0.0] + [s.latitude for s in stops])
+    longitudes = np.array([composter.longitude if has_depot else 0.0] + [s.longitude for s in stops])
+    matrix = distance_matrix(latitudes, longitudes)
+    if not has_depot:
+        matrix[0, :] = 0.0
+        matrix[:, 0] = 0.0
+
+    tour = two_opt(matrix, nearest_neighbour_tour(matrix))
+
+    # Split the tour into trips that fit in the vehicle
+    trip = 1
+    load = 0.0
+    previous = 0
+    total_distance = 0.0
+    for point in tour[1:]:
+        stop = stops[point - 1]
+        quantity = stop.quantity or 0.0
+        if capacity_kg and load > 0 and load + quantity > capacity_kg:
+            # Go back to unload before this stop
+            total_distance += matrix[previous, 0]
+            previous = 0
+            trip += 1
+            load = 0.0
+        leg = float(matrix[previous, point])
+        total_distance += leg
+        load += quantity
+        previous = point
+        route["stops"].append({
+            "waste_listing_id": stop.id,
+            "title": stop.title,
+            "latitude": stop.latitude,
+            "longitude": stop.longitude,
+            "quantity": stop.quantity,
+            "trip": trip,
+            "leg_distance_km": round(leg, 3)
+        })
+    total_distance += matrix[previous, 0]
+
+    route["trips"] = trip
+    route["total_distance_km"] = round(float(total_distance), 3)
+    return route
@@ -0,0 +1,289 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session, sessionmaker
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import User
+
+# Size of a grid cell in degrees (0.1 deg is roughly 11 km of latitude)
+CELL_SIZE_DEG = float(os.getenv("COMPOSTER_INDEX_CELL_DEG", "0.1"))
+# Rebuild the index from the database after this many seconds so that changes
+# made by other worker processes are eventually picked up
+REFRESH_SECONDS = float(os.getenv("COMPOSTER_INDEX_REFRESH_SECONDS", "300"))
+
+def _is_located(latitude, longitude) -> bool:
+    # Mirrors the coordinate check used by the matching score
+    return bool(latitude and longitude)
+
+class ComposterGridIndex:
+    """
+    In-process spatial index of active composter coordinates.
+
+    Composters are bucketed into lat/lng grid cells so that candidate lookup
+    only touches the cells around a point instead of every composter.
+    """
+
+    def __init__(self, cell_size_deg: float = CELL_SIZE_DEG, refresh_seconds: float = REFRESH_SECONDS):
+        self.cell_size_deg = cell_size_deg
+        self.refresh_seconds = refresh_seconds
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = defaultdict(dict)
+        self._positions: Dict[int, Tuple[float, float]] = {}
+        # (min row, max row, min col, max col) of occupied cells, computed lazily
+        self._extent: Optional[Tuple[int, int, int, int]] = None
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        # Serializes rebuilds; changes made while one reads the database are
+        # recorded in _changes and applied to the new index
+        self._rebuild_lock = threading.Lock()
+        self._changes: Optional[list] = None
+        self._refreshing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (int(math.floor(latitude / self.cell_size_deg)),
+                int(math.floor(longitude / self.cell_size_deg)))
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._positions.clear()
+            self._extent = None
+            self._loaded_at = None
+
+    def rebuild(self, db: Session):
+        """
+        Rebuild the index from every active composter with coordinates.
+
+        Lookups keep using the current index while the composters are read,
+        and the new one replaces it in a single step.
+
+        Args:
+            db: Database session
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._changes = []
+            try:
+                rows = db.query(User.id, User.latitude, User.longitude).filter(
+                    User.role == "composter",
+                    User.is_active == True
+                ).all()
+                cells = defaultdict(dict)
+                positions = {}
+                for user_id, latitude, longitude in rows:
+                    if _is_located(latitude, longitude):
+                        positions[user_id] = (latitude, longitude)
+                        cells[self._cell(latitude, longitude)][user_id] = (latitude, longitude)
+                with self._lock:
+                    changes, self._changes = self._changes, None
+                    self._cells, self._positions, self._extent = cells, positions, None
+                    # Upserts made while the rows were read may be missing from them
+                    for change in changes:
+                        if change[0] == "remove":
+                            self.remove(change[1])
+                        else:
+                            self._insert(*change[1:])
+                    self._loaded_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._changes = None
+
+    def _rebuild_from(self, bind):
+        db = sessionmaker(autocommit=False, autoflush=False, bind=bind)()
+        try:
+            self.rebuild(db)
+        except Exception as e:
+            print(f"Error rebuilding the composter index: {e}")
+        finally:
+            db.close()
+
+    def _refresh(self, bind):
+        try:
+            self._rebuild_from(bind)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def ensure_loaded(self, db: Session):
+        """
+        Build the index on first use. Once it is older than the refresh
+        interval it is rebuilt on a background thread, and lookups use the
+        current index until the new one is ready.
+        """
+        with self._lock:
+            if self._loaded_at is not None:
+                if (time.monotonic() - self._loaded_at < self.refresh_seconds or
+                        self._refreshing or self._thread is not None):
+                    return
+                self._refreshing = True
+                threading.Thread(target=self._refresh, args=(db.get_bind(),),
+                                 name="composter-index-refresh", daemon=True).start()
+                return
+        self.rebuild(db)
+
+    def start(self, bind, interval: Optional[float] = None):
+        """
+        Build the index, then rebuild it every refresh interval on a
+        background thread. Call once at startup.
+        """
+        interval = self.refresh_seconds if interval is None else interval
+        self._rebuild_from(bind)
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self._rebuild_from(bind)
+
+        self._thread = threading.Thread(target=run, name="composter-index-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _insert(self, user_id: int, latitude: float, longitude: float):
+        if self._changes is not None:
+            self._changes.append(("insert", user_id, latitude, longitude))
+        self._positions[user_id] = (latitude, longitude)
+        self._extent = None
+        self._cells[self._cell(latitude, longitude)][user_id] = (latitude, longitude)
+
+    def add(self, item_id: int, latitude: float, longitude: float):
+        """
+        Add or move a point by id, regardless of role. Used to index plain
+        coordinate arrays.
+        """
+        with self._lock:
+            self.remove(item_id)
+            self._insert(item_id, latitude, longitude)
+
+    def position(self, user_id: int) -> Optional[Tuple[float, float]]:
+        """
+        Return the indexed (latitude, longitude) of a composter, if known.
+        """
+        return self._positions.get(user_id)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(("remove", user_id))
+            position = self._positions.pop(user_id, None)
+            if position is None:
+                return
+            cell = self._cell(*position)
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.pop(user_id, None)
+                if not bucket:
+                    del self._cells[cell]
+                    self._extent = None
+
+    def upsert(self, user: User):
+        """
+        Add, move or drop a user depending on their current role, status and
+        coordinates. Safe to call for any user.
+
+        Args:
+            user: User object that was created or relocated
+        """
+        with self._lock:
+            self.remove(user.id)
+            if (user.role == "composter" and user.is_active is not False and
+                    _is_located(user.latitude, user.longitude)):
+                self._insert(user.id, user.latitude, user.longitude)
+
+    def nearby(self, latitude: float, longitude: float, min_results: int) -> List[int]:
+        """
+        Return composter ids in expanding rings of cells around a point.
+
+        Rings are added until at least ``min_results`` composters have been
+        found, plus one extra ring so that composters just across a cell
+        corner are not missed. Ids are ordered by ring, nearest ring first.
+
+        Args:
+            latitude: Latitude of the search centre
+            longitude: Longitude of the search centre
+            min_results: Number of composters to collect before stopping
+
+        Returns:
+            List of composter ids
+        """
+        with self._lock:
+            if not self._cells:
+                return []
+            if self._extent is None:
+                rows = [cell[0] for cell in self._cells]
+                cols = [cell[1] for cell in self._cells]
+                self._extent = (min(rows), max(rows), min(cols), max(cols))
+            min_row, max_row, min_col, max_col = self._extent
+            center_row, center_col = self._cell(latitude, longitude)
+            # Beyond this ring there are no occupied cells left to visit
+            max_ring = max(
+                abs(center_row - min_row), abs(center_row - max_row),
+                abs(center_col - min_col), abs(center_col - max_col)
+            )
+
+            found: List[int] = []
+            extra_ring_done = False
+            ring = 0
+            while ring <= max_ring:
+                if 8 * ring > len(self._cells):
+                    # Rings are now larger than the set of occupied cells, so
+                    # walk the occupied cells ordered by ring instead
+                    return found + self._remaining_by_ring(center_row, center_col, ring,
+                                                           min_results - len(found), extra_ring_done)
+                for cell in self._ring_cells(center_row, center_col, ring):
+                    bucket = self._cells.get(cell)
+                    if bucket:
+                        found.extend(bucket.keys())
+                if len(found) >= min_results:
+                    if extra_ring_done:
+                        break
+                    extra_ring_done = True
+                ring += 1
+            return found
+
+    def _remaining_by_ring(self, center_row: int, center_col: int, start_ring: int,
+                           needed: int, extra_ring_done: bool) -> List[int]:
+        by_ring = defaultdict(list)
+        for (row, col), bucket in self._cells.items():
+            ring = max(abs(row - center_row), abs(col - center_col))
+            if ring >= start_ring:
+                by_ring[ring].extend(bucket.keys())
+
+        found: List[int] = []
+        # The ring about to be visited is already the extra ring
+        stop_ring = start_ring if extra_ring_done else None
+        for ring in sorted(by_ring):
+            if stop_ring is not None and ring > stop_ring:
+                break
+            found.extend(by_ring[ring])
+            if stop_ring is None and len(found) >= needed:
+                stop_ring = ring + 1
+        return found
+
+    @staticmethod
+    def _ring_cells(center_row: int, center_col: int, ring: int):
+        if ring == 0:
+            yield (center_row, center_col)
+            return
+        for col in range(center_col - ring, center_col + ring + 1):
+            yield (center_row - ring, col)
+            yield (center_row + ring, col)
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield (row, center_col - ring)
+            yield (row, center_col + ring)
+
+# Shared index used by the matching service and kept current by crud/location
+composter_index = ComposterGridIndex()
@@ -0,0 +1,311 @@
+import asyncio
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+# Use absolute imports instead of relative imports
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import LoginThrottleBucket
+
+# Turn login throttling off, e.g. for load tests
+LOGIN_THROTTLE_ENABLED = os.getenv("LOGIN_THROTTLE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Login attempts one client IP can make in a burst, and per minute after that
+LOGIN_THROTTLE_IP_BURST = int(os.getenv("LOGIN_THROTTLE_IP_BURST", "20"))
+LOGIN_THROTTLE_IP_PER_MINUTE = float(os.getenv("LOGIN_THROTTLE_IP_PER_MINUTE", "10"))
+# Login attempts for one email in a burst, and per minute after that
+LOGIN_THROTTLE_EMAIL_BURST = int(os.getenv("LOGIN_THROTTLE_EMAIL_BURST", "5"))
+LOGIN_THROTTLE_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_THROTTLE_EMAIL_PER_MINUTE", "3"))
+# "memory" keeps buckets per worker process; "database" shares them
+# between processes through the login_throttle_buckets table
+LOGIN_THROTTLE_BACKEND = os.getenv("LOGIN_THROTTLE_BACKEND", "memory")
+# Buckets kept in memory; the least recently used are dropped first
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+# Comma-separated IPs or networks of the reverse proxies in front of the
+# app, e.g. 10.0.0.0/8; requests from them are attributed to the client in
+# X-Forwarded-For. "*" trusts whatever connects, for platforms such as
+# Railway where only their proxy can reach the app. Empty: no proxy.
+LOGIN_THROTTLE_TRUSTED_PROXIES = os.getenv("LOGIN_THROTTLE_TRUSTED_PROXIES", "")
+
+def refill(tokens: float, updated_at: float, now: float, capacity: int, rate: float) -> float:
+    """
+    Tokens in a bucket at now, given its level at updated_at.
+    """
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+def take_token(tokens: float, capacity: int, rate: float) -> Tuple[bool, float, float]:
+    """
+    Take one token from a refilled bucket.
+
+    Returns:
+        (allowed, tokens left, seconds until a token is available)
+    """
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate if rate > 0 else float("inf")
+
+class MemoryBucketStore:
+    """
+    Token buckets in this process. Each worker process throttles on its
+    own, so the effective limits are multiplied by the number of workers.
+    """
+
+    def __init__(self, maxsize: int = LOGIN_THROTTLE_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        """
+        Take a token from the bucket for key, which starts full.
+
+        Returns:
+            (allowed, seconds to wait before retrying when not allowed)
+        """
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            allowed, tokens, retry_after = take_token(refill(tokens, updated_at, now, capacity, rate),
+                                                      capacity, rate)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return allowed, retry_after
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+class DatabaseBucketStore:
+    """
+    Token buckets in the login_throttle_buckets table, shared by all worker
+    processes. Each check is one short transaction that locks the bucket's
+    row (SELECT ... FOR UPDATE where the database supports it).
+    """
+
+    def __init__(self, bind, clock: Callable[[], float] = time.time):
+        self._Session = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+        self._clock = clock
+
+    def __len__(self) -> int:
+        db = self._Session()
+        try:
+            return db.query(LoginThrottleBucket).count()
+        finally:
+            db.close()
+
+    def take(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        now = self._clock()
+        db = self._Session()
+        try:
+            locked = db.query(LoginThrottleBucket).filter(LoginThrottleBucket.key == key).with_for_update()
+            bucket = locked.first()
+            if bucket is None:
+                bucket = LoginThrottleBucket(key=key, tokens=capacity, updated_at=now)
+                db.add(bucket)
+                try:
+                    db.flush()
+                except IntegrityError:
+                    # Another process inserted the key first; use its row
+                    db.rollback()
+                    bucket = locked.first()
+            allowed, bucket.tokens, retry_after = take_token(
+                refill(bucket.tokens, bucket.updated_at, now, capacity, rate), capacity, rate
+            )
+            bucket.updated_at = now
+            db.commit()
+            return allowed, retry_after
+        finally:
+            db.close()
+
+    def reset(self, key: str):
+        db = self._Session()
+        try:
+            db.query(LoginThrottleBucket).filter(LoginThrottleBucket.key == key).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def prune(self, older_than_seconds: float = 3600) -> int:
+        """
+        Delete buckets not used for a while; they would be full again.
+        """
+        db = self._Session()
+        try:
+            deleted = db.query(LoginThrottleBucket).filter(
+                LoginThrottleBucket.updated_at < self._clock() - older_than_seconds
+            ).delete()
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+class LoginThrottled(Exception):
+    """Raised when a client or an email has made too many login attempts"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Too many login attempts for this {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+class LoginThrottle:
+    """
+    Token bucket limits on login attempts by client IP and by email.
+
+    Checked before the user is loaded or the password hashed, so a
+    credential-stuffing burst is turned away for the cost of a dict
+    lookup. A successful login refills the email's bucket, so a user who
+    mistyped their password a few times is not locked out afterwards.
+    """
+
+    def __init__(self, store=None, ip_burst: int = LOGIN_THROTTLE_IP_BURST,
+                 ip_per_minute: float = LOGIN_THROTTLE_IP_PER_MINUTE,
+                 email_burst: int = LOGIN_THROTTLE_EMAIL_BURST,
+                 email_per_minute: float = LOGIN_THROTTLE_EMAIL_PER_MINUTE,
+                 enabled: bool = LOGIN_THROTTLE_ENABLED):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.ip_burst = ip_burst
+        self.ip_rate = ip_per_minute / 60
+        self.email_burst = email_burst
+        self.email_rate = email_per_minute / 60
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {"allowed": 0, "rejected_ip": 0, "rejected_email": 0, "successes": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def check(self, ip: Optional[str], email: str):
+        """
+        Take one attempt from the IP's and the email's buckets.
+
+        Raises:
+            LoginThrottled: If either bucket is empty
+        """
+        if not self.enabled:
+            return
+        if ip:
+            allowed, retry_after = self.store.take(f"ip:{ip}", self.ip_burst, self.ip_rate)
+            if not allowed:
+                self._count("rejected_ip")
+                raise LoginThrottled("client", retry_after)
+        allowed, retry_after = self.store.take(f"email:{email.strip().lower()}", self.email_burst, self.email_rate)
+        if not allowed:
+            self._count("rejected_email")
+            raise LoginThrottled("account", retry_after)
+        self._count("allowed")
+
+    def succeeded(self, email: str):
+        if not self.enabled:
+            return
+        self.store.reset(f"email:{email.strip().lower()}")
+        self._count("successes")
+
+    async def _run_async(self, func, *args):
+        # The database store locks and commits rows; run it on a worker
+        # thread so a slow or contended database doesn't stall the event loop
+        if isinstance(self.store, DatabaseBucketStore):
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def check_async(self, ip: Optional[str], email: str):
+        """
+        Same as check, for async endpoints.
+
+        Raises:
+            LoginThrottled: If either bucket is empty
+        """
+        await self._run_async(self.check, ip, email)
+
+    async def succeeded_async(self, email: str):
+        """
+        Same as succeeded, for async endpoints.
+        """
+        await self._run_async(self.succeeded, email)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        rejected = counters["rejected_ip"] + counters["rejected_email"]
+        attempts = counters["allowed"] + rejected
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.store).__name__,
+            "buckets": len(self.store),
+            **counters,
+            "rejected_rate": round(rejected / attempts, 4) if attempts else 0.0
+        }
+
+def parse_proxies(value: str) -> Tuple[bool, Tuple]:
+    """
+    Parse LOGIN_THROTTLE_TRUSTED_PROXIES.
+
+    Returns:
+        (whether any peer is trusted, trusted networks)
+    """
+    networks = []
+    trust_all = False
+    for entry in value.split(","):
+        entry = entry.strip()
+        if entry == "*":
+            trust_all = True
+        elif entry:
+            try:
+                networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                print(f"Ignoring invalid trusted proxy {entry!r}")
+    return trust_all, tuple(networks)
+
+trusted_proxies = parse_proxies(LOGIN_THROTTLE_TRUSTED_PROXIES)
+
+def _in_networks(address: str, networks) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+def client_ip(request, proxies: Optional[Tuple[bool, Tuple]] = None) -> Optional[str]:
+    """
+    IP address of the client that sent a FastAPI request.
+
+    When the request comes from a trusted proxy, X-Forwarded-For is read
+    from the right, skipping the trusted proxies it passed through. The
+    first other address is the one the proxies saw; anything to its left
+    was sent by the client and can be forged.
+    """
+    trust_all, networks = trusted_proxies if proxies is None else proxies
+    peer = request.client.host if request.client else None
+    if peer is None or not (trust_all or _in_networks(peer, networks)):
+        return peer
+    forwarded = [address.strip() for address in request.headers.get("x-forwarded-for", "").split(",")]
+    forwarded = [address for address in forwarded if address]
+    for address in reversed(forwarded):
+        if not _in_networks(address, networks):
+            return address
+    return forwarded[0] if forwarded else peer
+
+def create_login_throttle(bind=None) -> LoginThrottle:
+    if LOGIN_THROTTLE_BACKEND == "database":
+        if bind is None:
+            from database import engine as bind
+        return LoginThrottle(store=DatabaseBucketStore(bind))
+    if LOGIN_THROTTLE_BACKEND != "memory":
+        print(f"Unknown LOGIN_THROTTLE_BACKEND {LOGIN_THROTTLE_BACKEND!r}, using memory")
+    return LoginThrottle()
+
+login_throttle = create_login_throttle()
@@ -22,6 +22,7 @@ export const AuthProvider = ({ children }) => {
         .catch((error) => {
           console.error('Failed to fetch user data:', error);
           localStorage.removeItem('token');
+          localStorage.removeItem('refreshToken');
         })
         .finally(() => setLoading(false));
     } else {
@@ -35,8 +36,9 @@ export const AuthProvider = ({ children }) => {
         username: email,
         password: password,
       }));
-      const { access_token } = response.data;
+      const { access_token, refresh_token } = response.data;
       localStorage.setItem('token', access_token);
+      localStorage.setItem('refreshToken', refresh_token);
       api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
       const userResponse = await api.get('/users/me/');
       setUser(userResponse.data);
@@ -45,6 +47,7 @@ export const AuthProvider = ({ children }) => {
       console.error('Login error:', error);
       // Remove token if it exists
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
       delete api.defaults.headers.common['Authorization'];
       throw error;
     }
@@ -60,7 +63,11 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revoke both tokens on the server; the local session ends either way
+    api.post('/logout', { refresh_token: localStorage.getItem('refreshToken') })
+      .catch((error) => console.error('Logout error:', error));
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     delete api.defaults.headers.common['Authorization'];
     setUser(null);
   };
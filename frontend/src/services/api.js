@@ -16,13 +16,48 @@ api.interceptors.request.use(
   }
 );
 
+// Exchange the stored refresh token for new tokens; concurrent 401s share
+// one refresh because each refresh token can only be used once
+let refreshing = null;
+const refreshTokens = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem('refreshToken');
+    refreshing = api.post('/token/refresh', { refresh_token: refreshToken })
+      .then((response) => {
+        const { access_token, refresh_token } = response.data;
+        localStorage.setItem('token', access_token);
+        localStorage.setItem('refreshToken', refresh_token);
+        api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+        return access_token;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
 // Add a response interceptor
 api.interceptors.response.use(
   (response) => {
     // Any status code that lie within the range of 2xx cause this function to trigger
     return response;
   },
-  (error) => {
+  async (error) => {
+    const original = error.config;
+    // Expired access token: refresh it once and retry the request
+    if (error.response && error.response.status === 401 && original && !original._retried
+        && localStorage.getItem('refreshToken') && !original.url.startsWith('/token')) {
+      original._retried = true;
+      try {
+        const accessToken = await refreshTokens();
+        original.headers['Authorization'] = `Bearer ${accessToken}`;
+        return api(original);
+      } catch (refreshError) {
+        localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
+      }
+    }
     // Any status codes that falls outside the range of 2xx cause this function to trigger
     if (error.response) {
       // The request was made and the server responded with a status code
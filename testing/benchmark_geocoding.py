@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark the geocoding client against the local stand-in OpenCage server.
+
+Compares a new connection per call (bare requests.get), the pooled client
+called sequentially, and the asyncio interface with concurrent lookups.
+The server adds a fixed latency to every response.
+
+    python testing/benchmark_geocoding.py --calls 200 --latency 0.02
+"""
+
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import argparse
+import asyncio
+import json
+import time
+
+import requests
+
+from services.geocoding import GeocodingClient
+from fake_opencage_server import start_server
+
+def run(calls, latency, concurrency):
+    server = start_server(latency=latency)
+    params = lambda i: {"q": f"House {i}, Mumbai", "key": "test", "limit": 1}
+    report = {"calls": calls, "latency_seconds": latency, "concurrency": concurrency}
+    try:
+        start = time.perf_counter()
+        for i in range(calls):
+            requests.get(server.base_url, params=params(i), timeout=5).json()
+        report["new_connection_per_call_seconds"] = round(time.perf_counter() - start, 3)
+        connections = server.stats()["connections"]
+
+        client = GeocodingClient(base_url=server.base_url, rate=0)
+        start = time.perf_counter()
+        for i in range(calls):
+            client.get(params(i))
+        report["pooled_sequential_seconds"] = round(time.perf_counter() - start, 3)
+        report["pooled_connections"] = server.stats()["connections"] - connections
+
+        async def lookups():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(i):
+                async with semaphore:
+                    return await client.get_async(params(i))
+
+            return await asyncio.gather(*[one(i) for i in range(calls)])
+
+        start = time.perf_counter()
+        asyncio.run(lookups())
+        report["async_concurrent_seconds"] = round(time.perf_counter() - start, 3)
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the geocoding client offline")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added by the server")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent asyncio lookups")
+    args = parser.parse_args()
+    print(json.dumps(run(args.calls, args.latency, args.concurrency), indent=2))
+
+if __name__ == "__main__":
+    main()
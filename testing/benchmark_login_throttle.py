@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: legitimate traffic kept during a credential-stuffing attack.
+
+Starts the API in-process on a scratch SQLite database. Attacker threads
+send logins with wrong passwords for existing accounts from a few IPs, so
+every unthrottled attempt costs a bcrypt verify, while legitimate users,
+each on their own IP, log in and load /users/me/.
+The attack is sent at a fixed rate, as from a remote botnet, rather than
+as fast as this machine allows. Client IPs are set through
+X-Forwarded-For. Run once as is and once with --no-throttle to compare.
+
+    python testing/benchmark_login_throttle.py --seconds 15 --attack-rate 40
+    python testing/benchmark_login_throttle.py --seconds 15 --attack-rate 40 --no-throttle
+"""
+
+import sys
+import os
+
+# Client IPs come from X-Forwarded-For; must be set before the backend is imported
+os.environ["LOGIN_THROTTLE_TRUSTED_PROXIES"] = "127.0.0.1"
+os.environ["LOGIN_THROTTLE_ENABLED"] = "true"
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from load_test_login import percentiles, start_api
+from services.throttle import login_throttle
+from services import passwords
+
+PASSWORD = "correct horse battery staple"
+
+def attacker(base_url, ip, victims, interval, stop, statuses):
+    session = requests.Session()
+    attempt = 0
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        next_at += interval
+        response = session.post(f"{base_url}/token", timeout=60, headers={"X-Forwarded-For": ip},
+                                data={"username": victims[attempt % len(victims)], "password": "123456"})
+        statuses[response.status_code] += 1
+        attempt += 1
+        stop.wait(max(0.0, next_at - time.perf_counter()))
+
+def legitimate(base_url, email, ip, stop, report):
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = session.post(f"{base_url}/token", timeout=60, headers={"X-Forwarded-For": ip},
+                                data={"username": email, "password": PASSWORD})
+        report["login_seconds"].append(time.perf_counter() - start)
+        report["login_statuses"][response.status_code] += 1
+        if response.status_code != 200:
+            time.sleep(0.1)
+            continue
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}", "X-Forwarded-For": ip}
+        for _ in range(5):
+            start = time.perf_counter()
+            if session.get(f"{base_url}/users/me/", headers=headers, timeout=60).status_code == 200:
+                report["page_seconds"].append(time.perf_counter() - start)
+
+def run(seconds, attack_rate, attackers, attacker_ips, users, victims, throttle):
+    login_throttle.enabled = throttle
+    server, thread, base_url = start_api()
+    emails = [f"user{i}@example.com" for i in range(users)]
+    victims = [f"victim{i}@example.com" for i in range(victims)]
+    try:
+        for email in emails + victims:
+            requests.post(f"{base_url}/register/", json={"email": email, "password": PASSWORD, "role": "buyer"},
+                          timeout=30).raise_for_status()
+        legit = {"login_seconds": [], "page_seconds": [], "login_statuses": Counter()}
+        attack = Counter()
+        stop = threading.Event()
+        interval = attackers / attack_rate
+        threads = [threading.Thread(target=attacker, args=(base_url, f"203.0.113.{i % attacker_ips + 1}", victims,
+                                                           interval, stop, attack))
+                   for i in range(attackers)]
+        threads += [threading.Thread(target=legitimate, args=(base_url, email, f"198.51.100.{i + 1}", stop, legit))
+                    for i, email in enumerate(emails)]
+        for worker in threads:
+            worker.start()
+        time.sleep(seconds)
+        stop.set()
+        for worker in threads:
+            worker.join()
+        return {
+            "throttle": throttle,
+            "seconds": seconds,
+            "attack_rate": attack_rate,
+            "attack_requests_per_second": round(sum(attack.values()) / seconds, 1),
+            "attack_statuses": {str(code): count for code, count in sorted(attack.items())},
+            "legitimate_logins_per_second": round(legit["login_statuses"][200] / seconds, 2),
+            "legitimate_login_statuses": {str(code): count for code, count in sorted(legit["login_statuses"].items())},
+            "legitimate_login_latency": percentiles(legit["login_seconds"]) if legit["login_seconds"] else None,
+            "legitimate_pages_per_second": round(len(legit["page_seconds"]) / seconds, 1),
+            "legitimate_page_latency": percentiles(legit["page_seconds"]) if legit["page_seconds"] else None,
+            "login_throttle": login_throttle.stats(),
+            "password_hasher": passwords.password_hasher.stats()
+        }
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure legitimate throughput during a login attack")
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--attack-rate", type=float, default=40, help="Attack logins per second")
+    parser.add_argument("--attackers", type=int, default=16, help="Attacker threads")
+    parser.add_argument("--attacker-ips", type=int, default=2, help="Distinct attacker IP addresses")
+    parser.add_argument("--users", type=int, default=4, help="Legitimate users, one IP each")
+    parser.add_argument("--victims", type=int, default=20, help="Accounts targeted by the attack")
+    parser.add_argument("--no-throttle", action="store_true", help="Disable the login throttle")
+    args = parser.parse_args()
+    print(json.dumps(run(args.seconds, args.attack_rate, args.attackers, args.attacker_ips, args.users, args.victims,
+                         not args.no_throttle), indent=2))
+
+if __name__ == "__main__":
+    main()
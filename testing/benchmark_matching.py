@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Benchmark composter matching on synthetic national-scale datasets.
+
+Generates composters and waste listings spread over India (clustered around
+major cities, with a share scattered across the country and a few
+composters without coordinates) into SQLite files, then times
+ComposterMatcher.get_recommended_composters end to end. For each dataset the
+report records latency percentiles, SQL queries per call, the spatial index
+build time and peak Python memory.
+
+Datasets are cached in --data-dir by size and seed, so later runs only time
+the queries. Compare a run against a previous report with --baseline to see
+regressions between commits:
+
+    python testing/benchmark_matching.py --composters 1000,10000 --listings 100000 \\
+        --output before.json
+    python testing/benchmark_matching.py --composters 1000,10000 --listings 100000 \\
+        --baseline before.json
+"""
+
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import sqlalchemy
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+import models, crud
+from services.matching import ComposterMatcher
+from services.spatial_index import composter_index
+
+# (city, state, latitude, longitude, relative weight)
+CITIES = [
+    ("Delhi", "Delhi", 28.61, 77.21, 10),
+    ("Mumbai", "Maharashtra", 19.08, 72.88, 10),
+    ("Bengaluru", "Karnataka", 12.97, 77.59, 8),
+    ("Kolkata", "West Bengal", 22.57, 88.36, 7),
+    ("Chennai", "Tamil Nadu", 13.08, 80.27, 7),
+    ("Hyderabad", "Telangana", 17.39, 78.49, 7),
+    ("Pune", "Maharashtra", 18.52, 73.86, 5),
+    ("Ahmedabad", "Gujarat", 23.02, 72.57, 5),
+    ("Jaipur", "Rajasthan", 26.91, 75.79, 3),
+    ("Lucknow", "Uttar Pradesh", 26.85, 80.95, 3),
+    ("Kanpur", "Uttar Pradesh", 26.45, 80.33, 2),
+    ("Nagpur", "Maharashtra", 21.15, 79.09, 2),
+    ("Indore", "Madhya Pradesh", 22.72, 75.86, 2),
+    ("Bhopal", "Madhya Pradesh", 23.26, 77.41, 2),
+    ("Patna", "Bihar", 25.59, 85.14, 2),
+    ("Chandigarh", "Chandigarh", 30.73, 76.78, 1),
+    ("Kochi", "Kerala", 9.93, 76.27, 1),
+    ("Guwahati", "Assam", 26.14, 91.74, 1),
+    ("Bhubaneswar", "Odisha", 20.30, 85.82, 1),
+    ("Visakhapatnam", "Andhra Pradesh", 17.69, 83.22, 1),
+]
+# Rough bounding box of mainland India for scattered points
+INDIA_BOUNDS = (8.0, 32.0, 69.0, 89.0)
+# Share of points scattered across the country instead of around a city
+SCATTERED_SHARE = 0.15
+# Share of composters registered without coordinates
+UNLOCATED_SHARE = 0.02
+# Spread of points around a city centre, in degrees (about 15 km)
+CITY_SPREAD_DEG = 0.15
+HOUSEHOLDS = 1000
+INSERT_CHUNK = 50000
+
+def generate_points(rng, count):
+    """
+    Generate coordinates clustered around cities with some scattered points.
+
+    Returns:
+        (latitudes, longitudes, city indexes) arrays; the city index is -1
+        for scattered points
+    """
+    weights = np.array([city[4] for city in CITIES], dtype=float)
+    cities = rng.choice(len(CITIES), size=count, p=weights / weights.sum())
+    latitudes = np.array([CITIES[i][2] for i in cities]) + rng.normal(0, CITY_SPREAD_DEG, count)
+    longitudes = np.array([CITIES[i][3] for i in cities]) + rng.normal(0, CITY_SPREAD_DEG, count)
+    scattered = rng.random(count) < SCATTERED_SHARE
+    min_lat, max_lat, min_lng, max_lng = INDIA_BOUNDS
+    latitudes[scattered] = rng.uniform(min_lat, max_lat, scattered.sum())
+    longitudes[scattered] = rng.uniform(min_lng, max_lng, scattered.sum())
+    cities[scattered] = -1
+    return latitudes, longitudes, cities
+
+def _insert_chunks(connection, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            connection.execute(insert(table), chunk)
+            chunk = []
+    if chunk:
+        connection.execute(insert(table), chunk)
+
+def generate_dataset(path, composters, listings, seed):
+    """
+    Create a SQLite database with households, composters and waste listings.
+
+    About 85% of listings are available, 10% pending pickup by a composter in
+    the same region and 5% completed. Composter load counters are rebuilt at
+    the end.
+    """
+    rng = np.random.default_rng(seed)
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    engine = create_engine(f"sqlite:///{partial}")
+    models.Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA journal_mode=OFF")
+        connection.exec_driver_sql("PRAGMA synchronous=OFF")
+
+        _insert_chunks(connection, models.User.__table__, (
+            {"id": i + 1, "email": f"household{i}@bench.example", "hashed_password": "x",
+             "is_active": True, "role": models.Role.household}
+            for i in range(HOUSEHOLDS)
+        ))
+
+        lats, lngs, cities = generate_points(rng, composters)
+        unlocated = rng.random(composters) < UNLOCATED_SHARE
+        composter_ids = np.arange(HOUSEHOLDS + 1, HOUSEHOLDS + composters + 1)
+        _insert_chunks(connection, models.User.__table__, (
+            {"id": int(composter_ids[i]), "email": f"composter{i}@bench.example",
+             "hashed_password": "x", "is_active": True, "role": models.Role.composter,
+             "city": CITIES[cities[i]][0] if cities[i] >= 0 else None,
+             "state": CITIES[cities[i]][1] if cities[i] >= 0 else None,
+             "country": "India",
+             "latitude": None if unlocated[i] else float(lats[i]),
+             "longitude": None if unlocated[i] else float(lngs[i])}
+            for i in range(composters)
+        ))
+
+        lats, lngs, cities = generate_points(rng, listings)
+        statuses = rng.choice(3, size=listings, p=[0.85, 0.10, 0.05])
+        organic = rng.random(listings) < 0.7
+        quantities = np.round(rng.uniform(1, 50, listings), 1)
+        owners = rng.integers(1, HOUSEHOLDS + 1, listings)
+        # Assigned listings go to a random composter; loads only need a
+        # realistic spread, not geographic consistency
+        assigned = rng.choice(composter_ids, size=listings)
+        status_values = [models.WasteListingStatus.AVAILABLE, models.WasteListingStatus.PENDING_PICKUP,
+                         models.WasteListingStatus.COMPLETED]
+        _insert_chunks(connection, models.WasteListing.__table__, (
+            {"id": i + 1, "title": f"Listing {i}", "quantity": float(quantities[i]),
+             "waste_type": models.WasteType.ORGANIC if organic[i] else models.WasteType.PLASTIC,
+             "pickup_location": CITIES[cities[i]][0] if cities[i] >= 0 else "India",
+             "city": CITIES[cities[i]][0] if cities[i] >= 0 else None,
+             "state": CITIES[cities[i]][1] if cities[i] >= 0 else None,
+             "country": "India",
+             "latitude": float(lats[i]), "longitude": float(lngs[i]),
+             "status": status_values[statuses[i]],
+             "owner_id": int(owners[i]),
+             "composter_id": int(assigned[i]) if statuses[i] > 0 else None}
+            for i in range(listings)
+        ))
+
+    db = sessionmaker(bind=engine)()
+    try:
+        crud.rebuild_composter_loads(db)
+    finally:
+        db.close()
+    engine.dispose()
+    os.replace(partial, path)
+
+def get_dataset(data_dir, composters, listings, seed, regenerate=False):
+    """
+    Get the path of a cached dataset, generating it first if needed.
+
+    Returns:
+        (path, seconds spent generating, 0.0 when the dataset was reused)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"matching_c{composters}_l{listings}_s{seed}.db")
+    if os.path.exists(path) and not regenerate:
+        return path, 0.0
+    start = time.perf_counter()
+    generate_dataset(path, composters, listings, seed)
+    return path, time.perf_counter() - start
+
+class QueryCounter:
+    """Count the SQL statements an engine executes"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+def _percentiles(values):
+    values = np.asarray(values, dtype=float)
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+def benchmark_dataset(path, queries, limit, seed, warmup=5, memory_queries=20, precise=False):
+    """
+    Time recommendations for random available listings of a dataset.
+
+    Each call gets its own session, as a request would. Latency and query
+    counts come from a run without tracing; peak memory is measured on a
+    separate run over the first memory_queries listings because tracemalloc
+    slows allocation down.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    rng = np.random.default_rng(seed + 1)
+
+    db = session_factory()
+    try:
+        available = [row.id for row in db.query(models.WasteListing.id).filter(
+            models.WasteListing.status == models.WasteListingStatus.AVAILABLE
+        ).all()]
+        composters = db.query(models.User).filter(models.User.role == models.Role.composter).count()
+        listings = db.query(models.WasteListing).count()
+
+        # Cold spatial index build, measured on its own
+        composter_index.clear()
+        tracemalloc.start()
+        start = time.perf_counter()
+        composter_index.ensure_loaded(db)
+        index_seconds = time.perf_counter() - start
+        index_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        db.close()
+
+    listing_ids = [int(i) for i in rng.choice(available, size=queries + warmup)]
+
+    def recommend(waste_listing_id):
+        session = session_factory()
+        try:
+            return ComposterMatcher(session, precise=precise).get_recommended_composters(waste_listing_id, limit)
+        finally:
+            session.close()
+
+    for waste_listing_id in listing_ids[:warmup]:
+        recommend(waste_listing_id)
+
+    latencies = []
+    query_counts = []
+    results = []
+    total_start = time.perf_counter()
+    for waste_listing_id in listing_ids[warmup:]:
+        with QueryCounter(engine) as counter:
+            start = time.perf_counter()
+            recommended = recommend(waste_listing_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+        query_counts.append(counter.count)
+        results.append(len(recommended))
+    total_seconds = time.perf_counter() - total_start
+
+    peaks = []
+    for waste_listing_id in listing_ids[warmup:warmup + memory_queries]:
+        tracemalloc.start()
+        recommend(waste_listing_id)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+        tracemalloc.stop()
+
+    engine.dispose()
+    composter_index.clear()
+    return {
+        "composters": composters,
+        "listings": listings,
+        "index_build_seconds": round(index_seconds, 4),
+        "index_build_peak_mb": round(index_peak / 2 ** 20, 3),
+        "queries": queries,
+        "latency_ms": _percentiles(latencies),
+        "throughput_per_second": round(queries / total_seconds, 2) if total_seconds else None,
+        "sql_queries_per_call": {"mean": round(float(np.mean(query_counts)), 3), "max": int(max(query_counts))},
+        "peak_memory_mb": {"mean": round(float(np.mean(peaks)), 3), "max": round(float(max(peaks)), 3)} if peaks else None,
+        "recommended_per_call": round(float(np.mean(results)), 3),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def run_benchmark(composter_sizes, listings, queries=200, limit=10, seed=42, data_dir=None,
+                  regenerate=False, warmup=5, memory_queries=20, precise=False):
+    """
+    Run the benchmark for every composter count and build the report.
+
+    Returns:
+        Report dictionary, ready to be written as JSON
+    """
+    if data_dir is None:
+        data_dir = os.path.join(tempfile.gettempdir(), "swacchsetu_benchmark")
+    report = {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "environment": {
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "sqlalchemy": sqlalchemy.__version__,
+        },
+        "config": {
+            "composters": list(composter_sizes), "listings": listings, "queries": queries,
+            "limit": limit, "seed": seed, "warmup": warmup, "precise": precise,
+        },
+        "results": [],
+    }
+    for composters in composter_sizes:
+        path, generation_seconds = get_dataset(data_dir, composters, listings, seed, regenerate)
+        result = benchmark_dataset(path, queries, limit, seed, warmup=warmup,
+                                   memory_queries=memory_queries, precise=precise)
+        result["dataset_generation_seconds"] = round(generation_seconds, 2)
+        report["results"].append(result)
+        print(f"{composters:>8} composters, {listings:>8} listings: "
+              f"p50 {result['latency_ms']['p50']:.2f} ms, p95 {result['latency_ms']['p95']:.2f} ms, "
+              f"{result['sql_queries_per_call']['mean']:.1f} queries/call, "
+              f"peak {result['peak_memory_mb']['max'] if result['peak_memory_mb'] else 0:.2f} MB")
+    return report
+
+def compare_reports(report, baseline, threshold=0.2):
+    """
+    Compare a report against a baseline report.
+
+    Results are matched by dataset size. Latency (p50 and p95), SQL queries
+    per call and peak memory are compared.
+
+    Returns:
+        List of regression descriptions, empty when nothing got worse by
+        more than threshold (a fraction, 0.2 is 20%)
+    """
+    metrics = [
+        ("latency p50", lambda r: r["latency_ms"]["p50"]),
+        ("latency p95", lambda r: r["latency_ms"]["p95"]),
+        ("SQL queries per call", lambda r: r["sql_queries_per_call"]["mean"]),
+        ("peak memory", lambda r: (r["peak_memory_mb"] or {}).get("max")),
+    ]
+    previous = {(r["composters"], r["listings"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        key = (result["composters"], result["listings"])
+        if key not in previous:
+            continue
+        for name, metric in metrics:
+            old, new = metric(previous[key]), metric(result)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            print(f"{key[0]:>8} composters {name}: {old} -> {new} ({change:+.1%})")
+            if change > threshold:
+                regressions.append(f"{key[0]} composters, {key[1]} listings: {name} {old} -> {new} ({change:+.1%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark composter matching on synthetic data")
+    parser.add_argument("--composters", default="1000,10000,100000",
+                        help="Comma separated composter counts, one dataset each")
+    parser.add_argument("--listings", type=int, default=1000000, help="Waste listings per dataset")
+    parser.add_argument("--queries", type=int, default=200, help="Timed recommendation calls per dataset")
+    parser.add_argument("--limit", type=int, default=10, help="Composters recommended per call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--memory-queries", type=int, default=20,
+                        help="Calls traced with tracemalloc for peak memory")
+    parser.add_argument("--precise", action="store_true", help="Use geodesic instead of haversine distances")
+    parser.add_argument("--data-dir", default=None, help="Where datasets are cached")
+    parser.add_argument("--regenerate", action="store_true", help="Generate datasets even if cached")
+    parser.add_argument("--output", default="matching_benchmark.json", help="JSON report path")
+    parser.add_argument("--baseline", default=None, help="Previous JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.composters.split(",") if size]
+    report = run_benchmark(sizes, args.listings, queries=args.queries, limit=args.limit, seed=args.seed,
+                           data_dir=args.data_dir, regenerate=args.regenerate, warmup=args.warmup,
+                           memory_queries=args.memory_queries, precise=args.precise)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
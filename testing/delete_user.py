@@ -1,9 +1,9 @@
 import sys
 import os
-sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
-from backend import models
-from backend.database import SessionLocal, engine
+import models
+from database import SessionLocal, engine
 
 # Create tables if they don't exist
 models.Base.metadata.create_all(bind=engine)
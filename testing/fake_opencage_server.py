@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenCage geocoding API, for tests and benchmarks.
+
+Serves /geocode/v1/json over HTTP/1.1 with keep-alive. Known Indian cities
+resolve to their real coordinates; any other address gets stable
+coordinates inside India derived from its text, and "lat,lng" queries are
+answered as reverse lookups. Latency, failures (429 with Retry-After, or
+503) and a server-side rate limit can be injected, and the server counts
+requests and distinct client connections.
+
+Point the backend at it with:
+
+    python testing/fake_opencage_server.py --port 8765 --latency 0.05
+    OPENCAGE_BASE_URL=http://127.0.0.1:8765/geocode/v1/json OPENCAGE_API_KEY=test uvicorn main:app
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# (city, state, latitude, longitude)
+KNOWN_PLACES = [
+    ("New Delhi", "Delhi", 28.6139, 77.2090),
+    ("Mumbai", "Maharashtra", 19.0760, 72.8777),
+    ("Bengaluru", "Karnataka", 12.9716, 77.5946),
+    ("Chennai", "Tamil Nadu", 13.0827, 80.2707),
+    ("Kolkata", "West Bengal", 22.5726, 88.3639),
+    ("Hyderabad", "Telangana", 17.3850, 78.4867),
+    ("Pune", "Maharashtra", 18.5204, 73.8567),
+    ("Ahmedabad", "Gujarat", 23.0225, 72.5714),
+    ("Jaipur", "Rajasthan", 26.9124, 75.7873),
+    ("Lucknow", "Uttar Pradesh", 26.8467, 80.9462),
+]
+
+def _nearest_place(latitude, longitude):
+    return min(KNOWN_PLACES, key=lambda p: (p[2] - latitude) ** 2 + (p[3] - longitude) ** 2)
+
+def _result(latitude, longitude, city, state, formatted):
+    return {
+        "geometry": {"lat": round(latitude, 6), "lng": round(longitude, 6)},
+        "components": {"city": city, "state": state, "country": "India", "country_code": "in"},
+        "formatted": formatted,
+        "confidence": 7,
+    }
+
+def resolve(query: str):
+    """
+    Answer a query the way OpenCage would, deterministically.
+
+    Returns:
+        List of results (empty when the query contains "nowhere")
+    """
+    text = query.strip()
+    parts = text.split(",")
+    if len(parts) == 2:
+        try:
+            latitude, longitude = float(parts[0]), float(parts[1])
+            city, state, _, _ = _nearest_place(latitude, longitude)
+            return [_result(latitude, longitude, city, state, f"{city}, {state}, India")]
+        except ValueError:
+            pass
+    lowered = text.lower()
+    if "nowhere" in lowered:
+        return []
+    for city, state, latitude, longitude in KNOWN_PLACES:
+        if city.lower() in lowered:
+            return [_result(latitude, longitude, city, state, f"{text}, {city}, {state}, India")]
+    # Stable pseudo-random point inside India for any other address
+    digest = hashlib.sha256(lowered.encode("utf-8")).digest()
+    latitude = 8.0 + digest[0] / 255 * 24.0
+    longitude = 69.0 + digest[1] / 255 * 20.0
+    city, state, _, _ = _nearest_place(latitude, longitude)
+    return [_result(latitude, longitude, city, state, f"{text}, {state}, India")]
+
+class FakeOpenCageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, fail_first=0, fail_status=503,
+                 retry_after=None, rate_limit=None):
+        super().__init__(address, FakeOpenCageHandler)
+        self.latency = latency
+        # Answer this many requests with fail_status before succeeding
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        # Requests per second allowed before answering 429
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.connections = set()
+        self.request_times = []
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up (timeouts) close the connection mid-response
+        pass
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/geocode/v1/json"
+
+    def _over_rate_limit(self, now):
+        if not self.rate_limit:
+            return False
+        recent = [t for t in self.request_times if t > now - 1.0]
+        return len(recent) > self.rate_limit
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "failures": self.failures,
+                    "rate_limited": self.rate_limited, "connections": len(self.connections)}
+
+class FakeOpenCageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; don't let Nagle delay them
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        if url.path != "/geocode/v1/json":
+            self._send(404, {"status": {"code": 404, "message": "not found"}})
+            return
+        params = parse_qs(url.query)
+        now = time.monotonic()
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            server.request_times.append(now)
+            failing = server.fail_first > 0
+            if failing:
+                server.fail_first -= 1
+                server.failures += 1
+            limited = not failing and server._over_rate_limit(now)
+            if limited:
+                server.rate_limited += 1
+
+        if server.latency:
+            time.sleep(server.latency)
+        if not params.get("key"):
+            self._send(401, {"status": {"code": 401, "message": "missing API key"}})
+            return
+        if failing or limited:
+            status = 429 if limited else server.fail_status
+            headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else {}
+            self._send(status, {"status": {"code": status, "message": "try again"}, "results": []}, headers)
+            return
+        results = resolve(params.get("q", [""])[0])
+        self._send(200, {"status": {"code": 200, "message": "OK"}, "results": results,
+                         "total_results": len(results)},
+                   {"X-RateLimit-Remaining": "2499"})
+
+def start_server(**options) -> FakeOpenCageServer:
+    """
+    Start a fake server on a free local port in a daemon thread.
+    Stop it with server.shutdown().
+    """
+    server = FakeOpenCageServer(**options)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenCage geocoding API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--fail-first", type=int, default=0, help="Fail this many requests first")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--rate-limit", type=float, default=None, help="Requests per second before 429")
+    args = parser.parse_args()
+    server = FakeOpenCageServer((args.host, args.port), latency=args.latency, fail_first=args.fail_first,
+                                fail_status=args.fail_status, rate_limit=args.rate_limit)
+    print(f"Serving fake OpenCage API at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Load test: does a burst of logins slow down unrelated requests?
+
+Starts the API in-process on a scratch SQLite database, then measures the
+latency of GET /users/me/ on its own and again while a burst of concurrent
+logins is hashing passwords. With --inline the logins verify the password
+on the event loop, as before the hashing pool existed, for comparison.
+
+    python testing/load_test_login.py --logins 40 --probes 200
+    python testing/load_test_login.py --logins 40 --probes 200 --inline
+"""
+
+import sys
+import os
+import tempfile
+
+# Use a scratch database; must be set before the backend is imported
+SCRATCH_DIR = tempfile.mkdtemp(prefix="swacchsetu-load-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'load.db')}"
+os.environ.setdefault("SECRET_KEY", "load-test-secret")
+# All logins come from one client and account; measure hashing, not throttling
+os.environ.setdefault("LOGIN_THROTTLE_ENABLED", "false")
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import argparse
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+import uvicorn
+
+import auth
+import main as api
+from services import passwords
+
+EMAIL, PASSWORD = "load@example.com", "correct horse battery staple"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_api():
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+def percentiles(timings):
+    ms = np.array(timings) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+            "max_ms": round(float(ms.max()), 2)}
+
+def probe(base_url, token, count, interval):
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {token}"}
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        session.get(f"{base_url}/users/me/", headers=headers, timeout=30).raise_for_status()
+        timings.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return timings
+
+def burst(base_url, logins, concurrency):
+    def login(_):
+        response = requests.post(f"{base_url}/token", data={"username": EMAIL, "password": PASSWORD}, timeout=60)
+        return response.status_code
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(login, range(logins)))
+
+def run(logins, concurrency, probes, interval, inline):
+    if inline:
+        async def verify_on_loop(db, email, password):
+            return auth.authenticate_user(db, email, password)
+        # Verify on the event loop thread, as before the hashing pool
+        passwords.password_hasher = passwords.PasswordHasher(workers=0, max_pending=10 ** 6)
+        auth.authenticate_user_async = verify_on_loop
+
+    server, thread, base_url = start_api()
+    report = {"mode": "inline" if inline else "pool", "logins": logins, "concurrency": concurrency,
+              "probes": probes, "hash_workers": passwords.password_hasher.workers}
+    try:
+        requests.post(f"{base_url}/register/", json={"email": EMAIL, "password": PASSWORD, "role": "household"},
+                      timeout=30).raise_for_status()
+        token = requests.post(f"{base_url}/token", data={"username": EMAIL, "password": PASSWORD},
+                              timeout=30).json()["access_token"]
+
+        report["idle"] = percentiles(probe(base_url, token, probes, interval))
+
+        with ThreadPoolExecutor(max_workers=1) as background:
+            started = time.perf_counter()
+            statuses = background.submit(burst, base_url, logins, concurrency)
+            timings = probe(base_url, token, probes, interval)
+            codes = statuses.result()
+            report["burst_seconds"] = round(time.perf_counter() - started, 2)
+        report["during_login_burst"] = percentiles(timings)
+        report["login_statuses"] = {str(code): codes.count(code) for code in sorted(set(codes))}
+        report["password_hasher"] = passwords.password_hasher.stats()
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure request latency during a login burst")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20, help="Logins in flight at once")
+    parser.add_argument("--probes", type=int, default=200, help="GET /users/me/ requests per phase")
+    parser.add_argument("--interval", type=float, default=0.005, help="Seconds between probe requests")
+    parser.add_argument("--inline", action="store_true", help="Verify passwords on the event loop")
+    args = parser.parse_args()
+    print(json.dumps(run(args.logins, args.concurrency, args.probes, args.interval, args.inline), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,12 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def reset_database():
     """Reset the database by dropping and recreating all tables"""
     try:
-        from backend import models, database
+        import models, database
         
         # Drop all tables
         print("Dropping all tables...")
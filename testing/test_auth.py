@@ -1,10 +1,10 @@
 import sys
 import os
-sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
-from backend import models, schemas
-from backend.database import SessionLocal, engine
-from backend import crud, auth
+import models, schemas
+from database import SessionLocal, engine
+import crud, auth
 from passlib.context import CryptContext
 from datetime import timedelta
 
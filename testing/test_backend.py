@@ -2,17 +2,17 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_backend_imports():
     """Test that we can import all backend modules without errors"""
     try:
         # Test importing main modules
-        from backend import main, auth, crud, models, schemas, database
+        import main, auth, crud, models, schemas, database
         print("Successfully imported all backend modules")
         
         # Test importing services
-        from backend.services import matching, geocoding, location
+        from services import matching, geocoding, location
         print("Successfully imported all service modules")
         
         return True
@@ -23,8 +23,8 @@ def test_backend_imports():
 def test_database_connection():
     """Test that we can connect to the database"""
     try:
-        from backend.database import SessionLocal, engine
-        from backend import models
+        from database import SessionLocal, engine
+        import models
         
         # Create a database session
         db = SessionLocal()
@@ -2,7 +2,7 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_backend_modules():
     """Test if backend modules can be imported without errors"""
@@ -10,16 +10,16 @@ def test_backend_modules():
         print("Testing backend module imports...")
         
         # Test importing main modules
-        from backend import main, auth, crud, models, schemas, database
+        import main, auth, crud, models, schemas, database
         print("[OK] Successfully imported main modules")
         
         # Test importing services
-        from backend.services import matching, geocoding, location
+        from services import matching, geocoding, location
         print("[OK] Successfully imported service modules")
         
         # Test database connection
         try:
-            from backend.database import SessionLocal, engine
+            from database import SessionLocal, engine
             db = SessionLocal()
             # Try a simple query
             db.query(models.User).first()
@@ -0,0 +1,175 @@
+import sys
+import os
+import json
+import threading
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+import backfill_geocoding
+from services import geocode_cache, geocoding, location
+
+def make_engine(tmp_path):
+    # A file database, so worker threads get their own connections
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}",
+                           connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    return engine
+
+def fake_geocoder(monkeypatch, calls):
+    lock = threading.Lock()
+    def fake_geocode(address):
+        with lock:
+            calls.append(address)
+        if "unknown" in address:
+            return None
+        number = int(address.split()[0])
+        return {"latitude": 20.0 + number / 100, "longitude": 78.0, "city": "Nagpur",
+                "state": "Maharashtra", "country": "India", "formatted": f"{address}, Nagpur"}
+    monkeypatch.setattr(location, "geocode", fake_geocode)
+    geocode_cache.memory_cache.clear()
+
+def seed(db):
+    owner = models.User(email="owner@example.com", role="household", latitude=21.1, longitude=79.1)
+    db.add(owner)
+    db.commit()
+    db.add(models.User(email="pending@example.com", role="household", address="1 Pending Road",
+                       geocoding_status="pending"))
+    for i in range(12):
+        # Three listings share every address
+        db.add(models.User(email=f"user{i}@example.com", role="household", address=f"{i} Ring Road"))
+        db.add(models.WasteListing(waste_type=models.WasteType.ORGANIC, quantity=1.0, owner_id=owner.id,
+                                   address=f"{i // 3} Market Street", pickup_location="Gate 1"))
+    db.add(models.User(email="lost@example.com", role="household", address="unknown lane"))
+    db.commit()
+
+def test_backfill_geocodes_rows_without_coordinates(monkeypatch, tmp_path):
+    engine = make_engine(tmp_path)
+    db = sessionmaker(bind=engine)()
+    seed(db)
+    calls = []
+    fake_geocoder(monkeypatch, calls)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    checkpoint = backfill_geocoding.backfill_geocoding(["users", "waste_listings"], chunk_size=5,
+                                                       workers=3, checkpoint_path=checkpoint_path,
+                                                       bind=engine)
+    assert checkpoint["users"]["geocoded"] == 12 and checkpoint["users"]["failed"] == 1
+    assert checkpoint["waste_listings"]["geocoded"] == 12
+    # Listings at the same address share a lookup
+    assert sorted(c for c in calls if "Market" in c) == [f"{i} Market Street" for i in range(4)]
+    assert "1 Pending Road" not in calls
+
+    db.expire_all()
+    user = db.query(models.User).filter(models.User.email == "user7@example.com").first()
+    assert (user.latitude, user.city, user.geocoding_status) == (20.07, "Nagpur", "done")
+    assert user.location == "7 Ring Road, Nagpur"
+    listing = db.query(models.WasteListing).filter(models.WasteListing.address == "2 Market Street").first()
+    assert listing.latitude == 20.02 and listing.pickup_location == "Gate 1"
+    lost = db.query(models.User).filter(models.User.email == "lost@example.com").first()
+    assert lost.latitude is None and lost.geocoding_status == "failed"
+    with open(checkpoint_path) as f:
+        assert json.load(f)["users"]["completed"] is True
+    db.close()
+
+def test_backfill_resumes_from_the_checkpoint(monkeypatch, tmp_path):
+    engine = make_engine(tmp_path)
+    db = sessionmaker(bind=engine)()
+    seed(db)
+    calls = []
+    fake_geocoder(monkeypatch, calls)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    resume_after = db.query(models.User).filter(models.User.email == "user5@example.com").first().id
+    backfill_geocoding.save_checkpoint(checkpoint_path, {"users": {"last_id": resume_after, "processed": 6,
+                                                                   "geocoded": 6, "failed": 0}})
+
+    checkpoint = backfill_geocoding.backfill_geocoding(["users"], chunk_size=4, workers=2,
+                                                       checkpoint_path=checkpoint_path, bind=engine)
+    assert sorted(calls) == sorted([f"{i} Ring Road" for i in range(6, 12)] + ["unknown lane"])
+    assert checkpoint["users"]["processed"] == 13 and checkpoint["users"]["geocoded"] == 12
+
+    # --restart ignores the checkpoint and picks up the rows skipped before
+    calls.clear()
+    backfill_geocoding.backfill_geocoding(["users"], chunk_size=4, workers=2,
+                                          checkpoint_path=checkpoint_path, restart=True, bind=engine)
+    assert sorted(calls) == sorted([f"{i} Ring Road" for i in range(6)] + ["unknown lane"])
+    db.close()
+
+def test_backfill_pauses_while_the_circuit_is_open(monkeypatch, tmp_path):
+    """Rows refused by the open circuit are retried, not marked failed"""
+    engine = make_engine(tmp_path)
+    db = sessionmaker(bind=engine)()
+    seed(db)
+    calls = []
+    fake_geocoder(monkeypatch, calls)
+    geocode = location.geocode
+    outage = [False]
+
+    def flaky_geocode(address):
+        if address == "2 Ring Road" and not calls.count(address):
+            outage[0] = True
+        if outage[0]:
+            calls.append(address)
+            return None
+        return geocode(address)
+
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    pauses = []
+
+    def recover(seconds):
+        with open(checkpoint_path) as f:
+            pauses.append(json.load(f)["users"]["last_id"])
+        outage[0] = False
+
+    monkeypatch.setattr(location, "geocode", flaky_geocode)
+    monkeypatch.setattr(geocoding, "circuit_open", lambda: outage[0])
+    monkeypatch.setattr(geocoding, "circuit_retry_after", lambda: 0.0)
+    monkeypatch.setattr(backfill_geocoding.time, "sleep", recover)
+
+    checkpoint = backfill_geocoding.backfill_geocoding(["users"], chunk_size=5, workers=1,
+                                                       checkpoint_path=checkpoint_path, bind=engine)
+    # The checkpoint stopped before the first refused row
+    user1 = db.query(models.User).filter(models.User.email == "user1@example.com").first()
+    assert pauses == [user1.id]
+    assert checkpoint["users"]["geocoded"] == 12 and checkpoint["users"]["failed"] == 1
+    assert calls.count("2 Ring Road") == 2
+    db.expire_all()
+    failed = db.query(models.User).filter(models.User.geocoding_status == "failed").all()
+    assert [user.email for user in failed] == ["lost@example.com"]
+    db.close()
+
+def test_backfill_fills_in_missing_cities(monkeypatch, tmp_path):
+    """Rows with coordinates but no city are reverse geocoded once per grid cell"""
+    engine = make_engine(tmp_path)
+    db = sessionmaker(bind=engine)()
+    for i in range(6):
+        # Pairs of users a few metres apart
+        db.add(models.User(email=f"near{i}@example.com", role="household",
+                           latitude=21.1 + (i // 2) * 0.01, longitude=79.08 + (i % 2) * 0.00002))
+    db.add(models.User(email="known@example.com", role="household", latitude=21.1, longitude=79.08,
+                       city="Nagpur City"))
+    db.commit()
+    calls = []
+    def fake_reverse_geocode(latitude, longitude):
+        calls.append((latitude, longitude))
+        return {"city": "Nagpur", "state": "Maharashtra", "country": "India", "formatted": "Nagpur"}
+    monkeypatch.setattr(location, "reverse_geocode", fake_reverse_geocode)
+    geocode_cache.reverse_memory_cache.clear()
+
+    checkpoint = backfill_geocoding.backfill_geocoding(["users"], chunk_size=10, workers=2,
+                                                       checkpoint_path=str(tmp_path / "checkpoint.json"),
+                                                       bind=engine, components=True)
+    assert checkpoint["users:components"]["geocoded"] == 6
+    assert len(calls) == 3
+    db.expire_all()
+    assert {user.city for user in db.query(models.User).all()} == {"Nagpur", "Nagpur City"}
+    geocode_cache.reverse_memory_cache.clear()
+    db.close()
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__]))
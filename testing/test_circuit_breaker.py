@@ -0,0 +1,198 @@
+import sys
+import os
+import asyncio
+import time
+
+# Add the backend and testing directories to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models, schemas, crud
+from services import geocode_cache, geocoding, location
+from services.cache import SingleFlight
+from services.geocoding import CircuitBreaker, GeocodingClient
+from services.geocoding_queue import GeocodingQueue
+from services.spatial_index import composter_index
+from fake_opencage_server import start_server
+
+@pytest.fixture
+def server():
+    server = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def use_client(monkeypatch, server, **options):
+    client = GeocodingClient(base_url=server.base_url, rate=0, backoff=0.01, **options)
+    monkeypatch.setattr(geocoding, "OPENCAGE_API_KEY", "test-key")
+    monkeypatch.setattr(geocoding, "single_flight", SingleFlight())
+    geocoding.set_client(client)
+    return client
+
+def teardown_function():
+    geocoding.set_client(None)
+
+def test_breaker_opens_and_probes():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10, clock=lambda: now[0])
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open" and breaker.is_open()
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+
+    now[0] = 10.0
+    assert breaker.state == "half_open" and not breaker.is_open()
+    # A single probe goes through
+    assert breaker.allow()
+    assert breaker.is_open() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] = 25.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "trips": 1,
+                               "rejected": 2, "retry_after_seconds": 0.0}
+
+def test_abandoned_probe_reopens_the_circuit():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: now[0])
+    assert breaker.acquire() == "closed"
+    breaker.record_failure()
+    now[0] = 10.0
+    assert breaker.acquire() == "half_open" and breaker.acquire() is None
+    breaker.release_probe()
+    assert breaker.state == "open" and breaker.retry_after() == 10
+    now[0] = 20.0
+    assert not breaker.is_open() and breaker.acquire() == "half_open"
+
+def test_cancelled_probe_is_released(monkeypatch, server):
+    """A probe cancelled while waiting on the provider doesn't keep the circuit open"""
+    client = use_client(monkeypatch, server, max_retries=0, timeout=0.2,
+                        breaker=CircuitBreaker(failure_threshold=1, reset_seconds=0.2))
+    server.fail_first = 1
+    assert geocoding.geocode("Shop 1, Pune") is None
+    time.sleep(0.25)
+    assert client.breaker.state == "half_open"
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(client.get_async({"q": "Pune", "key": "test-key"}))
+        await asyncio.sleep(0.05)
+        assert client.breaker.is_open()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert client.breaker.state == "open"
+
+    server.latency = 0.15
+    asyncio.run(cancel_probe())
+    # The next probe goes through after the reset interval
+    server.latency = 0
+    time.sleep(0.25)
+    assert not geocoding.circuit_open()
+    assert geocoding.geocode("Pune")["city"] == "Pune"
+    assert client.breaker.state == "closed"
+
+def test_probe_failing_with_an_unexpected_error_is_released(monkeypatch, server):
+    client = use_client(monkeypatch, server, max_retries=0,
+                        breaker=CircuitBreaker(failure_threshold=1, reset_seconds=0))
+    client.breaker.record_failure()
+
+    def broken_send(params, timeout):
+        raise RuntimeError("bad proxy configuration")
+
+    monkeypatch.setattr(client, "_send", broken_send)
+    with pytest.raises(RuntimeError):
+        client.get({"q": "Pune"})
+    assert not client.breaker.is_open()
+
+def test_open_circuit_fails_fast(monkeypatch, server):
+    """Once the provider has failed repeatedly, lookups stop waiting on it"""
+    client = use_client(monkeypatch, server, max_retries=0, timeout=0.2,
+                        breaker=CircuitBreaker(failure_threshold=3, reset_seconds=0.3))
+    server.latency = 0.5
+    for i in range(3):
+        assert geocoding.geocode(f"Shop {i}, Pune") is None
+    assert client.breaker.state == "open"
+
+    requests_before = server.stats()["requests"]
+    timings = []
+    for i in range(50):
+        start = time.perf_counter()
+        assert geocoding.geocode(f"House {i}, Pune") is None
+        timings.append(time.perf_counter() - start)
+    assert max(timings) < 0.01
+    assert server.stats()["requests"] == requests_before
+    assert client.stats()["rejected"] == 50 and client.stats()["breaker"]["trips"] == 1
+
+    # After the reset interval a probe reaches the recovered provider
+    server.latency = 0
+    time.sleep(0.35)
+    assert geocoding.geocode("Pune")["city"] == "Pune"
+    assert client.breaker.state == "closed"
+
+def test_quota_errors_trip_the_breaker(monkeypatch, server):
+    client = use_client(monkeypatch, server, max_retries=1,
+                        breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60))
+    server.fail_first, server.fail_status = 100, 402
+    geocoding.geocode("Jaipur")
+    geocoding.geocode("Jodhpur")
+    assert client.breaker.state == "open"
+    assert geocoding.reverse_geocode(26.9, 75.8) is None
+    assert geocoding.circuit_open() and 0 < geocoding.circuit_retry_after() <= 60
+
+def test_jobs_are_deferred_while_the_circuit_is_open(monkeypatch, tmp_path):
+    """Writes get an approximate location now and the precise one later"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'breaker.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    composter_index.clear()
+    geocode_cache.memory_cache.clear()
+    queue = GeocodingQueue(workers=2, retry_seconds=0, asynchronous=False)
+    monkeypatch.setattr(crud, "geocoding_queue", queue)
+    outage = [True]
+    calls = []
+    def fake_geocode(address):
+        calls.append(address)
+        if outage[0]:
+            return None
+        return {"latitude": 12.9352, "longitude": 77.6245, "city": "Bengaluru", "state": "Karnataka",
+                "country": "India", "formatted": "80 Feet Road, Koramangala, Bengaluru"}
+    monkeypatch.setattr(location, "geocode", fake_geocode)
+    monkeypatch.setattr(geocoding, "circuit_open", lambda: outage[0])
+    monkeypatch.setattr(geocoding, "circuit_retry_after", lambda: 0.2)
+
+    user = crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret", role="household",
+                                                   address="80 Feet Road, Koramangala, Bengaluru 560001"))
+    assert user.geocoding_status == "pending"
+    assert (user.latitude, user.longitude, user.city) == (12.9762, 77.6033, "Bengaluru")
+    job = db.query(models.GeocodingJob).one()
+    assert (job.status, job.attempts) == ("pending", 0)
+    assert queue.stats()["deferred"] == 1
+
+    # The provider recovers before the deferred job runs again
+    outage[0] = False
+    assert queue.join(timeout=5)
+    db.expire_all()
+    user = db.query(models.User).one()
+    assert (user.geocoding_status, user.latitude, user.longitude) == ("done", 12.9352, 77.6245)
+    assert db.query(models.GeocodingJob).one().attempts == 1
+    assert len(calls) == 2
+    queue.shutdown()
+    composter_index.clear()
+    geocode_cache.memory_cache.clear()
+    db.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
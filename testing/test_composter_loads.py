@@ -0,0 +1,139 @@
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, crud
+from services.matching import get_current_loads, count_active_loads
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def test_counters_follow_listing_changes():
+    """Assignments and status changes keep the counters equal to a recount"""
+    db = make_session()
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    first = models.User(email="first@example.com", role="composter", is_active=True)
+    second = models.User(email="second@example.com", role="composter", is_active=True)
+    db.add_all([owner, first, second])
+    db.flush()
+    listings = []
+    for i in range(3):
+        listing = models.WasteListing(title=f"Listing {i}", quantity=1.0,
+                                      waste_type=models.WasteType.ORGANIC,
+                                      pickup_location="Delhi", owner_id=owner.id)
+        db.add(listing)
+        listings.append(listing)
+    db.commit()
+
+    crud.assign_composter_to_waste_listing(db, listings[0].id, first.id)
+    crud.assign_composter_to_waste_listing(db, listings[1].id, first.id)
+    crud.assign_composter_to_waste_listing(db, listings[2].id, second.id)
+    assert get_current_loads(db) == {first.id: 2, second.id: 1}
+
+    # Reassigning moves the load, completing and cancelling release it
+    crud.assign_composter_to_waste_listing(db, listings[1].id, second.id)
+    assert get_current_loads(db) == {first.id: 1, second.id: 2}
+    crud.update_waste_listing_status(db, listings[0].id, models.WasteListingStatus.COMPLETED)
+    crud.update_waste_listing_status(db, listings[2].id, models.WasteListingStatus.CANCELLED)
+    loads = get_current_loads(db)
+    assert loads[first.id] == 0 and loads[second.id] == 1
+
+    # Reopening a cancelled listing counts it again
+    crud.update_waste_listing_status(db, listings[2].id, models.WasteListingStatus.AVAILABLE)
+    assert get_current_loads(db)[second.id] == 2
+
+    recount = count_active_loads(db)
+    assert {k: v for k, v in get_current_loads(db).items() if v} == recount
+
+    stats = crud.get_composter_stats(db, second.id)
+    assert stats["active_load"] == 2
+    db.close()
+
+def test_rebuild_fixes_drifted_counters():
+    """The reconciliation rebuilds the counters from waste_listings"""
+    db = make_session()
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    composter = models.User(email="composter@example.com", role="composter", is_active=True)
+    db.add_all([owner, composter])
+    db.flush()
+    for status in [models.WasteListingStatus.PENDING_PICKUP,
+                   models.WasteListingStatus.PENDING_PICKUP,
+                   models.WasteListingStatus.COMPLETED]:
+        db.add(models.WasteListing(title="Listing", quantity=1.0, waste_type=models.WasteType.ORGANIC,
+                                   pickup_location="Delhi", owner_id=owner.id,
+                                   composter_id=composter.id, status=status))
+    db.add(models.ComposterLoad(composter_id=composter.id, active_load=7))
+    db.commit()
+
+    assert crud.rebuild_composter_loads(db) == 1
+    assert get_current_loads(db) == {composter.id: 2}
+    db.close()
+
+def test_missing_counter_is_rebuilt_from_listings():
+    """A decrement with no counter row recounts instead of storing zero"""
+    db = make_session()
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    composter = models.User(email="composter@example.com", role="composter", is_active=True)
+    db.add_all([owner, composter])
+    db.flush()
+    listings = [models.WasteListing(title="Listing", quantity=1.0, waste_type=models.WasteType.ORGANIC,
+                                    pickup_location="Delhi", owner_id=owner.id, composter_id=composter.id,
+                                    status=models.WasteListingStatus.PENDING_PICKUP) for _ in range(3)]
+    db.add_all(listings)
+    db.commit()
+
+    crud.update_waste_listing_status(db, listings[0].id, models.WasteListingStatus.COMPLETED)
+    assert get_current_loads(db) == {composter.id: 2}
+    db.close()
+
+def test_concurrent_first_assignments_share_a_counter():
+    """A counter created by another transaction before the INSERT is added to"""
+    db = make_session()
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    composter = models.User(email="composter@example.com", role="composter", is_active=True)
+    db.add_all([owner, composter])
+    db.flush()
+    listing = models.WasteListing(title="Listing", quantity=1.0, waste_type=models.WasteType.ORGANIC,
+                                  pickup_location="Delhi", owner_id=owner.id)
+    db.add(listing)
+    db.commit()
+    inserted = []
+
+    def insert_first(conn, cursor, statement, parameters, context, executemany):
+        if not inserted and statement.lstrip().upper().startswith("UPDATE COMPOSTER_LOADS"):
+            inserted.append(statement)
+            conn.exec_driver_sql("INSERT INTO composter_loads (composter_id, active_load) VALUES (?, 1)",
+                                 (composter.id,))
+
+    engine = db.get_bind()
+    event.listen(engine, "after_cursor_execute", insert_first)
+    try:
+        assert crud.assign_composter_to_waste_listing(db, listing.id, composter.id) is not None
+    finally:
+        event.remove(engine, "after_cursor_execute", insert_first)
+    assert inserted
+    # The other transaction's assignment and this one both count
+    assert get_current_loads(db) == {composter.id: 2}
+    db.expire_all()
+    assert db.get(models.WasteListing, listing.id).status == models.WasteListingStatus.PENDING_PICKUP
+    db.close()
+
+if __name__ == "__main__":
+    print("Running tests for composter load counters...")
+    test_counters_follow_listing_changes()
+    test_rebuild_fixes_drifted_counters()
+    test_missing_counter_is_rebuilt_from_listings()
+    test_concurrent_first_assignments_share_a_counter()
+    print("All tests passed!")
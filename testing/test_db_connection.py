@@ -2,13 +2,13 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_database_connection():
     \"\"\"Test database connection\"\"\"
     try:
-        from backend.database import engine
-        from backend import models
+        from database import engine
+        import models
         
         # Test connection
         print(\"Testing database connection...\")
@@ -0,0 +1,129 @@
+import sys
+import os
+import time
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+from services import gazetteer, location
+from services.gazetteer import Gazetteer
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def test_cities_and_pin_codes_are_answered_locally():
+    """City names, aliases and PIN codes resolve without the API"""
+    places = Gazetteer()
+    delhi = places.lookup("New Delhi, India")
+    assert delhi["city"] == "New Delhi" and delhi["state"] == "Delhi" and delhi["country"] == "India"
+    assert abs(delhi["latitude"] - 28.6139) < 0.01 and abs(delhi["longitude"] - 77.2090) < 0.01
+    assert places.lookup("Delhi")["state"] == "Delhi"
+    assert places.lookup("bangalore, KA") == places.lookup("Bengaluru, Karnataka")
+    mumbai = places.lookup("Mumbai - 400 001")
+    assert mumbai["city"] == "Mumbai" and "400001" in mumbai["formatted"]
+    assert places.lookup("560001")["city"] == "Bengaluru"
+
+def test_street_addresses_are_left_to_the_api():
+    """Anything more specific than a city or PIN code is not guessed"""
+    places = Gazetteer()
+    assert places.lookup("12 MG Road, Bengaluru") is None
+    assert places.lookup("Lajpat Nagar New Delhi") is None
+    assert places.lookup("Atlantis") is None
+    assert places.lookup("999999") is None
+    # Unless PIN centroids are accepted for street addresses
+    assert Gazetteer(pin_centroids=True).lookup("12 MG Road, Bengaluru 560001")["city"] == "Bengaluru"
+    assert places.stats()["misses"] == 4
+
+def test_approximate_locations_for_street_addresses():
+    """During provider outages any address is placed at its PIN code or city"""
+    places = Gazetteer()
+    assert places.approximate("12 MG Road, Bengaluru 560001")["latitude"] == 12.9762
+    assert places.approximate("Sector 17 Vashi Navi Mumbai")["city"] == "Navi Mumbai"
+    assert places.approximate("Flat 2, Park Street, Calcutta")["city"] == "Kolkata"
+    assert places.approximate("Somewhere far away") is None
+    assert places.stats()["approximate_hits"] == 3
+
+def test_reverse_geocode_finds_the_nearest_place():
+    places = Gazetteer()
+    near_pune = places.reverse(18.53, 73.85)
+    assert near_pune == {"city": "Pune", "state": "Maharashtra", "country": "India",
+                         "formatted": "Pune, Maharashtra, India"}
+    assert places.reverse(18.53, 73.85, max_distance_km=0.5) is None
+    # Middle of the Arabian Sea
+    assert places.reverse(15.0, 65.0) is None
+
+def test_reverse_geocode_matches_a_linear_scan():
+    """The grid returns the same place as checking every centroid"""
+    import numpy as np
+    from services.matching import haversine_km
+    places = Gazetteer()
+    places.load()
+    rng = np.random.default_rng(7)
+    for latitude, longitude in zip(rng.uniform(8, 32, 200), rng.uniform(69, 92, 200)):
+        distances = haversine_km(latitude, longitude, places.latitudes, places.longitudes)
+        nearest = int(np.argmin(distances))
+        result = places.reverse(latitude, longitude, max_distance_km=200)
+        if distances[nearest] > 200:
+            assert result is None
+        else:
+            assert result["city"] == places.names[nearest]
+
+def test_india_post_directory(tmp_path):
+    """Post offices are averaged per PIN code and districts get a centroid"""
+    path = tmp_path / "pincodes.csv"
+    path.write_text(
+        "officename,pincode,Districtname,statename,Latitude,Longitude\n"
+        "Sanganer S.O,302029,JAIPUR,RAJASTHAN,26.80,75.80\n"
+        "Sitapura S.O,302029,JAIPUR,RAJASTHAN,26.78,75.84\n"
+        "Unknown B.O,302030,JAIPUR,RAJASTHAN,NA,NA\n"
+        "Dausa H.O,303303,DAUSA,RAJASTHAN,26.89,76.33\n"
+    )
+    places = Gazetteer(paths=[gazetteer.BUNDLED_PATH, str(path)])
+    sanganer = places.lookup("302029")
+    assert sanganer["city"] == "Jaipur" and abs(sanganer["latitude"] - 26.79) < 1e-6
+    assert places.lookup("302030") is None
+    assert places.lookup("Dausa, Rajasthan")["latitude"] == 26.89
+    # The bundled city centre wins over the PIN code mean
+    assert places.lookup("Jaipur")["latitude"] == 26.9124
+
+def test_lookups_are_fast():
+    places = Gazetteer()
+    places.load()
+    started = time.perf_counter()
+    for _ in range(10000):
+        places.lookup("Chennai 600001")
+    assert (time.perf_counter() - started) / 10000 < 0.0005
+
+def test_location_service_tries_the_gazetteer_first(monkeypatch):
+    db = make_session()
+    calls = []
+    def fake_geocode(address):
+        calls.append(address)
+        return {"latitude": 12.93, "longitude": 77.62, "city": "Bengaluru", "state": "Karnataka",
+                "country": "India", "formatted": address}
+    monkeypatch.setattr(location, "geocode", fake_geocode)
+    assert location.geocode_address(db, "Hyderabad, Telangana")["city"] == "Hyderabad"
+    assert calls == []
+    assert location.geocode_address(db, "80 Feet Road, Koramangala, Bengaluru")["latitude"] == 12.93
+    assert calls == ["80 Feet Road, Koramangala, Bengaluru"]
+    db.close()
+
+if __name__ == "__main__":
+    test_cities_and_pin_codes_are_answered_locally()
+    test_street_addresses_are_left_to_the_api()
+    test_approximate_locations_for_street_addresses()
+    test_reverse_geocode_finds_the_nearest_place()
+    test_reverse_geocode_matches_a_linear_scan()
+    test_lookups_are_fast()
+    print("All gazetteer tests passed!")
@@ -0,0 +1,194 @@
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the backend and testing directories to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, schemas, crud
+from services import geocode_cache, geocoding, location
+from services.spatial_index import composter_index
+from services.geocoding_queue import geocoding_queue
+from fake_opencage_server import start_server
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def test_normalize_address():
+    """Case, punctuation and spacing variants share a key"""
+    assert geocode_cache.normalize_address("  Flat 4B,  Green Park Apts., NEW DELHI ") == \
+        "flat 4b green park apts new delhi"
+    assert geocode_cache.address_key("Lajpat Nagar, Delhi") == geocode_cache.address_key("lajpat nagar delhi")
+    assert geocode_cache.address_key("Lajpat Nagar, Delhi") != geocode_cache.address_key("Lajpat Nagar, Pune")
+
+def test_geocode_makes_a_single_request(monkeypatch):
+    """Coordinates and address components come from one forward request"""
+    server = start_server()
+    monkeypatch.setattr(geocoding, "OPENCAGE_API_KEY", "test-key")
+    geocoding.set_client(geocoding.GeocodingClient(base_url=server.base_url, rate=0))
+    try:
+        assert geocoding.geocode("Andheri, Mumbai") == {
+            "latitude": 19.076, "longitude": 72.8777, "city": "Mumbai", "state": "Maharashtra",
+            "country": "India", "formatted": "Andheri, Mumbai, Mumbai, Maharashtra, India"
+        }
+        assert server.stats()["requests"] == 1
+    finally:
+        geocoding.set_client(None)
+        server.shutdown()
+        server.server_close()
+
+def test_repeated_addresses_are_geocoded_once(monkeypatch):
+    """Only the first user or listing at an address calls the geocoding API"""
+    db = make_session()
+    composter_index.clear()
+    geocode_cache.memory_cache.clear()
+    geocode_cache.reset_stats()
+    calls = []
+
+    def fake_geocode(address):
+        calls.append(address)
+        return {"latitude": 28.5677, "longitude": 77.2433, "city": "New Delhi", "state": "Delhi",
+                "country": "India", "formatted": "Lajpat Nagar, New Delhi, India"}
+
+    monkeypatch.setattr(location, "geocode", fake_geocode)
+    # Geocode inside the request so results are visible right away
+    monkeypatch.setattr(geocoding_queue, "asynchronous", False)
+
+    user = crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret",
+                                                   role="household", address="Lajpat Nagar, New Delhi"))
+    assert (user.latitude, user.longitude, user.city) == (28.5677, 77.2433, "New Delhi")
+    assert user.location == "Lajpat Nagar, New Delhi, India"
+    listing = crud.create_waste_listing(db, schemas.WasteListingCreate(
+        title="Kitchen waste", quantity=5.0, waste_type=models.WasteType.ORGANIC,
+        pickup_location="Gate 2", address="lajpat nagar,  NEW DELHI"), owner_id=user.id)
+    assert (listing.latitude, listing.city, listing.pickup_location) == (28.5677, "New Delhi", "Gate 2")
+    assert len(calls) == 1
+
+    # A new process only has the table
+    geocode_cache.memory_cache.clear()
+    crud.create_user(db, schemas.UserCreate(email="b@example.com", password="secret",
+                                            role="household", address="Lajpat Nagar New Delhi"))
+    assert len(calls) == 1
+    stats = geocode_cache.stats()
+    assert stats["memory_hits"] == 1 and stats["database_hits"] == 1 and stats["misses"] == 1
+    assert stats["api_calls_saved"] == 2
+
+    # Expired rows are geocoded again
+    geocode_cache.memory_cache.clear()
+    row = db.query(models.GeocodeCache).one()
+    row.expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    crud.create_user(db, schemas.UserCreate(email="c@example.com", password="secret",
+                                            role="household", address="Lajpat Nagar, New Delhi"))
+    assert len(calls) == 2
+    assert db.query(models.GeocodeCache).count() == 1
+    assert geocode_cache.purge_expired(db) == 0
+
+    composter_index.clear()
+    geocode_cache.memory_cache.clear()
+    db.close()
+
+def test_grid_key_rounds_to_about_100_m():
+    assert geocode_cache.grid_key(28.61391, 77.20902) == geocode_cache.grid_key(28.6141, 77.2088)
+    assert geocode_cache.grid_key(28.6139, 77.2090) != geocode_cache.grid_key(28.6159, 77.2090)
+    assert geocode_cache.grid_key(-12.3456, -45.6789) == "0.001:-12346:-45679"
+
+def test_nearby_points_share_a_reverse_lookup(monkeypatch):
+    """Points in the same grid cell reuse one reverse geocoding request"""
+    db = make_session()
+    geocode_cache.reverse_memory_cache.clear()
+    geocode_cache.reset_stats()
+    calls = []
+
+    def fake_reverse_geocode(latitude, longitude):
+        calls.append((latitude, longitude))
+        if latitude > 80:
+            return None
+        return {"city": "Pune", "state": "Maharashtra", "country": "India",
+                "formatted": "Shivajinagar, Pune, Maharashtra, India"}
+
+    monkeypatch.setattr(location, "reverse_geocode", fake_reverse_geocode)
+    assert location.reverse_geocode_location(db, 18.53071, 73.84705)["city"] == "Pune"
+    # About 10 m away
+    assert location.reverse_geocode_location(db, 18.53080, 73.84712)["city"] == "Pune"
+    assert len(calls) == 1
+
+    # A new process only has the table
+    geocode_cache.reverse_memory_cache.clear()
+    assert location.reverse_geocode_location(db, 18.5306, 73.8472)["state"] == "Maharashtra"
+    assert len(calls) == 1
+    assert db.query(models.ReverseGeocodeCache).count() == 1
+
+    # Two cells away is looked up again
+    location.reverse_geocode_location(db, 18.5327, 73.8475)
+    assert len(calls) == 2
+    stats = geocode_cache.stats()["reverse"]
+    assert (stats["memory_hits"], stats["database_hits"], stats["misses"]) == (1, 1, 2)
+    assert stats["hit_rate"] == 0.5
+    # The address cache is counted separately
+    assert geocode_cache.stats()["lookups"] == 0
+
+    # Users with coordinates but no city get their components filled in
+    user = models.User(email="pune@example.com", role="household", latitude=18.53075, longitude=73.8474)
+    assert location.fill_address_components(db, user)
+    assert (user.city, user.state, user.country) == ("Pune", "Maharashtra", "India")
+    assert len(calls) == 2
+
+    # Failed lookups are not cached
+    assert location.reverse_geocode_location(db, 85.0, 10.0) is None
+    assert location.reverse_geocode_location(db, 85.0, 10.0) is None
+    assert len(calls) == 4
+    geocode_cache.reverse_memory_cache.clear()
+    db.close()
+
+def test_concurrent_cache_write_keeps_the_callers_changes(monkeypatch):
+    """Losing the race to cache an address doesn't roll back the user's update"""
+    db = make_session()
+    composter_index.clear()
+    geocode_cache.memory_cache.clear()
+    monkeypatch.setattr(location, "geocode", lambda address: {
+        "latitude": 18.5204, "longitude": 73.8567, "city": "Pune", "state": "Maharashtra",
+        "country": "India", "formatted": "FC Road, Pune, Maharashtra, India"})
+    user = models.User(email="a@example.com", role="household", is_active=True, address="Old address")
+    db.add(user)
+    db.commit()
+    selects = []
+
+    def insert_first(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "geocode_cache" in statement:
+            selects.append(statement)
+            # Between the store's SELECT and its INSERT
+            if len(selects) == 2:
+                conn.exec_driver_sql("INSERT INTO geocode_cache (address_key) VALUES (?)",
+                                     (geocode_cache.address_key("FC Road, Pune"),))
+
+    engine = db.get_bind()
+    event.listen(engine, "after_cursor_execute", insert_first)
+    try:
+        location.update_user_location(db, user.id, "FC Road, Pune")
+    finally:
+        event.remove(engine, "after_cursor_execute", insert_first)
+    assert len(selects) == 2
+    db.expire_all()
+    user = db.query(models.User).one()
+    assert (user.address, user.city, user.latitude) == ("FC Road, Pune", "Pune", 18.5204)
+    # The result is still reused by this process
+    assert geocode_cache.lookup(db, "FC Road, Pune")["city"] == "Pune"
+    composter_index.clear()
+    geocode_cache.memory_cache.clear()
+    db.close()
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -2,12 +2,12 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_geocoding():
     """Test the geocoding service"""
     try:
-        from backend.services.geocoding import get_coordinates_from_address, reverse_geocode
+        from services.geocoding import get_coordinates_from_address, reverse_geocode
         
         # Test forward geocoding (address to coordinates)
         address = "New Delhi, India"
@@ -0,0 +1,122 @@
+import sys
+import os
+import asyncio
+import time
+
+# Add the backend and testing directories to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from services import geocoding
+from services.geocoding import GeocodingClient, TokenBucket
+from fake_opencage_server import start_server
+
+@pytest.fixture
+def server():
+    server = start_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def use_client(monkeypatch, server, **options):
+    options.setdefault("rate", 0)
+    options.setdefault("backoff", 0.01)
+    client = GeocodingClient(base_url=server.base_url, **options)
+    monkeypatch.setattr(geocoding, "OPENCAGE_API_KEY", "test-key")
+    geocoding.set_client(client)
+    return client
+
+def teardown_function():
+    geocoding.set_client(None)
+
+def test_token_bucket_spaces_out_requests():
+    """The burst is free, later tokens are handed out at the configured rate"""
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    now[0] = 10.0
+    assert bucket.reserve() == 0
+
+def test_connections_are_kept_alive(monkeypatch, server):
+    """Sequential calls reuse one pooled connection"""
+    client = use_client(monkeypatch, server)
+    for i in range(20):
+        result = geocoding.geocode(f"House {i}, Mumbai")
+        assert result["city"] == "Mumbai" and result["state"] == "Maharashtra"
+    assert geocoding.reverse_geocode(28.61, 77.21)["city"] == "New Delhi"
+    assert server.stats()["requests"] == 21
+    assert server.stats()["connections"] == 1
+    assert client.stats()["rate_limit_remaining"] == 2499
+
+def test_retries_on_server_errors_and_rate_limits(monkeypatch, server):
+    """5xx and 429 responses are retried; errors after the last retry give None"""
+    client = use_client(monkeypatch, server, max_retries=3)
+    server.fail_first = 2
+    assert geocoding.geocode("Pune")["city"] == "Pune"
+    assert client.stats()["retries"] == 2
+
+    server.fail_first, server.fail_status, server.retry_after = 1, 429, 0
+    assert geocoding.geocode("Jaipur")["city"] == "Jaipur"
+    assert client.stats()["retries"] == 3
+
+    server.fail_first, server.fail_status = 10, 503
+    assert geocoding.geocode("Chennai") is None
+    assert client.stats()["errors"] == 1
+    # No results is not an error
+    server.fail_first = 0
+    assert geocoding.geocode("Nowhere at all") is None
+
+def test_long_retry_after_fails_without_waiting(monkeypatch, server):
+    """A Retry-After beyond max_retry_delay fails the call instead of sleeping"""
+    client = use_client(monkeypatch, server, max_retries=3, timeout=1)
+    assert client.max_retry_delay == 1
+    server.fail_first, server.fail_status, server.retry_after = 2, 429, 3600
+    start = time.perf_counter()
+    assert geocoding.geocode("Surat") is None
+    with pytest.raises(geocoding.requests.HTTPError):
+        asyncio.run(client.get_async({"q": "Surat", "key": "test-key"}))
+    assert time.perf_counter() - start < 0.5
+    assert server.stats()["requests"] == 2
+    stats = client.stats()
+    assert (stats["retries"], stats["errors"], stats["breaker"]["consecutive_failures"]) == (0, 2, 2)
+
+def test_timeouts(monkeypatch, server):
+    """A slow upstream fails fast instead of hanging the caller"""
+    use_client(monkeypatch, server, max_retries=0)
+    server.latency = 0.5
+    start = time.perf_counter()
+    assert geocoding.geocode("Lucknow", timeout=0.1) is None
+    assert time.perf_counter() - start < 0.45
+
+def test_rate_limit_keeps_under_the_plan(monkeypatch, server):
+    """Bursts are spread out so the provider never answers 429"""
+    use_client(monkeypatch, server, rate=20, burst=2)
+    server.rate_limit = 22
+    start = time.perf_counter()
+    for i in range(12):
+        assert geocoding.geocode(f"Shop {i}, Kolkata") is not None
+    assert time.perf_counter() - start >= 0.45
+    assert server.stats()["rate_limited"] == 0
+
+def test_async_interface(monkeypatch, server):
+    """Concurrent asyncio lookups overlap and share the retry logic"""
+    client = use_client(monkeypatch, server)
+    server.latency = 0.1
+    server.fail_first = 1
+
+    async def lookup_all():
+        return await asyncio.gather(*[geocoding.geocode_async(f"Flat {i}, Bengaluru") for i in range(8)])
+
+    start = time.perf_counter()
+    results = asyncio.run(lookup_all())
+    elapsed = time.perf_counter() - start
+    assert all(result["city"] == "Bengaluru" for result in results)
+    assert client.stats()["retries"] == 1
+    assert elapsed < 0.6
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
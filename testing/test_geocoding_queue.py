@@ -0,0 +1,176 @@
+import sys
+import os
+import threading
+import time
+from datetime import datetime
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models, schemas, crud
+from services import geocode_cache, location
+from services.geocoding_queue import GeocodingQueue
+from services.spatial_index import composter_index
+
+RESULT = {"latitude": 28.5677, "longitude": 77.2433, "city": "New Delhi", "state": "Delhi",
+          "country": "India", "formatted": "Lajpat Nagar, New Delhi, India"}
+
+def make_session(tmp_path):
+    # A file database, so worker threads get their own connections
+    engine = create_engine(f"sqlite:///{tmp_path / 'geocoding.db'}",
+                           connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def setup(monkeypatch, tmp_path, queue):
+    composter_index.clear()
+    geocode_cache.memory_cache.clear()
+    monkeypatch.setattr(crud, "geocoding_queue", queue)
+    return make_session(tmp_path)
+
+def test_entities_are_returned_before_geocoding(monkeypatch, tmp_path):
+    """Creation returns a pending entity; a worker fills in the location"""
+    queue = GeocodingQueue(workers=2, retry_seconds=0, asynchronous=True)
+    engine, db = setup(monkeypatch, tmp_path, queue)
+    composter = models.User(email="composter@example.com", role="composter", is_active=True,
+                            latitude=28.57, longitude=77.24)
+    db.add(composter)
+    db.commit()
+
+    release = threading.Event()
+
+    def slow_geocode(address):
+        release.wait(5)
+        return dict(RESULT)
+
+    monkeypatch.setattr(location, "geocode", slow_geocode)
+    user = crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret",
+                                                   role="household", address="Lajpat Nagar"))
+    listing = crud.create_waste_listing(db, schemas.WasteListingCreate(
+        title="Kitchen waste", quantity=5.0, waste_type=models.WasteType.ORGANIC,
+        pickup_location="Gate 2", address="Lajpat Nagar"), owner_id=user.id)
+    assert user.geocoding_status == "pending" and user.latitude is None
+    assert listing.geocoding_status == "pending" and listing.latitude is None
+
+    release.set()
+    assert queue.join(timeout=10)
+    db.expire_all()
+    assert (user.geocoding_status, user.latitude, user.city) == ("done", 28.5677, "New Delhi")
+    assert (listing.geocoding_status, listing.latitude) == ("done", 28.5677)
+    # Candidates are scored once the listing has coordinates
+    candidates = db.query(models.ListingCandidate).filter(
+        models.ListingCandidate.waste_listing_id == listing.id).all()
+    assert [c.composter_id for c in candidates] == [composter.id]
+    assert {job.status for job in db.query(models.GeocodingJob).all()} == {"done"}
+    assert queue.stats(db)["jobs"] == {"done": 2}
+
+    queue.shutdown()
+    composter_index.clear()
+    db.close()
+
+def test_failed_lookups_are_retried(monkeypatch, tmp_path):
+    """A failed lookup is retried, and gives up after the last attempt"""
+    queue = GeocodingQueue(workers=1, max_attempts=2, retry_seconds=0.01, asynchronous=True)
+    engine, db = setup(monkeypatch, tmp_path, queue)
+    results = {"Flaky road": [None, dict(RESULT)], "Nowhere": [None, None]}
+    monkeypatch.setattr(location, "geocode", lambda address: results[address].pop(0))
+
+    flaky = crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret",
+                                                    role="household", address="Flaky road"))
+    missing = crud.create_user(db, schemas.UserCreate(email="b@example.com", password="secret",
+                                                      role="household", address="Nowhere"))
+    assert queue.join(timeout=10)
+    db.expire_all()
+    assert (flaky.geocoding_status, flaky.latitude) == ("done", 28.5677)
+    assert (missing.geocoding_status, missing.latitude) == ("failed", None)
+    jobs = {job.address: job for job in db.query(models.GeocodingJob).all()}
+    assert (jobs["Flaky road"].attempts, jobs["Flaky road"].status) == (2, "done")
+    assert (jobs["Nowhere"].attempts, jobs["Nowhere"].status) == (2, "failed")
+
+    queue.shutdown()
+    db.close()
+
+def test_jobs_that_raise_are_not_left_running(monkeypatch, tmp_path):
+    """An error after a job is claimed retries it, and fails it after the last attempt"""
+    queue = GeocodingQueue(workers=1, max_attempts=2, retry_seconds=0.01, asynchronous=True)
+    engine, db = setup(monkeypatch, tmp_path, queue)
+    results = {"Flaky road": [RuntimeError("connection reset"), dict(RESULT)],
+               "Broken road": [RuntimeError("connection reset"), RuntimeError("connection reset")]}
+
+    def geocode(address):
+        result = results[address].pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(location, "geocode", geocode)
+    flaky = crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret",
+                                                    role="household", address="Flaky road"))
+    broken = crud.create_user(db, schemas.UserCreate(email="b@example.com", password="secret",
+                                                     role="household", address="Broken road"))
+    assert queue.join(timeout=10)
+    db.expire_all()
+    assert flaky.geocoding_status == "done" and broken.geocoding_status == "failed"
+    jobs = {job.address: job for job in db.query(models.GeocodingJob).all()}
+    assert (jobs["Flaky road"].attempts, jobs["Flaky road"].status) == (2, "done")
+    assert (jobs["Broken road"].attempts, jobs["Broken road"].status) == (2, "failed")
+    assert jobs["Broken road"].last_error == "connection reset"
+
+    queue.shutdown()
+    db.close()
+
+def test_shutdown_cancels_pending_retries(monkeypatch, tmp_path):
+    """Retries waiting on a timer are not started after shutdown"""
+    queue = GeocodingQueue(workers=1, max_attempts=3, retry_seconds=0.2, asynchronous=True)
+    engine, db = setup(monkeypatch, tmp_path, queue)
+    calls = []
+    monkeypatch.setattr(location, "geocode", lambda address: calls.append(address))
+
+    user = crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret",
+                                                   role="household", address="Nowhere"))
+    # Wait for the first attempt to schedule its retry
+    deadline = time.monotonic() + 5
+    while not queue._timers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue._timers
+    queue.shutdown()
+    assert queue.join(timeout=1)
+    time.sleep(0.3)
+    assert calls == ["Nowhere"] and queue._executor is None
+    db.expire_all()
+    # The job stays pending for resume_pending
+    job = db.query(models.GeocodingJob).one()
+    assert (job.status, job.attempts, user.geocoding_status) == ("pending", 1, "pending")
+    db.close()
+
+def test_pending_jobs_survive_restarts(monkeypatch, tmp_path):
+    """Jobs recorded by a previous process are resumed at startup"""
+    queue = GeocodingQueue(workers=1, retry_seconds=0, asynchronous=True)
+    engine, db = setup(monkeypatch, tmp_path, queue)
+    monkeypatch.setattr(location, "geocode", lambda address: dict(RESULT))
+
+    user = models.User(email="a@example.com", role="household", is_active=True,
+                       address="Lajpat Nagar", geocoding_status="pending")
+    db.add(user)
+    db.commit()
+    db.add(models.GeocodingJob(entity_type="user", entity_id=user.id, address="Lajpat Nagar",
+                               status="pending", attempts=0, created_at=datetime.utcnow(),
+                               updated_at=datetime.utcnow()))
+    db.commit()
+
+    assert queue.resume_pending(engine) == 1
+    assert queue.join(timeout=10)
+    db.expire_all()
+    assert (user.geocoding_status, user.latitude) == ("done", 28.5677)
+    # Nothing is left to resume
+    assert queue.resume_pending(engine) == 0
+
+    queue.shutdown()
+    db.close()
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
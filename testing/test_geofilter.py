@@ -0,0 +1,123 @@
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import numpy as np
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, crud
+from services.geofilter import bounding_box, bbox_filter
+from services.matching import haversine_km
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def test_bounding_box_contains_the_radius():
+    """Every point within the radius lies inside the box"""
+    rng = np.random.default_rng(1)
+    for latitude, longitude in [(28.6, 77.2), (8.5, 76.9), (34.1, 74.8), (-60.0, 179.9)]:
+        min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, 50)
+        lats = latitude + (rng.random(2000) - 0.5) * 2
+        lngs = longitude + (rng.random(2000) - 0.5) * 4
+        inside = haversine_km(latitude, longitude, lats, lngs) <= 50
+        # Longitudes past the antimeridian are compared unwrapped
+        assert np.all((lats[inside] >= min_lat) & (lats[inside] <= max_lat))
+        assert np.all((lngs[inside] >= min_lng) & (lngs[inside] <= max_lng))
+
+def test_bbox_query_uses_composite_index():
+    """SQLite plans composter bounding box queries on (role, latitude, longitude)"""
+    db = make_session()
+    query = db.query(models.User.id).filter(
+        models.User.role == "composter",
+        bbox_filter(models.User.latitude, models.User.longitude, 28.6, 77.2, 50)
+    )
+    statement = query.statement.compile(compile_kwargs={"literal_binds": True})
+    plan = " ".join(str(row) for row in db.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+    assert "ix_users_role_lat_lng" in plan
+    db.close()
+
+def test_waste_listings_within_radius():
+    """Listings are filtered by exact distance and ordered closest first"""
+    db = make_session()
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    db.add(owner)
+    db.flush()
+    positions = {
+        "near": (28.62, 77.21),
+        "closest": (28.601, 77.201),
+        # Inside the bounding box corner but further than 10 km
+        "corner": (28.68, 77.29),
+        "far": (19.07, 72.87),
+    }
+    for title, (latitude, longitude) in positions.items():
+        db.add(models.WasteListing(title=title, quantity=5.0, waste_type=models.WasteType.ORGANIC,
+                                   pickup_location="Somewhere", owner_id=owner.id,
+                                   latitude=latitude, longitude=longitude,
+                                   status=models.WasteListingStatus.AVAILABLE))
+    db.add(models.WasteListing(title="unlocated", quantity=5.0, waste_type=models.WasteType.ORGANIC,
+                               pickup_location="Somewhere", owner_id=owner.id,
+                               status=models.WasteListingStatus.AVAILABLE))
+    db.commit()
+
+    listings = crud.get_waste_listings(db, latitude=28.6, longitude=77.2, radius_km=10,
+                                       status=models.WasteListingStatus.AVAILABLE)
+    assert [listing.title for listing in listings] == ["closest", "near"]
+    assert len(crud.get_waste_listings(db)) == 5
+    db.close()
+
+def test_radius_search_reads_pages_of_listings(monkeypatch):
+    """The database returns listings closest first a page at a time, not the whole box"""
+    db = make_session()
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    db.add(owner)
+    db.flush()
+    rng = np.random.default_rng(2)
+    inside = [(28.6 + dlat, 77.2 + dlng) for dlat, dlng in (rng.random((30, 2)) - 0.5) * 0.1]
+    # Inside the bounding box corner but further than 10 km, at one spot
+    corner = [(28.68, 77.29)] * 30
+    for i, (latitude, longitude) in enumerate(inside + corner + [(19.07, 72.87)] * 100):
+        db.add(models.WasteListing(title=f"Listing {i}", quantity=5.0, waste_type=models.WasteType.ORGANIC,
+                                   pickup_location="Somewhere", owner_id=owner.id,
+                                   latitude=latitude, longitude=longitude))
+    db.commit()
+    distances = haversine_km(28.6, 77.2, np.array([p[0] for p in inside]), np.array([p[1] for p in inside]))
+    expected = [f"Listing {i}" for i in np.argsort(distances, kind="stable")]
+
+    fetched = []
+
+    def count_rows(conn, cursor, statement, parameters, context, executemany):
+        if "waste_listings" in statement and "LIMIT" in statement:
+            fetched.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "after_cursor_execute", count_rows)
+    try:
+        listings = crud.get_waste_listings(db, skip=5, limit=10, latitude=28.6, longitude=77.2, radius_km=10)
+        assert [listing.title for listing in listings] == expected[5:15]
+        assert len(fetched) == 1
+        # Asking for more than the radius holds pages through the corner listings
+        monkeypatch.setattr(crud, "RADIUS_OVERFETCH", 1)
+        fetched.clear()
+        listings = crud.get_waste_listings(db, limit=35, latitude=28.6, longitude=77.2, radius_km=10)
+        assert [listing.title for listing in listings] == expected
+        assert len(fetched) == 2
+    finally:
+        event.remove(engine, "after_cursor_execute", count_rows)
+    db.close()
+
+if __name__ == "__main__":
+    print("Running tests for the bounding box filter...")
+    test_bounding_box_contains_the_radius()
+    test_bbox_query_uses_composite_index()
+    test_waste_listings_within_radius()
+    print("All tests passed!")
@@ -0,0 +1,144 @@
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, schemas, crud
+from services import recommendations
+from services.spatial_index import composter_index
+
+def make_session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def test_candidates_are_precomputed_and_refreshed():
+    """Reads use stored candidates; composter changes mark them for rescoring"""
+    engine, session_factory = make_session_factory()
+    db = session_factory()
+    composter_index.clear()
+    recommendations.recommendation_cache.clear()
+
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    composter = models.User(email="composter@example.com", role="composter", is_active=True,
+                            latitude=28.61, longitude=77.21)
+    db.add_all([owner, composter])
+    db.commit()
+    listing = crud.create_waste_listing(db, schemas.WasteListingCreate(
+        title="Kitchen waste", quantity=5.0, waste_type=models.WasteType.ORGANIC,
+        pickup_location="Delhi", latitude=28.62, longitude=77.22), owner_id=owner.id)
+    listing_id = listing.id
+
+    # The background stage stores the scored candidates
+    recommendations.precompute_listing_candidates(listing_id, session_factory=session_factory)
+    rows = db.query(models.ListingCandidate).filter(models.ListingCandidate.waste_listing_id == listing_id).all()
+    assert [(row.composter_id, row.rank) for row in rows] == [(composter.id, 0)]
+    assert rows[0].score > 0
+
+    # Reading recommendations doesn't score composters again
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        recommended = crud.get_recommended_composters(db, listing_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert [c.id for c in recommended] == [composter.id]
+    assert not any("composter_loads" in statement for statement in statements)
+
+    # A new nearby composter marks the stored candidates stale
+    crud.create_user(db, schemas.UserCreate(email="near@example.com", password="secret",
+                                            role="composter", latitude=28.62, longitude=77.22))
+    assert db.query(models.ListingCandidate).filter(models.ListingCandidate.stale == True).count() == 1
+
+    # Reads score stale candidates again without writing them
+    statements.clear()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        recommended = crud.get_recommended_composters(db, listing_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert len(recommended) == 2
+    assert not any(statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")) for statement in statements)
+    assert db.query(models.ListingCandidate).filter(models.ListingCandidate.stale == True).count() == 1
+
+    # The refresh job rescores them
+    assert recommendations.refresh_stale_candidates(db) == [listing_id]
+    rows = db.query(models.ListingCandidate).filter(models.ListingCandidate.waste_listing_id == listing_id).all()
+    assert len(rows) == 2 and not any(row.stale for row in rows)
+    assert recommendations.refresh_stale_candidates(db) == []
+
+    composter_index.clear()
+    recommendations.recommendation_cache.clear()
+    db.close()
+
+def test_deactivated_composters_leave_stored_candidates():
+    """Rows naming a deactivated composter are rescored, even without coordinates"""
+    engine, session_factory = make_session_factory()
+    db = session_factory()
+    composter_index.clear()
+    recommendations.recommendation_cache.clear()
+
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    # Matched on city alone, so no position leads back to the listing
+    composter = models.User(email="composter@example.com", role="composter", is_active=True, city="Delhi")
+    db.add_all([owner, composter])
+    db.commit()
+    listing = crud.create_waste_listing(db, schemas.WasteListingCreate(
+        title="Kitchen waste", quantity=5.0, waste_type=models.WasteType.ORGANIC,
+        pickup_location="Delhi", city="Delhi"), owner_id=owner.id)
+    recommendations.precompute_listing_candidates(listing.id, session_factory=session_factory)
+    assert db.query(models.ListingCandidate).filter(models.ListingCandidate.stale == True).count() == 0
+
+    crud.deactivate_user(db, composter.id)
+    assert db.query(models.ListingCandidate).filter(models.ListingCandidate.stale == True).count() == 1
+    assert crud.get_recommended_composters(db, listing.id) == []
+
+    composter_index.clear()
+    recommendations.recommendation_cache.clear()
+    db.close()
+
+def test_pending_pickup_listings_are_refreshed():
+    """Listings awaiting pickup are still recommended, so their rows are rescored"""
+    engine, session_factory = make_session_factory()
+    db = session_factory()
+    composter_index.clear()
+    recommendations.recommendation_cache.clear()
+
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    composter = models.User(email="composter@example.com", role="composter", is_active=True,
+                            latitude=28.61, longitude=77.21)
+    db.add_all([owner, composter])
+    db.commit()
+    listings = [crud.create_waste_listing(db, schemas.WasteListingCreate(
+        title="Kitchen waste", quantity=5.0, waste_type=models.WasteType.ORGANIC,
+        pickup_location="Delhi", latitude=28.62, longitude=77.22), owner_id=owner.id) for _ in range(3)]
+    crud.assign_composter_to_waste_listing(db, listings[1].id, composter.id)
+    crud.update_waste_listing_status(db, listings[2].id, models.WasteListingStatus.COMPLETED)
+
+    # Closed listings are left alone
+    assert recommendations.refresh_stale_candidates(db) == [listings[0].id, listings[1].id]
+    assert recommendations.refresh_stale_candidates(db) == []
+
+    composter_index.clear()
+    recommendations.recommendation_cache.clear()
+    db.close()
+
+if __name__ == "__main__":
+    print("Running tests for precomputed listing candidates...")
+    test_candidates_are_precomputed_and_refreshed()
+    test_deactivated_composters_leave_stored_candidates()
+    test_pending_pickup_listings_are_refreshed()
+    print("All tests passed!")
@@ -2,13 +2,13 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_location_service():
     """Test the location service"""
     try:
         # Import the function directly from the module
-        from backend.services.location import populate_location_data
+        from services.location import populate_location_data
         
         # Mock database session and object
         class MockDB:
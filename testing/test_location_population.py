@@ -2,15 +2,15 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_location_population():
     """Test that location data is populated correctly"""
     try:
         # Import required modules
-        from backend.services.location import populate_location_data
-        from backend.services.geocoding import get_coordinates_from_address, reverse_geocode
-        from backend import models
+        from services.location import populate_location_data
+        from services.geocoding import get_coordinates_from_address, reverse_geocode
+        import models
         from sqlalchemy import create_engine
         from sqlalchemy.orm import sessionmaker
         
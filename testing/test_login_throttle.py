@@ -0,0 +1,207 @@
+import sys
+import os
+import asyncio
+import threading
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import pytest
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+import models, schemas, crud
+from services import passwords
+from services.passwords import PasswordHasher
+from services.throttle import (DatabaseBucketStore, LoginThrottle, LoginThrottled, MemoryBucketStore,
+                               client_ip, parse_proxies)
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def make_throttle(store=None, now=None):
+    if store is None:
+        store = MemoryBucketStore(clock=lambda: now[0])
+    return LoginThrottle(store=store, ip_burst=4, ip_per_minute=60,
+                         email_burst=2, email_per_minute=6, enabled=True)
+
+def test_buckets_refill_over_time():
+    now = [0.0]
+    store = MemoryBucketStore(clock=lambda: now[0])
+    assert [store.take("k", 3, 0.5)[0] for _ in range(4)] == [True, True, True, False]
+    assert store.take("k", 3, 0.5) == (False, 2.0)
+    now[0] = 2.0
+    assert store.take("k", 3, 0.5) == (True, 0.0)
+    assert not store.take("k", 3, 0.5)[0]
+    # Idle buckets fill up to their capacity only
+    now[0] = 100.0
+    assert [store.take("k", 3, 0.5)[0] for _ in range(4)] == [True, True, True, False]
+
+def test_limits_by_ip_and_by_email():
+    now = [0.0]
+    throttle = make_throttle(now=now)
+    throttle.check("10.0.0.1", "a@example.com")
+    throttle.check("10.0.0.1", "A@Example.com ")
+    with pytest.raises(LoginThrottled) as error:
+        throttle.check("10.0.0.2", "a@example.com")
+    assert error.value.scope == "account" and error.value.retry_after == pytest.approx(10)
+
+    # One client trying many accounts
+    throttle.check("10.0.0.1", "b@example.com")
+    throttle.check("10.0.0.1", "c@example.com")
+    with pytest.raises(LoginThrottled) as error:
+        throttle.check("10.0.0.1", "d@example.com")
+    assert error.value.scope == "client"
+    assert throttle.stats()["rejected_ip"] == 1 and throttle.stats()["rejected_email"] == 1
+
+    # A successful login refills the account's bucket
+    throttle.succeeded("a@example.com")
+    throttle.check("10.0.0.3", "a@example.com")
+    stats = throttle.stats()
+    assert (stats["allowed"], stats["successes"], stats["rejected_rate"]) == (5, 1, round(2 / 7, 4))
+
+def test_disabled_throttle_allows_everything():
+    throttle = LoginThrottle(ip_burst=1, email_burst=1, enabled=False)
+    for _ in range(10):
+        throttle.check("10.0.0.1", "a@example.com")
+    assert throttle.stats()["allowed"] == 0
+
+def make_request(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "POST", "path": "/token", "headers": headers,
+                    "client": (peer, 5000)})
+
+def test_client_ip_behind_proxies():
+    """Clients behind a trusted proxy get their own bucket; the header can't be forged around it"""
+    # Without trusted proxies the header is ignored
+    assert client_ip(make_request("100.64.0.7", "203.0.113.9"), parse_proxies("")) == "100.64.0.7"
+
+    # A platform proxy such as Railway's, which is the only peer
+    railway = parse_proxies("*")
+    assert client_ip(make_request("100.64.0.7", "203.0.113.9"), railway) == "203.0.113.9"
+    assert client_ip(make_request("100.64.0.7", "1.2.3.4, 203.0.113.9"), railway) == "203.0.113.9"
+    assert client_ip(make_request("100.64.0.7"), railway) == "100.64.0.7"
+
+    # A chain of own proxies; only they are trusted
+    own = parse_proxies("10.0.0.0/8, 192.168.1.5, not-an-ip")
+    assert client_ip(make_request("10.1.2.3", "1.2.3.4, 203.0.113.9, 192.168.1.5"), own) == "203.0.113.9"
+    assert client_ip(make_request("198.51.100.2", "203.0.113.9"), own) == "198.51.100.2"
+
+    # Two clients behind the same proxy are throttled separately
+    now = [0.0]
+    throttle = make_throttle(now=now)
+    for _ in range(4):
+        throttle.check(client_ip(make_request("100.64.0.7", "203.0.113.9"), railway), "a@example.com")
+        throttle.succeeded("a@example.com")
+    with pytest.raises(LoginThrottled):
+        throttle.check(client_ip(make_request("100.64.0.7", "203.0.113.9"), railway), "a@example.com")
+    throttle.check(client_ip(make_request("100.64.0.7", "203.0.113.10"), railway), "a@example.com")
+
+def test_database_buckets_are_shared(tmp_path):
+    """Worker processes with the database backend share their limits"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'throttle.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    now = [1000.0]
+    first, second = (make_throttle(store=DatabaseBucketStore(engine, clock=lambda: now[0])) for _ in range(2))
+    first.check("10.0.0.1", "a@example.com")
+    second.check("10.0.0.2", "a@example.com")
+    with pytest.raises(LoginThrottled):
+        first.check("10.0.0.3", "a@example.com")
+    now[0] += 10
+    second.check("10.0.0.3", "a@example.com")
+    assert len(first.store) == 4
+    now[0] += 7200
+    assert first.store.prune() == 4
+
+def test_concurrent_first_attempts_share_a_bucket(tmp_path):
+    """A key inserted by another process between the SELECT and the INSERT is reused"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'throttle.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    store = DatabaseBucketStore(engine, clock=lambda: 1000.0)
+    inserted = []
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def insert_first(conn, cursor, statement, parameters, context, executemany):
+        if not inserted and statement.lstrip().upper().startswith("SELECT"):
+            inserted.append(statement)
+            with engine.begin() as other:
+                other.execute(models.LoginThrottleBucket.__table__.insert().values(
+                    key="ip:10.0.0.1", tokens=1.0, updated_at=1000.0))
+
+    allowed, retry_after = store.take("ip:10.0.0.1", capacity=4, rate=1)
+    assert inserted and allowed
+    # The other process's attempt counted: its last token is gone
+    assert store.take("ip:10.0.0.1", capacity=4, rate=1)[0] is False
+    assert len(store) == 1
+
+def test_database_store_runs_off_the_event_loop(tmp_path):
+    """Row locks on the bucket table don't block other requests on the loop"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'throttle.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    store = DatabaseBucketStore(engine)
+    throttle = make_throttle(store=store)
+    release = threading.Event()
+    threads = []
+    take, reset = store.take, store.reset
+
+    def slow_take(key, capacity, rate):
+        threads.append(threading.get_ident())
+        release.wait(5)
+        return take(key, capacity, rate)
+
+    def tracked_reset(key):
+        threads.append(threading.get_ident())
+        return reset(key)
+
+    store.take, store.reset = slow_take, tracked_reset
+
+    async def login_while_serving():
+        login = asyncio.ensure_future(throttle.check_async("10.0.0.1", "a@example.com"))
+        # The loop keeps running while the store waits
+        await asyncio.sleep(0.05)
+        assert not login.done()
+        release.set()
+        await login
+        await throttle.succeeded_async("a@example.com")
+
+    asyncio.run(login_while_serving())
+    assert len(threads) == 3 and threading.get_ident() not in threads
+    assert throttle.stats()["allowed"] == 1 and len(store) == 1
+
+def test_rejected_logins_are_not_hashed(monkeypatch):
+    import main
+    engine, db = make_session()
+    hasher = PasswordHasher(workers=1)
+    monkeypatch.setattr(passwords, "password_hasher", hasher)
+    monkeypatch.setattr(main, "login_throttle", make_throttle(store=MemoryBucketStore()))
+    crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret", role="buyer"))
+    hashed = hasher.stats()["completed"]
+
+    def login(password):
+        request = Request({"type": "http", "method": "POST", "path": "/token", "headers": [],
+                           "client": ("10.0.0.1", 5000)})
+        form = OAuth2PasswordRequestForm(username="a@example.com", password=password)
+        return asyncio.run(main.login_for_access_token(request, form, db))
+
+    for _ in range(2):
+        with pytest.raises(main.HTTPException):
+            login("wrong")
+    with pytest.raises(LoginThrottled):
+        login("secret")
+    assert hasher.stats()["completed"] == hashed + 2
+    response = main.login_throttled(None, LoginThrottled("account", 9.2))
+    assert response.status_code == 429 and response.headers["retry-after"] == "10"
+    hasher.shutdown()
+    db.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
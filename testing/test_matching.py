@@ -2,12 +2,12 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_imports():
     """Test that we can import our matching module without errors"""
     try:
-        from backend.services import matching
+        from services import matching
         print("Successfully imported matching module")
         return True
     except Exception as e:
@@ -77,7 +77,7 @@ def test_algorithm_logic():
     )
     
     # Test the scoring function directly
-    from backend.services.matching import ComposterMatcher
+    from services.matching import ComposterMatcher
     
     # Create a mock database session that returns predefined data
     class MockDB:
@@ -0,0 +1,36 @@
+import sys
+import os
+import json
+
+# Add the testing directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_matching import run_benchmark, compare_reports
+
+def test_benchmark_report(tmp_path):
+    """A small benchmark run produces a complete report and compares to itself"""
+    report = run_benchmark([200], listings=2000, queries=10, data_dir=str(tmp_path),
+                           warmup=1, memory_queries=3)
+    json.dumps(report)
+    result = report["results"][0]
+    assert result["composters"] == 200 and result["listings"] == 2000
+    assert result["latency_ms"]["p50"] > 0
+    assert result["sql_queries_per_call"]["max"] <= 5
+    assert result["peak_memory_mb"]["max"] > 0
+    assert result["recommended_per_call"] > 0
+
+    # Cached datasets are reused
+    again = run_benchmark([200], listings=2000, queries=10, data_dir=str(tmp_path),
+                          warmup=1, memory_queries=3)
+    assert again["results"][0]["dataset_generation_seconds"] == 0.0
+
+    slower = json.loads(json.dumps(report))
+    slower["results"][0]["latency_ms"]["p50"] *= 2
+    assert compare_reports(report, report) == []
+    assert len(compare_reports(slower, report)) == 1
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    print("Running tests for the matching benchmark...")
+    test_benchmark_report(pathlib.Path(tempfile.mkdtemp()))
+    print("All tests passed!")
@@ -0,0 +1,82 @@
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+from services.spatial_index import composter_index
+from services.matching import ComposterMatcher
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def count_recommendation_queries(composter_count):
+    """Return the number of SQL statements one recommendation call sends"""
+    engine, db = make_session()
+    composter_index.clear()
+
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    db.add(owner)
+    composters = []
+    for i in range(composter_count):
+        composter = models.User(email=f"composter{i}@example.com", role="composter",
+                                is_active=True, latitude=28.5 + i * 0.001,
+                                longitude=77.2, city="Delhi")
+        db.add(composter)
+        composters.append(composter)
+    db.flush()
+    # Give every composter some existing load
+    for composter in composters:
+        db.add(models.WasteListing(title="Assigned", quantity=1.0,
+                                   waste_type=models.WasteType.ORGANIC,
+                                   pickup_location="Delhi", owner_id=owner.id,
+                                   composter_id=composter.id,
+                                   status=models.WasteListingStatus.PENDING_PICKUP))
+    listing = models.WasteListing(title="Kitchen waste", quantity=5.0,
+                                  waste_type=models.WasteType.ORGANIC,
+                                  pickup_location="Delhi", owner_id=owner.id,
+                                  latitude=28.5, longitude=77.2)
+    db.add(listing)
+    db.commit()
+    listing_id = listing.id
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        recommended = ComposterMatcher(db).get_recommended_composters(listing_id, limit=10)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert len(recommended) == min(10, composter_count)
+    composter_index.clear()
+    db.close()
+    return len(statements)
+
+def test_recommendation_query_count_is_constant():
+    """The number of queries does not grow with the number of composters"""
+    small = count_recommendation_queries(5)
+    large = count_recommendation_queries(200)
+    print(f"Queries with 5 composters: {small}, with 200 composters: {large}")
+    assert small == large
+    # Listing, index build, candidate composters and one grouped load count
+    assert large <= 4
+
+if __name__ == "__main__":
+    print("Running query count tests for matching...")
+    test_recommendation_query_count_is_constant()
+    print("All tests passed!")
@@ -0,0 +1,109 @@
+import sys
+import os
+import random
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import numpy as np
+from geopy.distance import geodesic
+
+import models
+from services.matching import ComposterMatcher, DISTANCE_BANDS_KM, haversine_km
+
+class MockUser:
+    def __init__(self, id, latitude=None, longitude=None, city=None, state=None, location=None):
+        self.id = id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.city = city
+        self.state = state
+        self.location = location
+
+class MockWasteListing:
+    def __init__(self, waste_type, latitude=None, longitude=None, city=None, state=None, pickup_location=None):
+        self.waste_type = waste_type
+        self.latitude = latitude
+        self.longitude = longitude
+        self.city = city
+        self.state = state
+        self.pickup_location = pickup_location
+
+def make_composters(count, seed=42):
+    rng = random.Random(seed)
+    composters = []
+    for i in range(count):
+        if i % 10 == 0:
+            # Some composters only have a city
+            composters.append(MockUser(i, city=rng.choice(["Delhi", "Noida", "Pune"]), state="Delhi"))
+        else:
+            composters.append(MockUser(i, latitude=28.6 + rng.uniform(-1, 1),
+                                       longitude=77.2 + rng.uniform(-1, 1), city="Delhi"))
+    loads = {c.id: rng.randint(0, 25) for c in composters}
+    return composters, loads
+
+def near_band_edge(listing, composter, tolerance=0.005):
+    """True when the geodesic distance is within 0.5% of a band boundary"""
+    if not (composter.latitude and composter.longitude):
+        return False
+    distance = geodesic((listing.latitude, listing.longitude),
+                        (composter.latitude, composter.longitude)).kilometers
+    return bool(np.any(np.abs(distance - DISTANCE_BANDS_KM) <= DISTANCE_BANDS_KM * tolerance))
+
+def test_haversine_matches_geodesic():
+    """Haversine distances agree with geodesic distances to within 0.5%"""
+    latitudes = np.array([28.7, 19.07, 12.97, 22.57])
+    longitudes = np.array([77.1, 72.87, 77.59, 88.36])
+    distances = haversine_km(28.61, 77.21, latitudes, longitudes)
+    for distance, lat, lng in zip(distances, latitudes, longitudes):
+        expected = geodesic((28.61, 77.21), (lat, lng)).kilometers
+        assert abs(distance - expected) <= expected * 0.005
+
+def test_batch_scores_match_scalar_scores():
+    """The vectorized scores match _calculate_match_score away from band edges"""
+    listing = MockWasteListing(models.WasteType.ORGANIC, latitude=28.61, longitude=77.21,
+                               city="Delhi", state="Delhi")
+    composters, loads = make_composters(500)
+    matcher = ComposterMatcher(db=None)
+
+    batch = matcher._score_composters(listing, composters, loads)
+    scalar = [matcher._calculate_match_score(listing, c, current_load=loads[c.id]) for c in composters]
+
+    for composter, batch_score, scalar_score in zip(composters, batch, scalar):
+        if near_band_edge(listing, composter):
+            assert abs(batch_score - scalar_score) <= 15
+        else:
+            assert batch_score == scalar_score
+
+def test_precise_mode_matches_scalar_ranking():
+    """The geodesic mode reproduces the scalar scores and ranking exactly"""
+    listing = MockWasteListing(models.WasteType.PLASTIC, latitude=28.61, longitude=77.21,
+                               city="Delhi", state="Delhi")
+    composters, loads = make_composters(200, seed=7)
+    matcher = ComposterMatcher(db=None, precise=True)
+
+    batch = matcher._score_composters(listing, composters, loads)
+    scalar = [matcher._calculate_match_score(listing, c, current_load=loads[c.id]) for c in composters]
+    assert list(batch) == scalar
+
+    batch_ranking = [composters[i].id for i in np.argsort(-batch, kind="stable")]
+    scalar_ranking = [c.id for c, _ in sorted(zip(composters, scalar), key=lambda x: x[1], reverse=True)]
+    assert batch_ranking == scalar_ranking
+
+def test_listing_without_coordinates_uses_fallback():
+    """Listings without coordinates are scored by city matching only"""
+    listing = MockWasteListing(models.WasteType.ORGANIC, city="Delhi", state="Delhi")
+    composters, loads = make_composters(50, seed=3)
+    matcher = ComposterMatcher(db=None)
+
+    batch = matcher._score_composters(listing, composters, loads)
+    scalar = [matcher._calculate_match_score(listing, c, current_load=loads[c.id]) for c in composters]
+    assert list(batch) == scalar
+
+if __name__ == "__main__":
+    print("Running tests for vectorized matching...")
+    test_haversine_matches_geodesic()
+    test_batch_scores_match_scalar_scores()
+    test_precise_mode_matches_scalar_ranking()
+    test_listing_without_coordinates_uses_fallback()
+    print("All tests passed!")
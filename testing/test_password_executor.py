@@ -0,0 +1,101 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, schemas, crud, auth
+from services import passwords
+from services.passwords import PasswordHasher, PasswordHasherBusy
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+@pytest.fixture
+def hasher(monkeypatch):
+    hasher = PasswordHasher(workers=2, max_pending=8)
+    monkeypatch.setattr(passwords, "password_hasher", hasher)
+    yield hasher
+    hasher.shutdown()
+
+def test_hash_and_verify_run_on_the_pool(hasher):
+    threads = []
+    def record(password):
+        threads.append(threading.current_thread().name)
+        return passwords.pwd_context.hash(password)
+    hashed = hasher.submit(record, "secret").result()
+    assert threads[0].startswith("password-hash")
+    assert passwords.verify_password("secret", hashed)
+    assert not passwords.verify_password("wrong", hashed)
+    assert not passwords.verify_password("secret", None)
+    stats = hasher.stats()
+    assert (stats["workers"], stats["completed"], stats["queue_depth"], stats["running"]) == (2, 3, 0, 0)
+
+def test_queue_is_bounded(hasher):
+    """Once max_pending calls are waiting, new ones are refused"""
+    release = threading.Event()
+    running = [hasher.submit(release.wait) for _ in range(2)]
+    while hasher.stats()["running"] < 2:
+        time.sleep(0.01)
+    waiting = [hasher.submit(lambda: True) for _ in range(8)]
+    assert hasher.stats()["queue_depth"] == 8
+    with pytest.raises(PasswordHasherBusy):
+        hasher.submit(lambda: True)
+    assert hasher.stats()["rejected"] == 1
+
+    release.set()
+    assert all(future.result(timeout=5) for future in running + waiting)
+    assert hasher.stats()["queue_depth"] == 0
+    assert hasher.stats()["max_wait_ms"] > 0
+
+def test_event_loop_keeps_running_while_verifying(hasher):
+    hashed = passwords.pwd_context.hash("secret")
+
+    async def scenario():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*[passwords.verify_password_async("secret", hashed) for _ in range(4)])
+        task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(scenario())
+    assert results == [True] * 4
+    # Four bcrypt checks take long enough for many loop iterations
+    assert ticks > 10
+
+def test_sign_up_and_login_use_the_pool(hasher):
+    db = make_session()
+    user = crud.create_user(db, schemas.UserCreate(email="a@example.com", password="secret", role="buyer"))
+    assert passwords.pwd_context.verify("secret", user.hashed_password)
+    assert auth.authenticate_user(db, "a@example.com", "secret").id == user.id
+
+    found = asyncio.run(auth.authenticate_user_async(db, "a@example.com", "secret"))
+    assert found.id == user.id and found.email == "a@example.com"
+    assert asyncio.run(auth.authenticate_user_async(db, "a@example.com", "wrong")) is False
+    # The login does not keep a connection checked out while hashing
+    assert not db.in_transaction()
+    assert asyncio.run(auth.authenticate_user_async(db, "b@example.com", "secret")) is False
+    assert hasher.stats()["completed"] == 4
+    db.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,89 @@
+import sys
+import os
+import asyncio
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, auth
+import benchmark_password_hash
+from services import passwords
+from services.passwords import PasswordHasher, build_context
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def use_context(monkeypatch, context):
+    hasher = PasswordHasher(workers=1, context=context)
+    monkeypatch.setattr(passwords, "password_hasher", hasher)
+    return hasher
+
+def add_user(db, hashed_password):
+    user = models.User(email="a@example.com", role="buyer", is_active=True, hashed_password=hashed_password)
+    db.add(user)
+    db.commit()
+    return user
+
+def test_outdated_hashes_need_an_update():
+    context = build_context("bcrypt", 5, ["pbkdf2_sha256"])
+    assert not context.needs_update(context.hash("secret"))
+    # Lower and higher costs are both brought to the configured one
+    assert context.needs_update(build_context("bcrypt", 4).hash("secret"))
+    assert context.needs_update(build_context("bcrypt", 6).hash("secret"))
+    legacy = build_context("pbkdf2_sha256", 1000).hash("secret")
+    assert context.verify("secret", legacy) and context.needs_update(legacy)
+
+def test_login_rehashes_with_the_current_cost(monkeypatch):
+    db = make_session()
+    user = add_user(db, build_context("bcrypt", 4).hash("secret"))
+    hasher = use_context(monkeypatch, build_context("bcrypt", 5))
+
+    assert auth.authenticate_user(db, "a@example.com", "wrong") is False
+    assert db.query(models.User).one().hashed_password.startswith("$2b$04$")
+    assert auth.authenticate_user(db, "a@example.com", "secret").id == user.id
+    upgraded = db.query(models.User).one().hashed_password
+    assert upgraded.startswith("$2b$05$")
+    # Already current: nothing is written
+    auth.authenticate_user(db, "a@example.com", "secret")
+    assert db.query(models.User).one().hashed_password == upgraded
+    assert hasher.stats()["upgraded"] == 1
+    hasher.shutdown()
+    db.close()
+
+def test_async_login_migrates_schemes(monkeypatch):
+    db = make_session()
+    add_user(db, build_context("bcrypt", 4).hash("secret"))
+    hasher = use_context(monkeypatch, build_context("pbkdf2_sha256", 1000, ["bcrypt"]))
+
+    user = asyncio.run(auth.authenticate_user_async(db, "a@example.com", "secret"))
+    assert user.hashed_password.startswith("$pbkdf2-sha256$1000$")
+    assert db.query(models.User).one().hashed_password == user.hashed_password
+    assert asyncio.run(auth.authenticate_user_async(db, "a@example.com", "secret")).email == "a@example.com"
+    assert hasher.stats()["upgraded"] == 1 and hasher.stats()["scheme"] == "pbkdf2_sha256"
+    hasher.shutdown()
+    db.close()
+
+def test_benchmark_recommends_the_highest_cost_within_budget():
+    rounds = benchmark_password_hash.parse_rounds(["bcrypt=4,5", "pbkdf2_sha256=1000"])
+    assert rounds == {"bcrypt": [4, 5], "pbkdf2_sha256": [1000]}
+    results = benchmark_password_hash.run_benchmark(["bcrypt", "pbkdf2_sha256"], rounds, samples=2)
+    assert [(r["scheme"], r["rounds"]) for r in results] == [("bcrypt", 4), ("bcrypt", 5), ("pbkdf2_sha256", 1000)]
+    assert all(r["verify_ms"] > 0 and r["logins_per_core_second"] > 0 for r in results)
+
+    best = benchmark_password_hash.recommend(results, target_ms=10000)
+    assert best["bcrypt"]["rounds"] == 5 and best["pbkdf2_sha256"]["rounds"] == 1000
+    assert benchmark_password_hash.recommend(results, target_ms=0) == {}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,127 @@
+import sys
+import os
+from datetime import timedelta
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, schemas, crud, auth
+from services import principals
+from services.cache import TTLCache
+from services.revocation import RevocationIndex
+from services.spatial_index import composter_index
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def count_user_queries(engine):
+    queries = []
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            queries.append(statement)
+    return queries
+
+@pytest.fixture
+def setup(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(auth, "SECRET_KEY", "test-secret")
+    monkeypatch.setattr(principals, "principal_cache", TTLCache(maxsize=100, ttl=60, clock=lambda: now[0]))
+    index = RevocationIndex(capacity=100)
+    monkeypatch.setattr(auth, "revocation_index", index)
+    monkeypatch.setattr(crud, "revocation_index", index)
+    composter_index.clear()
+    engine, db = make_session()
+    user = models.User(email="composter@example.com", role="composter", is_active=True,
+                       city="Pune", latitude=18.52, longitude=73.85)
+    db.add(user)
+    db.commit()
+    token = auth.create_access_token({"sub": user.email, "role": "composter", "uid": user.id},
+                                     expires_delta=timedelta(minutes=5))
+    yield engine, db, user, token, now
+    composter_index.clear()
+    db.close()
+
+def test_principals_are_cached_by_subject(setup):
+    engine, db, user, token, now = setup
+    queries = count_user_queries(engine)
+    # A dashboard load fans out to several endpoints
+    principals_seen = [auth.get_current_user(db, token) for _ in range(5)]
+    assert len(queries) == 1
+    assert all(p.id == user.id and p.role == "composter" and p.city == "Pune" for p in principals_seen)
+    assert principals.principal_cache.stats()["hits"] == 4
+
+    # Entries expire after the TTL
+    now[0] = 61.0
+    auth.get_current_user(db, token)
+    assert len(queries) == 2
+
+def test_update_and_deactivation_invalidate(setup):
+    engine, db, user, token, now = setup
+    assert auth.get_current_user(db, token).city == "Pune"
+
+    crud.update_user(db, user.id, schemas.UserUpdate(city="Pimpri", latitude=18.62))
+    assert auth.get_current_user(db, token).city == "Pimpri"
+    assert composter_index.position(user.id) == (18.62, 73.85)
+
+    crud.deactivate_user(db, user.id)
+    with pytest.raises(HTTPException) as error:
+        auth.get_current_user(db, token)
+    assert error.value.status_code == 401
+    assert composter_index.position(user.id) is None
+
+def test_profile_and_deactivation_endpoints(setup):
+    """Users update their own profile; only operators deactivate accounts"""
+    engine, db, user, token, now = setup
+    import main
+    routes = {(r.path, method): r for r in main.app.routes if hasattr(r, "methods") for method in r.methods}
+    assert auth.get_current_user in [d.call for d in routes[("/users/me/", "PUT")].dependant.dependencies]
+    deactivate = routes[("/users/{user_id}/deactivate", "PUT")]
+    assert auth.get_current_operator in [d.call for d in deactivate.dependant.dependencies]
+
+    current = auth.get_current_user(db, token)
+    updated = main.update_users_me(schemas.UserUpdate(city="Pimpri"), db=db, current_user=current)
+    assert (updated.id, updated.city, updated.latitude) == (user.id, "Pimpri", 18.52)
+    assert auth.get_current_user(db, token).city == "Pimpri"
+
+    assert main.deactivate_user(user.id, db=db, current_user=current).is_active is False
+    with pytest.raises(HTTPException) as error:
+        main.deactivate_user(user.id + 100, db=db, current_user=current)
+    assert error.value.status_code == 404
+
+def test_unknown_users_and_bad_tokens_are_rejected(setup):
+    engine, db, user, token, now = setup
+    stranger = auth.create_access_token({"sub": "nobody@example.com", "role": "buyer"})
+    for bad in (stranger, token + "x"):
+        with pytest.raises(HTTPException):
+            auth.get_current_user(db, bad)
+
+def test_claims_backed_principals(monkeypatch, setup):
+    engine, db, user, token, now = setup
+    monkeypatch.setattr(auth, "AUTH_CLAIMS_PRINCIPAL", True)
+    queries = count_user_queries(engine)
+    principal = auth.get_current_user(db, token)
+    assert (principal.id, principal.email, principal.role) == (user.id, "composter@example.com", "composter")
+    assert queries == []
+    # Other fields are loaded once, on first use
+    assert principal.latitude == 18.52 and principal.city == "Pune"
+    assert len(queries) == 1
+
+    # Tokens issued before the uid claim was added still work
+    legacy = auth.create_access_token({"sub": user.email, "role": "composter"})
+    assert auth.get_current_user(db, legacy).latitude == 18.52
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,98 @@
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, schemas, crud
+from services.cache import TTLCache
+from services.spatial_index import composter_index
+from services.recommendations import recommendation_cache
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def test_ttl_cache_expiry_and_lru():
+    """Entries expire after their TTL and the least recently used is evicted"""
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1      # "a" is now most recently used
+    cache.set("c", 3)               # evicts "b"
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None   # expired
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["evictions"] == 1
+
+def setup_listing(db):
+    owner = models.User(email="owner@example.com", role="household", is_active=True)
+    composter = models.User(email="composter@example.com", role="composter", is_active=True,
+                            latitude=28.61, longitude=77.21)
+    db.add_all([owner, composter])
+    db.flush()
+    listing = models.WasteListing(title="Kitchen waste", quantity=5.0,
+                                  waste_type=models.WasteType.ORGANIC,
+                                  pickup_location="Delhi", owner_id=owner.id,
+                                  latitude=28.62, longitude=77.22)
+    db.add(listing)
+    db.commit()
+    return composter, listing
+
+def test_recommendations_are_cached_and_invalidated():
+    """Repeated lookups hit the cache until something relevant changes"""
+    db = make_session()
+    composter_index.clear()
+    recommendation_cache.clear()
+    composter, listing = setup_listing(db)
+
+    misses = recommendation_cache.misses
+    first = crud.get_recommended_composters(db, listing.id)
+    second = crud.get_recommended_composters(db, listing.id)
+    assert [c.id for c in first] == [c.id for c in second] == [composter.id]
+    assert recommendation_cache.misses == misses + 1
+
+    # A composter registering far away leaves the cached entry alone
+    crud.create_user(db, schemas.UserCreate(email="far@example.com", password="secret",
+                                            role="composter", latitude=19.07, longitude=72.87))
+    assert len(recommendation_cache) == 1
+
+    # A composter registering nearby invalidates it
+    crud.create_user(db, schemas.UserCreate(email="near@example.com", password="secret",
+                                            role="composter", latitude=28.63, longitude=77.23))
+    assert len(recommendation_cache) == 0
+    assert len(crud.get_recommended_composters(db, listing.id)) == 3
+    assert len(recommendation_cache) == 1
+
+    # Assigning a listing changes the status and the composter's load
+    crud.assign_composter_to_waste_listing(db, listing.id, composter.id)
+    assert len(recommendation_cache) == 0
+
+    composter_index.clear()
+    recommendation_cache.clear()
+    db.close()
+
+def test_internal_stats_are_for_operators_only():
+    import auth, main
+    assert auth.get_current_operator in [dependency.dependency for dependency in main.internal.dependencies]
+    assert "/internal/recommendation-cache" in [route.path for route in main.internal.routes]
+    # No stats endpoint is registered on the app outside the router
+    assert not [route for route in main.app.routes if getattr(route, "path", "").startswith("/internal")]
+
+if __name__ == "__main__":
+    print("Running tests for the recommendation cache...")
+    test_ttl_cache_expiry_and_lru()
+    test_recommendations_are_cached_and_invalidated()
+    test_internal_stats_are_for_operators_only()
+    print("All tests passed!")
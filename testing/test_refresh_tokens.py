@@ -0,0 +1,169 @@
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models, crud, auth
+from services import passwords, principals, revocation
+from services.cache import TTLCache
+from services.revocation import BloomFilter, RevocationIndex
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def count_queries(engine):
+    queries = []
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+    return queries
+
+@pytest.fixture
+def setup(monkeypatch):
+    index = RevocationIndex(capacity=100)
+    monkeypatch.setattr(auth, "SECRET_KEY", "test-secret")
+    monkeypatch.setattr(auth, "revocation_index", index)
+    monkeypatch.setattr(crud, "revocation_index", index)
+    monkeypatch.setattr(principals, "principal_cache", TTLCache(maxsize=100, ttl=60))
+    engine, db = make_session()
+    user = models.User(email="buyer@example.com", role="buyer", is_active=True)
+    db.add(user)
+    db.commit()
+    yield engine, db, user, index
+    db.close()
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(f"token-{i}")
+    assert all(f"token-{i}" in bloom for i in range(10000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 200
+
+def test_index_grows_and_prunes():
+    index = RevocationIndex(capacity=4)
+    now = datetime.utcnow()
+    for i in range(10):
+        index.add(f"jti-{i}", now + timedelta(minutes=1 if i % 2 else -1))
+    assert all(index.is_revoked(f"jti-{i}") for i in range(10))
+    assert not index.is_revoked("jti-x") and not index.is_revoked(None)
+    assert index.stats()["bloom_bits"] > BloomFilter(capacity=4).size
+
+    assert index.prune() == 5
+    assert not index.is_revoked("jti-0") and index.is_revoked("jti-1")
+    assert len(index) == 5
+
+def test_reload_is_incremental(setup):
+    engine, db, user, index = setup
+    now = datetime.utcnow()
+    db.add_all([models.RevokedToken(jti="old", expires_at=now + timedelta(minutes=5),
+                                    revoked_at=now - timedelta(hours=1)),
+                models.RevokedToken(jti="expired", expires_at=now - timedelta(minutes=1),
+                                    revoked_at=now - timedelta(minutes=20))])
+    db.commit()
+    assert index.reload(db) == 1
+    assert index.is_revoked("old") and not index.is_revoked("expired")
+
+    # Revoked by another worker process
+    db.add(models.RevokedToken(jti="new", expires_at=now + timedelta(minutes=5), revoked_at=datetime.utcnow()))
+    db.commit()
+    assert index.reload(db) == 1
+    assert index.is_revoked("new")
+
+def test_revoked_access_tokens_are_rejected_without_a_query(setup):
+    engine, db, user, index = setup
+    token = auth.create_access_token({"sub": user.email, "role": "buyer", "uid": user.id},
+                                     expires_delta=timedelta(minutes=5))
+    assert auth.get_current_user(db, token).id == user.id
+    queries = count_queries(engine)
+    assert auth.get_current_user(db, token).id == user.id
+    assert queries == []
+
+    assert auth.revoke_access_token(db, token)
+    assert db.query(models.RevokedToken).count() == 1
+    del queries[:]
+    with pytest.raises(HTTPException) as error:
+        auth.get_current_user(db, token)
+    assert error.value.status_code == 401
+    assert queries == []
+    # Revoking twice is harmless, and other tokens still work
+    assert auth.revoke_access_token(db, token)
+    other = auth.create_access_token({"sub": user.email, "role": "buyer"})
+    assert auth.get_current_user(db, other).email == user.email
+    assert not auth.revoke_access_token(db, token + "x")
+
+def test_refresh_tokens_rotate(setup):
+    engine, db, user, index = setup
+    first = crud.create_refresh_token(db, user.id)
+    stored = db.query(models.RefreshToken).one()
+    assert stored.token_hash == crud.hash_refresh_token(first) and first not in stored.token_hash
+
+    found, second = crud.rotate_refresh_token(db, first)
+    assert found.id == user.id and second != first
+    found, third = crud.rotate_refresh_token(db, second)
+    assert db.query(models.RefreshToken).count() == 3
+    assert crud.rotate_refresh_token(db, "made-up") is None
+
+    # Replaying a used token revokes the family, including the newest token
+    assert crud.rotate_refresh_token(db, first) is None
+    assert crud.rotate_refresh_token(db, third) is None
+    assert db.query(models.RefreshToken).filter(models.RefreshToken.revoked_at.is_(None)).count() == 0
+
+def test_expired_and_deactivated(setup):
+    engine, db, user, index = setup
+    token = crud.create_refresh_token(db, user.id)
+    db.query(models.RefreshToken).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert crud.rotate_refresh_token(db, token) is None
+
+    token = crud.create_refresh_token(db, user.id)
+    crud.deactivate_user(db, user.id)
+    assert crud.rotate_refresh_token(db, token) is None
+
+def test_deactivated_users_lose_claims_backed_access(monkeypatch, setup):
+    """Claims principals don't load the user, so deactivation goes through the index"""
+    engine, db, user, index = setup
+    monkeypatch.setattr(auth, "AUTH_CLAIMS_PRINCIPAL", True)
+    token = auth.create_access_token({"sub": user.email, "role": user.role, "uid": user.id})
+    assert auth.get_current_user(db, token).id == user.id
+
+    crud.deactivate_user(db, user.id)
+    with pytest.raises(HTTPException) as error:
+        auth.get_current_user(db, token)
+    assert error.value.status_code == 401
+    # Other worker processes pick it up on their next reload
+    other = RevocationIndex(capacity=100)
+    other.reload(db)
+    assert other.is_revoked(revocation.user_key(user.id))
+
+    # And no new tokens are issued to the user
+    user.hashed_password = passwords.build_context("bcrypt", 4).hash("secret")
+    db.commit()
+    assert auth.authenticate_user(db, user.email, "secret") is False
+
+def test_checks_are_constant_time():
+    index = RevocationIndex(capacity=200000)
+    expires = datetime.utcnow() + timedelta(hours=1)
+    index.load((f"revoked-{i}", expires) for i in range(100000))
+    started = time.perf_counter()
+    for i in range(20000):
+        index.is_revoked(f"valid-{i}")
+    assert (time.perf_counter() - started) / 20000 < 0.0001
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -1,10 +1,10 @@
 import sys
 import os
-sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 from sqlalchemy.orm import Session
-from backend.database import SessionLocal, engine
-from backend import models, schemas, crud, auth
+from database import SessionLocal, engine
+import models, schemas, crud, auth
 from datetime import timedelta
 
 # Create tables if they don't exist
@@ -5,11 +5,11 @@ def test_simple_location():
         import os
         
         # Add the backend directory to the Python path
-        sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
         
         # Import required modules
-        from backend.services.location import populate_location_data
-        from backend.services.geocoding import get_coordinates_from_address, reverse_geocode
+        from services.location import populate_location_data
+        from services.geocoding import get_coordinates_from_address, reverse_geocode
         
         # Create a mock object to test with
         class MockObject:
@@ -0,0 +1,115 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the backend and testing directories to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+from services import geocoding
+from services.cache import SingleFlight
+from services.geocoding import GeocodingClient
+from fake_opencage_server import start_server
+
+# Concurrent callers in each stress test
+CALLERS = 64
+
+@pytest.fixture
+def server():
+    # Slow enough that every caller arrives while the first request is in flight
+    server = start_server(latency=0.3)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(monkeypatch, server):
+    client = GeocodingClient(base_url=server.base_url, rate=0, pool_size=CALLERS)
+    monkeypatch.setattr(geocoding, "OPENCAGE_API_KEY", "test-key")
+    monkeypatch.setattr(geocoding, "single_flight", SingleFlight())
+    geocoding.set_client(client)
+    yield client
+    geocoding.set_client(None)
+
+def address_variant(i):
+    # Same normalized address, spelled differently
+    return ["Tower B, Prestige Society, Whitefield", "tower b prestige society  whitefield",
+            "TOWER B, PRESTIGE SOCIETY, WHITEFIELD."][i % 3]
+
+def test_concurrent_threads_make_one_request(server, client):
+    barrier = threading.Barrier(CALLERS)
+
+    def register(i):
+        barrier.wait()
+        return geocoding.geocode(address_variant(i))
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        results = list(executor.map(register, range(CALLERS)))
+    assert server.stats()["requests"] == 1
+    assert len({(r["latitude"], r["longitude"]) for r in results}) == 1
+    assert geocoding.single_flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": CALLERS - 1}
+
+def test_concurrent_tasks_make_one_request(server, client):
+    async def register_all():
+        return await asyncio.gather(*[geocoding.geocode_async(address_variant(i)) for i in range(CALLERS)])
+
+    results = asyncio.run(register_all())
+    assert server.stats()["requests"] == 1
+    assert all(result == results[0] for result in results)
+
+def test_threads_and_tasks_share_a_flight(server, client):
+    async def register_all():
+        return await asyncio.gather(*[geocoding.geocode_async(address_variant(i)) for i in range(CALLERS // 2)])
+
+    with ThreadPoolExecutor(max_workers=CALLERS // 2) as executor:
+        futures = [executor.submit(geocoding.geocode, address_variant(i)) for i in range(CALLERS // 2)]
+        time.sleep(0.05)
+        results = asyncio.run(register_all()) + [future.result() for future in futures]
+    assert server.stats()["requests"] == 1
+    assert all(result == results[0] for result in results)
+
+def test_different_addresses_are_not_coalesced(server, client):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(geocoding.geocode, [f"House {i}, Pune" for i in range(8)]))
+    assert all(result["city"] == "Pune" for result in results)
+    assert server.stats()["requests"] == 8
+
+def test_sequential_calls_are_not_coalesced(server, client):
+    server.latency = 0
+    geocoding.geocode("Pune")
+    geocoding.geocode("Pune")
+    assert server.stats()["requests"] == 2
+
+def test_waiters_share_the_leaders_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    def waiter():
+        started.wait()
+        with pytest.raises(RuntimeError, match="upstream down"):
+            flight.do("key", failing)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        waiters = [executor.submit(waiter) for _ in range(4)]
+        with pytest.raises(RuntimeError):
+            flight.do("key", failing)
+        for future in waiters:
+            future.result()
+    assert len(calls) == 1
+    # The failed flight is not remembered
+    assert flight.do("key", lambda: "ok") == "ok"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,175 @@
+import sys
+import os
+import threading
+import time
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+from services.spatial_index import ComposterGridIndex, composter_index
+from services import matching
+from services.matching import ComposterMatcher
+
+class MockUser:
+    def __init__(self, id, latitude=None, longitude=None, role="composter", is_active=True):
+        self.id = id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.role = role
+        self.is_active = is_active
+
+def make_session():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def test_nearby_returns_closest_rings_first():
+    """Composters in the centre cell come before composters further away"""
+    index = ComposterGridIndex(cell_size_deg=0.1)
+    index.upsert(MockUser(1, 28.61, 77.21))   # Delhi
+    index.upsert(MockUser(2, 28.65, 77.25))   # Delhi, neighbouring cell
+    index.upsert(MockUser(3, 19.07, 72.87))   # Mumbai
+
+    nearby = index.nearby(28.61, 77.21, min_results=1)
+    assert nearby[0] == 1
+    assert 2 in nearby
+    assert 3 not in nearby
+
+    # Asking for more results keeps expanding until Mumbai is reached
+    assert set(index.nearby(28.61, 77.21, min_results=3)) == {1, 2, 3}
+
+def test_upsert_moves_and_drops_users():
+    """Relocating or changing a user updates the index in place"""
+    index = ComposterGridIndex(cell_size_deg=0.1)
+    index.upsert(MockUser(1, 28.61, 77.21))
+    index.upsert(MockUser(1, 19.07, 72.87))
+    assert len(index) == 1
+    assert index.nearby(19.07, 72.87, min_results=1) == [1]
+
+    # Users without coordinates or without the composter role are not indexed
+    index.upsert(MockUser(1))
+    index.upsert(MockUser(2, 28.61, 77.21, role="household"))
+    index.upsert(MockUser(3, 28.61, 77.21, is_active=False))
+    assert len(index) == 0
+    assert index.nearby(28.61, 77.21, min_results=1) == []
+
+def test_matcher_only_loads_nearby_composters():
+    """Recommendations only score composters found around the listing"""
+    db = make_session()
+    composter_index.clear()
+
+    # One composter near the listing and many far away in another city
+    near = models.User(email="near@example.com", role="composter", is_active=True,
+                       latitude=28.61, longitude=77.21, city="Delhi")
+    db.add(near)
+    for i in range(60):
+        db.add(models.User(email=f"far{i}@example.com", role="composter", is_active=True,
+                           latitude=10.0 + (i % 10), longitude=70.0 + (i // 10) * 1.5,
+                           city="Elsewhere"))
+    db.add(models.User(email="unlocated@example.com", role="composter", is_active=True,
+                       city="Delhi"))
+    listing = models.WasteListing(title="Kitchen waste", quantity=5.0,
+                                  waste_type=models.WasteType.ORGANIC,
+                                  pickup_location="Delhi", city="Delhi",
+                                  latitude=28.62, longitude=77.22)
+    db.add(listing)
+    db.commit()
+
+    matcher = ComposterMatcher(db)
+    original_min_candidates = matching.MIN_CANDIDATES
+    matching.MIN_CANDIDATES = 5
+    try:
+        candidates = matcher._get_candidate_composters(listing, limit=1)
+    finally:
+        matching.MIN_CANDIDATES = original_min_candidates
+    emails = {composter.email for composter in candidates}
+    # The nearby composter, composters without coordinates and enough far
+    # composters to fill the candidate pool are considered
+    assert "near@example.com" in emails
+    assert "unlocated@example.com" in emails
+    assert len(candidates) < 20
+
+    recommended = matcher.get_recommended_composters(listing.id, limit=1)
+    assert recommended[0].email == "near@example.com"
+
+    composter_index.clear()
+    db.close()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_stale_index_is_rebuilt_in_the_background(tmp_path):
+    """Lookups keep the old index while a rebuild reads the database"""
+    # A file database, so the rebuild thread gets its own connection
+    engine = create_engine(f"sqlite:///{tmp_path / 'index.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    moved = models.User(email="moved@example.com", role="composter", is_active=True, latitude=28.61, longitude=77.21)
+    db.add(moved)
+    db.commit()
+    index = ComposterGridIndex(cell_size_deg=0.1, refresh_seconds=0)
+    index.ensure_loaded(db)
+    assert len(index) == 1
+
+    # Added by another worker process
+    db.add(models.User(email="new@example.com", role="composter", is_active=True, latitude=19.07, longitude=72.87))
+    db.commit()
+    reading, release = threading.Event(), threading.Event()
+
+    def block_rebuild(conn, cursor, statement, parameters, context, executemany):
+        if threading.current_thread().name == "composter-index-refresh":
+            reading.set()
+            release.wait(5)
+
+    event.listen(engine, "before_cursor_execute", block_rebuild)
+    try:
+        start = time.perf_counter()
+        index.ensure_loaded(db)
+        assert time.perf_counter() - start < 0.1
+        assert reading.wait(5)
+        # The old index still answers, and a move made meanwhile is kept
+        assert index.nearby(28.61, 77.21, min_results=1) == [moved.id]
+        index.upsert(MockUser(moved.id, 12.97, 77.59))
+        release.set()
+        assert wait_for(lambda: not index._refreshing)
+    finally:
+        event.remove(engine, "before_cursor_execute", block_rebuild)
+    assert len(index) == 2
+    assert index.position(moved.id) == (12.97, 77.59)
+    db.close()
+
+def test_start_rebuilds_on_a_background_thread(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'index.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    db.add(models.User(email="a@example.com", role="composter", is_active=True, latitude=28.61, longitude=77.21))
+    db.commit()
+    index = ComposterGridIndex(cell_size_deg=0.1)
+    index.start(engine, interval=0.02)
+    try:
+        assert len(index) == 1
+        db.add(models.User(email="b@example.com", role="composter", is_active=True, latitude=19.07, longitude=72.87))
+        db.commit()
+        assert wait_for(lambda: len(index) == 2)
+    finally:
+        index.stop()
+    db.close()
+
+if __name__ == "__main__":
+    print("Running tests for the composter spatial index...")
+    test_nearby_returns_closest_rings_first()
+    test_upsert_moves_and_drops_users()
+    test_matcher_only_loads_nearby_composters()
+    print("All tests passed!")
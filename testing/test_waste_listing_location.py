@@ -2,14 +2,14 @@ import sys
 import os
 
 # Add the backend directory to the Python path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
 
 def test_waste_listing_with_location():
     """Test waste listing creation with location data population"""
     try:
         # Import required modules
-        from backend import models, schemas, database
-        from backend.crud import create_waste_listing, create_user
+        import models, schemas, database
+        from crud import create_waste_listing, create_user
         import time
         
         # Create a database session